@@ -47,13 +47,12 @@ class Plugin(Plugin_Base):
         self.logger = Fake_Logger() if not logger else logger
         self.doc_src_path = doc_src_path
         self.site_config = site_config
-        self.config = Plugin.defautl_config
+        self.config = copy.deepcopy(Plugin.defautl_config)
         self.config.update(config)
         self.logger.i("-- plugin <{}> init".format(self.name))
         self.logger.i("-- plugin <{}> config: {}".format(self.name, self.config))
         self.module_path = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
         self.assets_abs_path = os.path.join(self.module_path, "assets")
-        self.temp_dir = self.get_temp_dir()
 
         self.header_css = {
             "/static/js/add_hint/style.css": os.path.join(self.assets_abs_path, "style.css")
@@ -71,8 +70,8 @@ class Plugin(Plugin_Base):
             item = '<script src="{}"></script>'.format(url)
             self.html_footer_items.append(item)
         vars = self.config
-        self.header_css = self.update_file_var(self.header_css, vars, self.temp_dir)
-        self.footer_js = self.update_file_var(self.footer_js, vars, self.temp_dir)
+        self.header_css = self.update_file_var(self.header_css, vars)
+        self.footer_js = self.update_file_var(self.footer_js, vars)
         self.files_to_copy = self.footer_js
         self.files_to_copy.update(self.header_css)
 
@@ -1,8 +1,7 @@
 from genericpath import exists
 import os, sys
+import copy
 from os.path import join
-import tempfile
-import shutil
 import json
 try:
     curr_path = os.path.dirname(os.path.abspath(__file__))
@@ -33,7 +32,7 @@ class Plugin(Plugin_Base):
         self.logger = Fake_Logger() if not logger else logger
         self.doc_src_path = doc_src_path
         self.site_config = site_config
-        self.config = Plugin.defautl_config
+        self.config = copy.deepcopy(Plugin.defautl_config)
         # check config
         for key in self.config["env"]:
             if not key in config["env"]:
@@ -85,12 +84,7 @@ class Plugin(Plugin_Base):
             else:
                 self.html_footer_items.append(item)
 
-        self.temp_dir = os.path.join(tempfile.gettempdir(), "teedoc_plugin_assets")
-        if os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
-        os.makedirs(self.temp_dir)
-            
-        self.files_to_copy  = self._update_file_var(self.files_to_copy, self.config["env"], self.temp_dir)
+        self.files_to_copy  = self.update_file_var(self.files_to_copy, self.config["env"])
 
 
     def on_add_html_header_items(self, type_name):
@@ -104,24 +98,6 @@ class Plugin(Plugin_Base):
         self.files_to_copy = {}
         return res
 
-    def on_del(self):
-        if os.path.exists(self.temp_dir):
-            try:
-                shutil.rmtree(self.temp_dir)
-            except Exception:
-                pass
-
-    def _update_file_var(self, files, vars, temp_dir):
-        for url, path in files.items():
-            with open(path, encoding='utf-8') as f:
-                content = f.read()
-                for k, v in vars.items():
-                    content = content.replace("${}{}{}".format("{", k.strip(), "}"), str(v))
-                temp_path = os.path.join(temp_dir, os.path.basename(path))
-                with open(temp_path, "w", encoding='utf-8') as fw:
-                    fw.write(content)
-                files[url] = temp_path
-        return files
 
 if __name__ == "__main__":
     config = {
@@ -1,5 +1,6 @@
 from genericpath import exists
 import os, sys
+import copy
 from os.path import join
 import tempfile
 import shutil
@@ -30,7 +31,7 @@ class Plugin(Plugin_Base):
         self.logger = Fake_Logger() if not logger else logger
         self.doc_src_path = doc_src_path
         self.site_config = site_config
-        self.config = Plugin.defautl_config
+        self.config = copy.deepcopy(Plugin.defautl_config)
         self.config.update(config)
         self.logger.i("-- plugin <{}> init".format(self.name))
         self.logger.i("-- plugin <{}> config: {}".format(self.name, self.config))
@@ -1,5 +1,6 @@
 
 import os, sys
+import copy
 import re
 from collections import OrderedDict
 try:
@@ -14,14 +15,10 @@ from teedoc import Fake_Logger
 import tempfile, shutil, json
 from .version import __version__
 
-import mistune
-mistune_version = mistune.__version__.split(".") # 0.8.4, 2.0.0rc1
-mistune_version = int(mistune_version[0]) * 10 + int(mistune_version[1]) # 8, 20
 local_plugin_path = os.path.join(teedoc_project_path, "plugins", "teedoc-plugin-markdown-parser")
 if os.path.exists(local_plugin_path):
     sys.path.insert(0, local_plugin_path)
 from teedoc.metadata_parser import Metadata_Parser
-from teedoc_plugin_markdown_parser.renderer import create_markdown_parser
 
 
 class Plugin(Plugin_Base):
@@ -40,14 +37,12 @@ class Plugin(Plugin_Base):
         self.logger = Fake_Logger() if not logger else logger
         self.doc_src_path = doc_src_path
         self.site_config = site_config
-        self.config = Plugin.defautl_config
+        self.config = copy.deepcopy(Plugin.defautl_config)
         self.config.update(config)
         self.logger.i("-- plugin <{}> init".format(self.name))
         self.logger.i("-- plugin <{}> config: {}".format(self.name, self.config))
-        self.temp_dir = os.path.join(tempfile.gettempdir(), "teedoc_plugin_blog")
-        if os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
-        os.makedirs(self.temp_dir)
+        # unique dir per process, builds can run at the same time(e.g. sharded build)
+        self.temp_dir = tempfile.mkdtemp(prefix="teedoc_plugin_blog_")
         self.assets_abs_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
         self.assets = {
             "/static/js/plugin_blog/main.js": os.path.join(self.assets_abs_path, "main.js"),
@@ -55,7 +50,7 @@ class Plugin(Plugin_Base):
         vars = {
             "site_root_url": self.site_config["site_root_url"]
         }
-        self.assets = self._update_file_var(self.assets, vars, self.temp_dir)
+        self.assets = self.update_file_var(self.assets, vars)
         self.files_to_copy = self.assets.copy() # must use copy
         blog_url = list(self.site_config["route"]["blog"].keys())
         if len(blog_url) > 1:
@@ -67,11 +62,19 @@ class Plugin(Plugin_Base):
             "items": {}
         }
 
+    def on_del(self):
+        if os.path.exists(self.temp_dir):
+            try:
+                shutil.rmtree(self.temp_dir)
+            except Exception:
+                pass
+
     def on_new_process_init(self):
         '''
             for multiple processing, for below func, will be called in new process,
             every time create a new process, this func will be invoke
         '''
+        from teedoc_plugin_markdown_parser.renderer import create_markdown_parser
         self.md_parser = create_markdown_parser()
         self.meta_parser = Metadata_Parser()
 
@@ -84,68 +87,73 @@ class Plugin(Plugin_Base):
         del self.meta_parser
 
     def on_parse_blog(self, files):
-        # result, format must be this
-        result = {
-            "ok": False,
-            "msg": "",
-            "htmls": OrderedDict()
-        }
         # function parse md file is disabled
         if not "md" in self.config["parse_files"]:
-            result["msg"] = "disabled markdown parse, but only support markdown"
-            return result
+            return {
+                "ok": False,
+                "msg": "disabled markdown parse, but only support markdown",
+                "htmls": OrderedDict()
+            }
+        return self.collect_parse_result(self.iter_parse_blog(files))
+
+    def iter_parse_blog(self, files):
+        # function parse md file is disabled
+        if not "md" in self.config["parse_files"]:
+            raise Exception("plugin <{}> disabled markdown parse, but only support markdown".format(self.name))
         self.logger.d("-- plugin <{}> parse {} files".format(self.name, len(files)))
         # self.logger.d("files: {}".format(files))
-        
+
         for file in files:
             ext = os.path.splitext(file)[1].lower()
             if ext.endswith("md"):
-                with open(file, encoding="utf-8") as f:
-                    content = f.read().strip()
-                    content = self._update_link(content)
-                    blog_index_file_path = os.path.join(self.blog_dir, "readme.md").replace("\\", "/").lower()
-                    is_blog_index = file.lower() == blog_index_file_path
-                    if is_blog_index:
-                        content += '\n<div id="blog_list"></div>'
-                    if not self.multiprocess:
-                        md_parser = create_markdown_parser()
-                        meta_parser = Metadata_Parser()
-                    else:
-                        md_parser = self.md_parser
-                        meta_parser = self.meta_parser
-                    metadata, content_no_meta = meta_parser.parse_meta(content, file)
-                    html = md_parser(content_no_meta)
-                    if "<!-- more -->" in html:
-                        brief = html[:html.find("<!-- more -->")].strip()
-                    else:
-                        brief = html[:500].strip()
-                    parent_url = os.path.dirname(file.replace(self.doc_src_path, ""))
-                    brief = self._update_relative_brief_links(brief, parent_url)
-                    if metadata["cover"]:
-                        metadata["cover"] = self._rel_to_abs_url(metadata["cover"], parent_url)
-                        html = '<div class="blog_cover"><img src="{}" alt="{} cover"></div>'.format(metadata["cover"], metadata["title"]) + html
-                    html_str = '<span id="blog_start"></span>' + html
-                    result["htmls"][file] = {
-                        "title": metadata["title"],
-                        "desc": metadata["desc"],
-                        "keywords": metadata["keywords"],
-                        "tags": metadata["tags"],
-                        "body": html_str,
-                        # "toc": html.toc_html if html.toc_html else "",
-                        "toc": "", # just empty, toc generated by js but not python
-                        "metadata": metadata,
-                        "raw": content,
-                        "date": metadata["date"],
-                        "ts": metadata["ts"],
-                        "author": metadata["author"],
-                        "brief": metadata["brief"],
-                        "cover": metadata["cover"],
-                    }
+                yield file, self._parse_file(file)
             else:
-                result["htmls"][file] = None
-        result['ok'] = True
-        return result
-    
+                yield file, None
+
+    def _parse_file(self, file):
+        with open(file, encoding="utf-8") as f:
+            content = f.read().strip()
+        content = self._update_link(content)
+        blog_index_file_path = os.path.join(self.blog_dir, "readme.md").replace("\\", "/").lower()
+        is_blog_index = file.lower() == blog_index_file_path
+        if is_blog_index:
+            content += '\n<div id="blog_list"></div>'
+        if not self.multiprocess:
+            from teedoc_plugin_markdown_parser.renderer import create_markdown_parser
+            md_parser = create_markdown_parser()
+            meta_parser = Metadata_Parser()
+        else:
+            md_parser = self.md_parser
+            meta_parser = self.meta_parser
+        metadata, content_no_meta = meta_parser.parse_meta(content, file)
+        html = md_parser(content_no_meta)
+        if "<!-- more -->" in html:
+            brief = html[:html.find("<!-- more -->")].strip()
+        else:
+            brief = html[:500].strip()
+        parent_url = os.path.dirname(file.replace(self.doc_src_path, ""))
+        brief = self._update_relative_brief_links(brief, parent_url)
+        if metadata["cover"]:
+            metadata["cover"] = self._rel_to_abs_url(metadata["cover"], parent_url)
+            html = '<div class="blog_cover"><img src="{}" alt="{} cover"></div>'.format(metadata["cover"], metadata["title"]) + html
+        html_str = '<span id="blog_start"></span>' + html
+        return {
+            "title": metadata["title"],
+            "desc": metadata["desc"],
+            "keywords": metadata["keywords"],
+            "tags": metadata["tags"],
+            "body": html_str,
+            # "toc": html.toc_html if html.toc_html else "",
+            "toc": "", # just empty, toc generated by js but not python
+            "metadata": metadata,
+            "raw": content,
+            "date": metadata["date"],
+            "ts": metadata["ts"],
+            "author": metadata["author"],
+            "brief": metadata["brief"],
+            "cover": metadata["cover"],
+        }
+
     def on_add_html_header_items(self, type_name):
         items = []
         items.append('<meta name="blog-generator" content="teedoc-plugin-blog">')
@@ -248,17 +256,6 @@ class Plugin(Plugin_Base):
             html_js_items = ['<script src="{}"></script>'.format(url)]
         return html_js_items
     
-    def _update_file_var(self, files, vars, temp_dir):
-        for url, path in files.items():
-            with open(path, encoding='utf-8') as f:
-                content = f.read()
-                for k, v in vars.items():
-                    content = content.replace("${}{}{}".format("{", k.strip(), "}"), v)
-                temp_path = os.path.join(temp_dir, os.path.basename(path))
-                with open(temp_path, "w", encoding='utf-8') as fw:
-                    fw.write(content)
-                files[url] = temp_path
-        return files
 
     def _update_relative_brief_links(self, brief, parent_url):
         '''
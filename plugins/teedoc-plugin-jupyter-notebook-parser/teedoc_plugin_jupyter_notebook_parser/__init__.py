@@ -1,4 +1,5 @@
 import os, sys
+import copy
 import re
 from collections import OrderedDict
 import datetime
@@ -12,6 +13,7 @@ except Exception:
     pass
 from teedoc import Plugin_Base
 from teedoc import Fake_Logger
+from teedoc.utils import date_to_timestamp, get_source_date_epoch
 from .version import __version__
 try:
     from .jupyter_convert import convert_ipynb_to_html
@@ -34,23 +36,30 @@ class Plugin(Plugin_Base):
         self.logger = Fake_Logger() if not logger else logger
         self.doc_src_path = doc_src_path
         self.site_config = site_config
-        self.config = Plugin.defautl_config
+        self.config = copy.deepcopy(Plugin.defautl_config)
         self.config.update(config)
         self.logger.i("-- plugin <{}> init".format(self.name))
         self.logger.i("-- plugin <{}> config: {}".format(self.name, self.config))
 
     def on_parse_files(self, files):
-        # result, format must be this
-        result = {
-            "ok": False,
-            "msg": "",
-            "htmls": OrderedDict(),
-            "drafts": []
-        }
         # function parse md file is disabled
         if not "ipynb" in self.config["parse_files"]:
-            result["msg"] = "disabled notebook parse, but only support notebook"
-            return result
+            return {
+                "ok": False,
+                "msg": "disabled notebook parse, but only support notebook",
+                "htmls": OrderedDict(),
+                "drafts": []
+            }
+        return self.collect_parse_result(self.iter_parse_files(files))
+
+    def on_parse_pages(self, files):
+        result = self.on_parse_files(files)
+        return result
+
+    def iter_parse_files(self, files):
+        # function parse md file is disabled
+        if not "ipynb" in self.config["parse_files"]:
+            raise Exception("plugin <{}> disabled notebook parse, but only support notebook".format(self.name))
         self.logger.d("-- plugin <{}> parse {} files".format(self.name, len(files)))
         # self.logger.d("files: {}".format(files))
 
@@ -58,51 +67,51 @@ class Plugin(Plugin_Base):
             name = os.path.basename(file)
             # ignore temp file
             if name.startswith(".~"):
-                result["htmls"][file] = None
+                yield file, None
                 continue
             ext = os.path.splitext(file)[1].lower()
             if ext.endswith("ipynb"):
-                html = convert_ipynb_to_html(file)
-                html.body = self._update_link_html(html.body)
-                metadata = html.metadata
-                if metadata.get("draft", False):
-                    result["drafts"].append(file)
-                    continue
-                author = metadata.get("author", "")
-                date = None
-                ts = None
-                if "date" in metadata and (type(metadata["date"]) == datetime.datetime or type(metadata["date"]) == datetime.date):
-                    date = metadata["date"]
-                    if type(date) == datetime.date:
-                        ts = int(time.mktime(date.timetuple()))
-                    else:
-                        ts = int(date.timestamp())
-                else:
-                    date = metadata.get("date")
-                    ts = int(os.stat(file).st_mtime)
-                result["htmls"][file] = {
-                    "title": html.title,
-                    "desc": html.desc,
-                    "keywords": html.keywords,
-                    "tags": html.tags,
-                    "body": html.body,
-                    "author": author,
-                    "date": date,
-                    "ts": ts,
-                    "toc": html.toc,
-                    "metadata": metadata,
-                    "raw": html.raw
-                }
+                yield file, self._parse_file(file)
             else:
-                result["htmls"][file] = None
-        result['ok'] = True
-        return result
-    
-    def on_parse_pages(self, files):
-        result = self.on_parse_files(files)
-        return result
+                yield file, None
+
+    def iter_parse_pages(self, files):
+        yield from self.iter_parse_files(files)
+
+    def _parse_file(self, file):
+        '''
+            @return html item dict, or False if file is draft
+        '''
+        html = convert_ipynb_to_html(file)
+        html.body = self._update_link_html(html.body)
+        metadata = html.metadata
+        if metadata.get("draft", False):
+            return False
+        author = metadata.get("author", "")
+        date = None
+        ts = None
+        if "date" in metadata and (type(metadata["date"]) == datetime.datetime or type(metadata["date"]) == datetime.date):
+            date = metadata["date"]
+            ts = date_to_timestamp(date)
+        else:
+            # reproducible build use SOURCE_DATE_EPOCH instead of file modify time
+            date = metadata.get("date")
+            epoch = get_source_date_epoch()
+            ts = epoch if epoch is not None else int(os.stat(file).st_mtime)
+        return {
+            "title": html.title,
+            "desc": html.desc,
+            "keywords": html.keywords,
+            "tags": html.tags,
+            "body": html.body,
+            "author": author,
+            "date": date,
+            "ts": ts,
+            "toc": html.toc,
+            "metadata": metadata,
+            "raw": html.raw
+        }
 
-    
     def on_add_html_header_items(self, type_name):
         items = []
         items.append('<meta name="html-generator" content="teedoc-plugin-jupyter-notebook-parser">')
@@ -1,8 +1,5 @@
 
 
-from nbconvert.exporters.templateexporter import TemplateExporter
-from nbconvert import HTMLExporter
-import nbformat
 import re
 import os
 import yaml
@@ -12,17 +9,28 @@ from teedoc.metadata_parser import Metadata_Parser
 curr_dir = os.path.dirname(os.path.abspath(__file__))
 templates_dir = os.path.join(curr_dir, "templates")
 
-TemplateExporter.extra_template_basedirs=[templates_dir]
-html_exporter = HTMLExporter()
-html_exporter.template_name = "lab"
-html_exporter.template_file = 'base.html.j2'
-html_exporter.anchor_link_text = " " # set anchor_link empty
+html_exporter = None
 
-def convert_ipynb_to_html_body(path):
+def get_html_exporter():
+    '''
+        nbconvert is slow to import and create exporter, only create when convert the first notebook
+    '''
     global html_exporter
+    if not html_exporter:
+        from nbconvert.exporters.templateexporter import TemplateExporter
+        from nbconvert import HTMLExporter
+        TemplateExporter.extra_template_basedirs=[templates_dir]
+        html_exporter = HTMLExporter()
+        html_exporter.template_name = "lab"
+        html_exporter.template_file = 'base.html.j2'
+        html_exporter.anchor_link_text = " " # set anchor_link empty
+    return html_exporter
+
+def convert_ipynb_to_html_body(path):
+    import nbformat
     with open(path, encoding="utf-8") as f:
         content = nbformat.read(f, as_version=4)
-        body, resources = html_exporter.from_notebook_node(content)
+        body, resources = get_html_exporter().from_notebook_node(content)
         return body
 
 class HTML:
@@ -66,7 +74,7 @@ def get_search_content(cells):
 
 
 def convert_ipynb_to_html(path):
-    global html_exporter
+    import nbformat
     html = HTML()
     with open(path, encoding="utf-8") as f:
         content = nbformat.read(f, as_version=4)
@@ -79,7 +87,7 @@ def convert_ipynb_to_html(path):
         html.keywords = html.metadata["keywords"]
         html.desc = html.metadata.get("desc", "")
         html.tags = html.metadata["tags"]
-        body, resources = html_exporter.from_notebook_node(content)
+        body, resources = get_html_exporter().from_notebook_node(content)
         html.raw = get_search_content(content.cells)
         html.body = body
     return html
@@ -88,6 +96,9 @@ if __name__ == "__main__":
     import sys
     notebook = "e:/main/projects/teedoc/examples/local_test/docs/get_started/zh/syntax/syntax_notebook.ipynb"
     # notebook = sys.argv[1]
+    import nbformat
+    from nbconvert.exporters.templateexporter import TemplateExporter
+    from nbconvert import HTMLExporter
     TemplateExporter.extra_template_basedirs=[templates_dir]
     html_exporter = HTMLExporter()
     # print(html_exporter.template_name)
@@ -1,4 +1,5 @@
 import os, sys, re
+import copy
 from collections import OrderedDict
 import datetime
 import json
@@ -12,7 +13,6 @@ except Exception:
 from teedoc import Plugin_Base
 from teedoc import Fake_Logger
 from .version import __version__
-import tempfile
 
 
 class Plugin(Plugin_Base):
@@ -26,6 +26,9 @@ class Plugin(Plugin_Base):
         "mathjax": {
             "enable": True,
             "file_name": "tex-mml-chtml", # http://docs.mathjax.org/en/latest/web/components/index.html
+            "cdn_url": "https://cdn.jsdelivr.net/npm/mathjax@3/es5/",
+            # npm package for `teedoc vendor`, self-hosted MathJax used after vendored
+            "vendor_url": "https://registry.npmjs.org/mathjax/-/mathjax-3.2.2.tgz",
             "config": {
                 "loader": {
                     "load": ['output/svg']
@@ -49,7 +52,7 @@ class Plugin(Plugin_Base):
         self.logger = Fake_Logger() if not logger else logger
         self.doc_src_path = doc_src_path
         self.site_config = site_config
-        self.config = Plugin.defautl_config
+        self.config = copy.deepcopy(Plugin.defautl_config)
         mathjax_config = self.config["mathjax"]
         if "mathjax" in config:
             for k,v in config["mathjax"].items():
@@ -68,8 +71,52 @@ class Plugin(Plugin_Base):
             self.Meta_Parser = Metadata_Parser
         self.assets_abs_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
         self.files_to_copy = {}
+        self.mermaid_url = None
         if self.config["mermaid"]:
-            self.files_to_copy[f'{self.name}/mermaid.min.js'] = os.path.join(self.assets_abs_path, "mermaid.min.js")
+            if self.config["mermaid_use_cdn"]:
+                self.mermaid_url = self.config["mermaid_cdn_url"]
+                vendored = self.get_vendor_files("mermaid")
+                if vendored:
+                    self.mermaid_url = self._copy_vendor_files("mermaid", vendored)[0]
+            else:
+                self.files_to_copy[f'{self.name}/mermaid.min.js'] = os.path.join(self.assets_abs_path, "mermaid.min.js")
+                self.mermaid_url = f'/{self.name}/mermaid.min.js'
+        self.mathjax_url = None
+        if self.config["mathjax"]["enable"]:
+            js_name = "{}.js".format(self.config["mathjax"]["file_name"])
+            self.mathjax_url = self.config["mathjax"]["cdn_url"] + js_name
+            vendored = self.get_vendor_files("mathjax")
+            if vendored and js_name in vendored:
+                self._copy_vendor_files("mathjax", vendored)
+                self.mathjax_url = f'/{self.name}/mathjax/{js_name}'
+            else:
+                self.logger.d("-- plugin <{}> use MathJax from CDN, run `teedoc vendor` to use self-hosted copy".format(self.name))
+
+    def _copy_vendor_files(self, name, files):
+        '''
+            @return list, urls of files
+        '''
+        urls = []
+        for rel, path in files.items():
+            self.files_to_copy[f'{self.name}/{name}/{rel}'] = path
+            urls.append(f'/{self.name}/{name}/{rel}')
+        return urls
+
+    def on_vendor_assets(self):
+        assets = []
+        if self.config["mathjax"]["enable"]:
+            # all of es5 dir, components autoload tex extensions(e.g. mhchem for \ce), sre and fonts on demand
+            assets.append({
+                "name": "mathjax",
+                "url": self.config["mathjax"]["vendor_url"],
+                "extract": "package/es5"
+            })
+        if self.config["mermaid"] and self.config["mermaid_use_cdn"]:
+            assets.append({
+                "name": "mermaid",
+                "url": self.config["mermaid_cdn_url"]
+            })
+        return assets
 
     def on_new_process_init(self):
         '''
@@ -91,68 +138,76 @@ class Plugin(Plugin_Base):
         del self.meta_parser
 
     def on_parse_files(self, files):
-        # result, format must be this
-        result = {
-            "ok": False,
-            "msg": "",
-            "htmls": OrderedDict(),
-            "drafts": []
-        }
         # function parse md file is disabled
         if not "md" in self.config["parse_files"]:
-            result["msg"] = "disabled markdown parse, but only support markdown"
-            return result
+            return {
+                "ok": False,
+                "msg": "disabled markdown parse, but only support markdown",
+                "htmls": OrderedDict(),
+                "drafts": []
+            }
+        return self.collect_parse_result(self.iter_parse_files(files))
+
+    def on_parse_pages(self, files):
+        result = self.on_parse_files(files)
+        return result
+
+    def iter_parse_files(self, files):
+        # function parse md file is disabled
+        if not "md" in self.config["parse_files"]:
+            raise Exception("plugin <{}> disabled markdown parse, but only support markdown".format(self.name))
         self.logger.d("-- plugin <{}> parse {} files".format(self.name, len(files)))
         # self.logger.d("files: {}".format(files))
 
         for file in files:
             ext = os.path.splitext(file)[1].lower()
             if ext.endswith("md"):
-                with open(file, encoding="utf-8") as f:
-                    content = f.read().strip()
-                    try:
-                        content = self._update_link(content)
-                    except Exception as e:
-                        raise Exception("parse file {} error: {}".format(file, e))
-                    try:
-                        if not self.multiprocess:
-                            md_parser = self.create_markdown_parser()
-                            meta_parser = self.Meta_Parser()
-                        else:
-                            md_parser = self.md_parser
-                            meta_parser = self.meta_parser
-                        metadata, content_no_meta = meta_parser.parse_meta(content, file)
-                        if metadata.get("draft", False):
-                            result["drafts"].append(file)
-                            continue
-                        html = md_parser(content_no_meta)
-                    except Exception as e:
-                        self.logger.w("parse markdown file {} fail, please check markdown content format".format(file))
-                        raise e
-                    result["htmls"][file] = {
-                        "title": metadata["title"],
-                        "desc": metadata["desc"],
-                        "keywords": metadata["keywords"],
-                        "tags": metadata["tags"],
-                        "body": html,
-                        "date": metadata["date"],
-                        "ts": metadata["ts"],
-                        "author": metadata["author"],
-                        # "toc": html.toc_html if html.toc_html else "",
-                        "toc": "", # just empty, toc generated by js but not python
-                        "metadata": metadata,
-                        "raw": content
-                    }
+                yield file, self._parse_file(file)
             else:
-                result["htmls"][file] = None
-        result['ok'] = True
-        return result
-    
-    def on_parse_pages(self, files):
-        result = self.on_parse_files(files)
-        return result
+                yield file, None
+
+    def iter_parse_pages(self, files):
+        yield from self.iter_parse_files(files)
+
+    def _parse_file(self, file):
+        '''
+            @return html item dict, or False if file is draft
+        '''
+        with open(file, encoding="utf-8") as f:
+            content = f.read().strip()
+        try:
+            content = self._update_link(content)
+        except Exception as e:
+            raise Exception("parse file {} error: {}".format(file, e))
+        try:
+            if not self.multiprocess:
+                md_parser = self.create_markdown_parser()
+                meta_parser = self.Meta_Parser()
+            else:
+                md_parser = self.md_parser
+                meta_parser = self.meta_parser
+            metadata, content_no_meta = meta_parser.parse_meta(content, file)
+            if metadata.get("draft", False):
+                return False
+            html = md_parser(content_no_meta)
+        except Exception as e:
+            self.logger.w("parse markdown file {} fail, please check markdown content format".format(file))
+            raise e
+        return {
+            "title": metadata["title"],
+            "desc": metadata["desc"],
+            "keywords": metadata["keywords"],
+            "tags": metadata["tags"],
+            "body": html,
+            "date": metadata["date"],
+            "ts": metadata["ts"],
+            "author": metadata["author"],
+            # "toc": html.toc_html if html.toc_html else "",
+            "toc": "", # just empty, toc generated by js but not python
+            "metadata": metadata,
+            "raw": content
+        }
 
-    
     def on_add_html_header_items(self, type_name):
         items = []
         items.append('<meta name="markdown-generator" content="teedoc-plugin-markdown-parser">')
@@ -160,29 +215,14 @@ class Plugin(Plugin_Base):
             items.append('''<script>
 MathJax = {};
 </script>'''.format(json.dumps(self.config["mathjax"]["config"])))
-            temp_dir = os.path.join(tempfile.gettempdir(), "teedoc_plugin_markdown_parser")
-            os.makedirs(temp_dir, exist_ok=True)
-            mathjax_js = os.path.join(temp_dir, f'{self.config["mathjax"]["file_name"]}.js')
             # items.append('<script src="https://polyfill.io/v3/polyfill.min.js?features=es6"></script>') # this feature will make page load slowly because bad network in China
-            items.append('<script id="MathJax-script" async src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/{}.js"></script>'.format(self.config["mathjax"]["file_name"]))
-            # url = 'https://cdn.jsdelivr.net/npm/mathjax@3/es5/{}.js'.format(self.config["mathjax"]["file_name"])
-            # self.logger.i("Download file", url, "to", mathjax_js)
-            # if not os.path.exists(mathjax_js):
-            #     utils.download_file(url, mathjax_js)
-            # item = {
-            #     "path": mathjax_js,
-            #     "options": ["async", 'id="MathJax-script"']
-            # }
-            # items.append(item)
+            items.append('<script id="MathJax-script" async src="{}"></script>'.format(self.mathjax_url))
         return items
 
     def on_add_html_footer_js_items(self, type_name):
         items = []
         if self.config["mermaid"]:
-            if self.config["mermaid_use_cdn"]:
-                items.append(f'<script src="{self.config["mermaid_cdn_url"]}"></script>')
-            else:
-                items.append(f'<script src="/{self.name}/mermaid.min.js"></script>')
+            items.append(f'<script src="{self.mermaid_url}"></script>')
             items.append('<script>mermaid.initialize({startOnLoad:true});</script>')
         return items
 
@@ -52,7 +52,7 @@ class Plugin(Plugin_Base):
         self.logger = Fake_Logger() if not logger else logger
         self.doc_src_path = doc_src_path
         self.site_config = site_config
-        self.config = Plugin.defautl_config
+        self.config = copy.deepcopy(Plugin.defautl_config)
         self.config.update(config)
         self.logger.i("-- plugin <{}> init".format(self.name))
         self.logger.i("-- plugin <{}> config: {}".format(self.name, self.config))
@@ -64,10 +64,8 @@ class Plugin(Plugin_Base):
             self.content_from = "body"
         self.module_path = os.path.abspath(os.path.dirname(os.path.abspath(__file__)))
         self.assets_abs_path = os.path.join(self.module_path, "assets")
-        self.temp_dir = os.path.join(tempfile.gettempdir(), "teedoc_plugin_search")
-        if os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
-        os.makedirs(self.temp_dir)
+        # unique dir per process, builds can run at the same time(e.g. sharded build)
+        self.temp_dir = tempfile.mkdtemp(prefix="teedoc_plugin_search_")
 
         self.css = {
             "/static/css/search/style.css": os.path.join(self.assets_abs_path, "style.css"),
@@ -88,8 +86,8 @@ class Plugin(Plugin_Base):
         self.config['env']["site_root_url"] = self.site_config["site_root_url"]
         # replace variable in css with value
         vars = self.config["env"]
-        self.css       = self._update_file_var(self.css, vars, self.temp_dir)
-        self.footer_js = self._update_file_var(self.footer_js, vars, self.temp_dir)
+        self.css       = self.update_file_var(self.css, vars)
+        self.footer_js = self.update_file_var(self.footer_js, vars)
         # files to copy
         self.html_header_items = self._generate_html_header_items()
         self.files_to_copy = {}
@@ -126,17 +124,6 @@ class Plugin(Plugin_Base):
             items.append(item)
         return items
 
-    def _update_file_var(self, files, vars, temp_dir):
-        for url, path in files.items():
-            with open(path, encoding='utf-8') as f:
-                content = f.read()
-                for k, v in vars.items():
-                    content = content.replace("${}{}{}".format("{", k.strip(), "}"), v)
-                temp_path = os.path.join(temp_dir, os.path.basename(path))
-                with open(temp_path, "w", encoding='utf-8') as fw:
-                    fw.write(content)
-                files[url] = temp_path
-        return files
 
     def _get_conf(self, config, new_config, conf_name):
         if conf_name in new_config:
@@ -1,7 +1,6 @@
 from genericpath import exists
 import os, sys
-import tempfile
-import shutil
+import copy
 try:
     curr_path = os.path.dirname(os.path.abspath(__file__))
     teedoc_project_path = os.path.abspath(os.path.join(curr_path, "..", "..", ".."))
@@ -40,7 +39,7 @@ class Plugin(Plugin_Base):
         self.logger = Fake_Logger() if not logger else logger
         self.doc_src_path = doc_src_path
         self.site_config = site_config
-        self.config = Plugin.defautl_config
+        self.config = copy.deepcopy(Plugin.defautl_config)
         env = self.config["env"]
         if "env" in config:
             env.update(config["env"])
@@ -123,16 +122,12 @@ class Plugin(Plugin_Base):
         self.config['env']["site_root_url"] = self.site_config["site_root_url"]
         # replace variable in css with value
         vars = self.config["env"]
-        self.temp_dir = os.path.join(tempfile.gettempdir(), "teedoc_plugin_theme_default")
-        if os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
-        os.makedirs(self.temp_dir)
-        self.dark_css  = self._update_file_var(self.dark_css, vars, self.temp_dir)
-        self.light_css = self._update_file_var(self.light_css, vars, self.temp_dir)
-        self.css       = self._update_file_var(self.css, vars, self.temp_dir)
-        self.high_priority_js = self._update_file_var(self.high_priority_js, vars, self.temp_dir)
-        self.header_js = self._update_file_var(self.header_js, vars, self.temp_dir)
-        self.footer_js = self._update_file_var(self.footer_js, vars, self.temp_dir)
+        self.dark_css  = self.update_file_var(self.dark_css, vars)
+        self.light_css = self.update_file_var(self.light_css, vars)
+        self.css       = self.update_file_var(self.css, vars)
+        self.high_priority_js = self.update_file_var(self.high_priority_js, vars)
+        self.header_js = self.update_file_var(self.header_js, vars)
+        self.footer_js = self.update_file_var(self.footer_js, vars)
         # files to copy
         self.html_header_items = self._generate_html_header_items()
         self.files_to_copy = {}
@@ -163,13 +158,6 @@ class Plugin(Plugin_Base):
             assets[f'{to_url}/{name}'] = os.path.join(from_dir, name)
         return assets
 
-    def on_del(self):
-        if os.path.exists(self.temp_dir):
-            try:
-                shutil.rmtree(self.temp_dir)
-            except Exception:
-                pass
-
     def on_html_template(self, type_name):
         if type_name == "doc":
             return os.path.join(curr_path, "templates", "article.html")
@@ -228,17 +216,6 @@ class Plugin(Plugin_Base):
             items.append(item)
         return items
 
-    def _update_file_var(self, files, vars, temp_dir):
-        for url, path in files.items():
-            with open(path, encoding='utf-8') as f:
-                content = f.read()
-                for k, v in vars.items():
-                    content = content.replace("${}{}{}".format("{", k.strip(), "}"), str(v))
-                temp_path = os.path.join(temp_dir, os.path.basename(path))
-                with open(temp_path, "w", encoding='utf-8') as fw:
-                    fw.write(content)
-                files[url] = temp_path
-        return files
 
 
     def on_add_html_header_items(self, type_name):
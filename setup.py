@@ -121,6 +121,7 @@ setup(
     extras_require={
         # 'dev': ['check-manifest'],
         # 'test': ['coverage'],
+        'zstd': ['zstandard'],  # for `teedoc build --store tar.zst`
     },
 
     # You can just specify the packages manually here if your project is
@@ -0,0 +1,92 @@
+'''
+    jinja2 extension to cache rendered template fragments, parts of page like header items, navbar, footer
+    are the same for all pages of one doc, render them once and reuse, e.g.
+
+        {% cache "navbar" %}
+        <div id="navbar">{{ navbar_main|safe }}</div>
+        {% endcache %}
+
+    cache key is the fragment name, compiled code and values of all variables used in the fragment, so a fragment
+    that use per page variables is rendered again when values change, output is always the same as no cache.
+    cache is per jinja2 environment, so per template and locale.
+    render with `__fragment_cache_off=True` var to disable cache, used to check cache correctness.
+'''
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from jinja2.runtime import Undefined
+
+MAX_ITEMS = 512
+
+
+class _Unfreezable(Exception):
+    pass
+
+def _freeze(value):
+    '''
+        convert value to hashable key, hashable objects(e.g. gettext function) are used directly and kept alive by key,
+        raise _Unfreezable for other objects, id of them may be reused after freed, fragment is not cached
+    '''
+    if isinstance(value, str) or value is None or isinstance(value, (int, float, bool)):
+        return value
+    if isinstance(value, Undefined):
+        return Undefined
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_freeze(v) for v in value))
+    if isinstance(value, dict):
+        return (dict, tuple((k, _freeze(v)) for k, v in value.items()))
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        raise _Unfreezable()
+
+
+class Fragment_Cache(Extension):
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache = {}, fragment_cache_stats = {"hits": 0, "misses": 0})
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = parser.parse_expression()
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        # variables used in fragment but not assigned in it(loop targets, set)
+        stored = set()
+        loaded = set()
+        for node in body:
+            for n in node.find_all(nodes.Name):
+                if n.ctx == "load":
+                    loaded.add(n.name)
+                else:
+                    stored.add(n.name)
+        names = sorted(loaded - stored)
+        args = [
+            nodes.ContextReference(),
+            name,
+            nodes.List([nodes.Name(n, "load") for n in names])
+        ]
+        return nodes.CallBlock(self.call_method("_render_fragment", args), [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, context, name, values, caller):
+        if context.get("__fragment_cache_off"):
+            return caller()
+        cache = self.environment.fragment_cache
+        stats = self.environment.fragment_cache_stats
+        # code changes when template file changed and compiled again
+        try:
+            key = (name, caller._func.__code__, _freeze(values))
+        except _Unfreezable:
+            return caller()
+        html = cache.get(key)
+        if html is not None:
+            stats["hits"] += 1
+            return html
+        stats["misses"] += 1
+        html = caller()
+        if len(cache) >= MAX_ITEMS:
+            cache.clear()
+        cache[key] = html
+        return html
@@ -1,8 +1,13 @@
 import re
 import os
-import html2text
+
+try:
+    from .utils import get_source_date_epoch
+except Exception:
+    from utils import get_source_date_epoch
 
 def extract_content_from_html(html):
+    import html2text
     return html2text.html2text(html)
 
 def generate_html_item_from_html_file(html_path):
@@ -13,6 +18,8 @@ def generate_html_item_from_html_file(html_path):
         match = re.findall(r"<h1.*?>(.*?)</h1>", html)
         if len(match) > 0:
             title = match[0]
+        # reproducible build use SOURCE_DATE_EPOCH instead of file modify time
+        epoch = get_source_date_epoch()
         return {
             "title": title,
             "desc": "",
@@ -20,7 +27,7 @@ def generate_html_item_from_html_file(html_path):
             "tags": [],
             "body": html,
             "date": None,
-            "ts": int(os.stat(html_path).st_mtime),
+            "ts": int(os.stat(html_path).st_mtime) if epoch is None else epoch,
             "author": None,
             "toc": "",
             "metadata": {},
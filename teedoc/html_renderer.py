@@ -1,6 +1,4 @@
-from jinja2 import Environment, FileSystemLoader
 import os
-from babel.support import Translations, NullTranslations
 import datetime
 import json
 
@@ -22,11 +20,25 @@ def to_json_support_datetime(value, format="%Y-%m-%d", format_datetime = "%Y-%m-
     return json.dumps(update_datetime(value), ensure_ascii=False)
 
 class Renderer:
+    # render every page again without fragment cache and compare, set by `teedoc build --check-fragments`
+    check_fragments = False
+    # pages with body larger than this(bytes) are rendered as stream and written to file chunk by chunk,
+    # 0 means never, set by `teedoc build --stream-render-size`
+    stream_size = 1024 * 1024
+
     def __init__(self, template_name, search_paths, log, html_templates_i18n_dirs = [], locale = None):
         '''
             @template_name e.g. "base.html"
             @search_paths list type, start elements has high priority
         '''
+        # import here to make teedoc startup fast, Renderer objects are cached when build
+        from jinja2 import Environment, FileSystemLoader
+        from babel.support import Translations, NullTranslations
+        try:
+            from .fragment_cache import Fragment_Cache
+        except Exception:
+            from fragment_cache import Fragment_Cache
+
         self.log = log
         self.env = None
         if html_templates_i18n_dirs:
@@ -39,24 +51,56 @@ class Renderer:
                     if type(translations) != NullTranslations:
                         translations_merge.merge(translations)
             self.env = Environment(
-                extensions=['jinja2.ext.i18n'],
+                extensions=['jinja2.ext.i18n', Fragment_Cache],
                 loader=FileSystemLoader(search_paths)
             )
             self.env.filters["tojson2"] = to_json_support_datetime
             self.env.install_gettext_translations(translations_merge)
         if not self.env:
             self.env = Environment(
+                    extensions=[Fragment_Cache],
                     loader=FileSystemLoader(search_paths)
                 )
         self.template = template_name
 
+    def load(self):
+        '''
+            compile template now, compiled template is cached in jinja2 environment,
+            so renderer created in main process can be used by sub processes without compile again
+        '''
+        try:
+            self.env.get_template(self.template)
+        except Exception as e:
+            self.log.e("load template {} fail".format(self.template))
+            raise e
+        return self
+
     def render(self, **kw_args):
         try:
             template = self.env.get_template(self.template)
             html = template.render(**kw_args)
+            if self.check_fragments:
+                full = template.render(__fragment_cache_off = True, **kw_args)
+                if full != html:
+                    i = next((i for i, (a, b) in enumerate(zip(html, full)) if a != b), min(len(html), len(full)))
+                    raise Exception("fragment cache output differ from full render at {}:\n{}\n-----\n{}".format(i, html[i-100:i+200], full[i-100:i+200]))
         except Exception as e:
             self.log.e("render with template {} fail".format(self.template))
             raise e
         return html
 
+    def generate(self, **kw_args):
+        '''
+            render to iterator of str chunks, for large pages, chunks are written to file directly
+            and never joined to one string
+        '''
+        if self.check_fragments:
+            return iter([self.render(**kw_args)])
+        try:
+            template = self.env.get_template(self.template)
+        except Exception as e:
+            self.log.e("render with template {} fail".format(self.template))
+            raise e
+        return template.generate(**kw_args)
+
 
@@ -2,11 +2,22 @@
 import os
 from flask import Flask, send_file, Response, request
 import logging
+try:
+    from .out_store import Archive_Reader, guess_mimetype
+except Exception:
+    from out_store import Archive_Reader, guess_mimetype
 
 
 class HTTP_Server:
-    def __init__(self, host, port, serve_dir, visit_callback=lambda x:None):
-        self.app = Flask("teedoc", static_folder=os.path.join(serve_dir, "static"))
+    def __init__(self, host, port, serve_dir, visit_callback=lambda x:None, overlay = None):
+        '''
+            @serve_dir out dir, or archive file(zip, tar, tar.gz, tar.zst) of out store
+            @overlay Overlay object, find files in source dirs first, then out dir
+        '''
+        # archive file, read files from archive, all files include static files are served by view_root
+        self.archive = Archive_Reader(serve_dir) if os.path.isfile(serve_dir) else None
+        self.overlay = overlay
+        self.app = Flask("teedoc", static_folder=None if (self.archive or overlay) else os.path.join(serve_dir, "static"))
         self.host = host
         self.port = port
         self.root = serve_dir
@@ -27,9 +38,19 @@ class HTTP_Server:
             path = f'{path}index.html'
         if path.startswith("/"):
             path = path[1:]
+        if self.archive:
+            return self.view_archive(path)
+        if self.overlay:
+            src = self.overlay.find(path)
+            if src:
+                return send_file(src)
         path = os.path.abspath(os.path.join(self.root, path)).replace("\\", "/")
         if not path.startswith(self.root):
             return Response(status=403)
+        if not os.path.exists(path) and self.overlay:
+            src = self.overlay.find_in_dirs(path[len(self.root) + 1:])
+            if src:
+                return send_file(src)
         if not os.path.exists(path):
             if not path.endswith(".html"):
                 path = path + ".html"
@@ -44,6 +65,15 @@ class HTTP_Server:
                 return Response(content_404, status=404)
         return send_file(path)
 
+    def view_archive(self, path):
+        if not self.archive.exists(path):
+            if not path.endswith(".html"):
+                path = path + ".html"
+            if not self.archive.exists(path):
+                content_404 = self.archive.open("404.html").read() if self.archive.exists("404.html") else ""
+                return Response(content_404, status=404)
+        return send_file(self.archive.open(path), mimetype=guess_mimetype(path), download_name=os.path.basename(path))
+
     def run(self):
         self.app.run(host=self.host, port=self.port, debug=False)
 
@@ -0,0 +1,201 @@
+'''
+    install plugins of site_config, check installed plugins' version by importlib.metadata first,
+    only plugins not installed or version not match are installed, by one pip command.
+    plugin from:
+        pypi:       "from": "pypi", optional "version": "1.2.0", match if installed version is the same(or installed if no version)
+        local dir:  `--search-dir` found plugin, always installed again, source may changed without version change
+        git or svn: "from": "git+https://github.com/xxx/xxx.git@v1.0", match if installed from the same url and ref,
+                    installed not editable so pip records url and ref in direct_url.json, plugins installed from
+                    `--wheel-dir` have no direct_url.json, url is recorded to `.teedoc_cache/installed_plugins.json`
+    `--find-links` and `--offline` use local wheels dir, `--wheel-dir` download or build wheels to dir once,
+    then always install from it, useful for CI cache
+'''
+
+import os
+import re
+import sys
+import json
+import subprocess
+from importlib import metadata, invalidate_caches
+
+try:
+    from .utils import find_plugin_in_dir
+except Exception:
+    from utils import find_plugin_in_dir
+
+
+INSTALLED_RECORD = "installed_plugins.json"
+
+
+def get_installed_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+def get_direct_url(name):
+    '''
+        @return url plugin installed from if installed from url(git, local dir), recorded by pip in direct_url.json,
+                vcs url has vcs prefix and requested revision, e.g. "git+https://github.com/xxx/xxx.git@v1.0"
+    '''
+    try:
+        content = metadata.distribution(name).read_text("direct_url.json")
+        if not content:
+            return None
+        info = json.loads(content)
+        url = info["url"]
+        vcs_info = info.get("vcs_info")
+        if vcs_info:
+            url = "{}+{}".format(vcs_info["vcs"], url)
+            if vcs_info.get("requested_revision"):
+                url = "{}@{}".format(url, vcs_info["requested_revision"])
+        return url
+    except Exception:
+        return None
+
+def version_match(installed, required):
+    '''
+        @required "1.2.0" or specifier like ">=1.2", None means any version
+    '''
+    if installed is None:
+        return False
+    if not required:
+        return True
+    required = str(required).strip()
+    if required[0] in "<>=!~":
+        try:
+            from packaging.specifiers import SpecifierSet
+            return installed in SpecifierSet(required)
+        except Exception:
+            return False
+    return installed == required
+
+def load_installed_record(cache_dir):
+    '''
+        @return dict, {name: {"url": url, "version": version}} of vcs plugins installed to current python environment
+    '''
+    try:
+        with open(os.path.join(cache_dir, INSTALLED_RECORD), encoding="utf-8") as f:
+            return json.load(f).get(sys.prefix, {})
+    except Exception:
+        return {}
+
+def save_installed_record(cache_dir, record):
+    path = os.path.join(cache_dir, INSTALLED_RECORD)
+    try:
+        with open(path, encoding="utf-8") as f:
+            content = json.load(f)
+    except Exception:
+        content = {}
+    content[sys.prefix] = record
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = "{}.{}".format(path, os.getpid())
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(content, f, indent=1)
+    os.replace(tmp_path, path)
+
+def _is_vcs(path):
+    return path.startswith("svn") or path.startswith("git")
+
+def _url_equal(url, path):
+    '''
+        the same url and ref, only trailing "#egg=" fragment ignored
+    '''
+    def norm(v):
+        return re.sub(r"#egg=[^&#]*$", "", v.strip())
+    return norm(url) == norm(path)
+
+def get_plugin_requirement(name, info, plugins_dir = None, installed_record = {}):
+    '''
+        @installed_record from load_installed_record
+        @return (requirement, editable, reason), requirement is None if plugin already installed or not need install
+    '''
+    path = info.get("from")
+    installed = get_installed_version(name)
+    local_path = find_plugin_in_dir(plugins_dir, name) if plugins_dir else None
+    if local_path:
+        # plugin developers edit code without bumping version, always install again
+        return os.path.abspath(local_path), False, "from {}".format(local_path)
+    if (not path) or path.lower() == "pypi":
+        version = info.get("version")
+        if version_match(installed, version):
+            return None, False, "v{} already installed".format(installed)
+        if not version:
+            return name, False, "from pypi"
+        version = str(version)
+        return (name + version if version[0] in "<>=!~" else "{}=={}".format(name, version)), False, "from pypi"
+    if _is_vcs(path):
+        url = get_direct_url(name)
+        record = installed_record.get(name)
+        if installed and ((url and _url_equal(url, path)) or
+                          (record and record["version"] == installed and _url_equal(record["url"], path))):
+            return None, False, "v{} already installed from {}".format(installed, path)
+        return path, False, "from {}".format(path)
+    # use local plugin dir directly, no need to install
+    return None, False, "use local plugin from {}".format(path)
+
+def _pip(args, log):
+    cmd = [sys.executable, "-m", "pip"] + args
+    log.i("run: {}".format(" ".join(cmd)))
+    return subprocess.run(cmd).returncode == 0
+
+def install_plugins(plugins, log, plugins_dir = None, index_url = None, find_links = [], offline = False, wheel_dir = None, cache_dir = None):
+    '''
+        @plugins "plugins" of site_config
+        @cache_dir dir to save installed_plugins.json, None not record
+        @find_links list, local dirs of wheels
+        @offline only install from find_links and wheel_dir, not access index
+        @wheel_dir wheels cache dir, download or build wheels of plugins and dependencies to it, install from it
+        @return bool
+    '''
+    requirements = []
+    names = []
+    installed_record = load_installed_record(cache_dir) if cache_dir else {}
+    for name, info in plugins.items():
+        req, editable, reason = get_plugin_requirement(name, info, plugins_dir, installed_record)
+        log.i("plugin <{}>: {}".format(name, reason))
+        if req:
+            requirements.append((name, req, editable))
+            names.append(name)
+    if not requirements:
+        log.i("all plugins already installed")
+        return True
+    opts = []
+    if index_url:
+        opts += ["-i", index_url]
+    for d in find_links:
+        opts += ["--find-links", d]
+    if offline:
+        opts += ["--no-index"]
+    if wheel_dir:
+        # download or build wheels not in wheel dir, then install all from wheel dir without index
+        os.makedirs(wheel_dir, exist_ok=True)
+        wheel_opts = opts + ["--find-links", wheel_dir]
+        if not _pip(["wheel", "--wheel-dir", wheel_dir] + wheel_opts + [req for name, req, editable in requirements], log):
+            log.e("download or build wheels of plugins {} fail".format(names))
+            return False
+        install_opts = ["--no-index", "--find-links", wheel_dir] + ["--find-links={}".format(d) for d in find_links]
+        # local dir and vcs requirements are built to wheels, install by name,
+        # and force reinstall them, wheels may be rebuilt from changed source with the same version
+        rebuilt = [name for name, req, editable in requirements if not req.startswith(name)]
+        args = ["install", "--upgrade"] + install_opts + [req if req.startswith(name) else name for name, req, editable in requirements]
+        log.i("install plugins: {}".format(names))
+        if not _pip(args, log) or (rebuilt and not _pip(["install", "--force-reinstall", "--no-deps"] + install_opts + rebuilt, log)):
+            log.e("install plugins {} fail".format(names))
+            return False
+    else:
+        args = ["install", "--upgrade"] + opts
+        for name, req, editable in requirements:
+            args += ["-e", req] if editable else [req]
+        log.i("install plugins: {}".format(names))
+        if not _pip(args, log):
+            log.e("install plugins {} fail".format(names))
+            return False
+    if cache_dir:
+        # record url of vcs plugins, installed by name from wheel dir have no direct_url.json
+        invalidate_caches()
+        for name, req, editable in requirements:
+            if _is_vcs(req):
+                installed_record[name] = {"url": req, "version": get_installed_version(name)}
+        save_installed_record(cache_dir, installed_record)
+    return True
@@ -0,0 +1,88 @@
+'''
+    I/O thread pool of one worker, overlap disk I/O with parsing and rendering:
+        read-ahead:   source files after current one are loaded to OS page cache in background,
+                      so plugins read them from memory
+        write-behind: rendered pages and copied files are written by pool threads,
+                      worker go on parsing and rendering next file
+    call `wait()` before send result to main process, write errors are raised there.
+'''
+
+import os
+from concurrent.futures import ThreadPoolExecutor, Future
+
+
+def read_ahead(path):
+    '''
+        load file to page cache, posix_fadvise only ask kernel to read, not copy data to user space
+    '''
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        else:
+            while os.read(fd, 1024 * 1024):
+                pass
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class IO_Pool:
+    # I/O threads of every worker, 0 means read and write in worker thread, set by `teedoc build --io-threads`
+    threads = 2
+    # how many source files read ahead
+    read_ahead = 8
+
+    def __init__(self, files = []):
+        '''
+            @files source files of worker, in parse order
+        '''
+        self.files = files
+        self.next_read = 0
+        self.futures = []
+        self.pool = ThreadPoolExecutor(self.threads, thread_name_prefix="teedoc_io") if self.threads > 0 else None
+
+    def prefetch(self, i):
+        '''
+            @i index of file parsing now, read files after it
+        '''
+        if not self.pool:
+            return
+        start = max(self.next_read, i + 1)
+        end = min(len(self.files), i + 1 + self.read_ahead)
+        for path in self.files[start:end]:
+            self.pool.submit(read_ahead, path)
+        self.next_read = max(self.next_read, end)
+
+    def submit(self, func, *args):
+        '''
+            run write task in pool, or run now if no pool
+            @return Future, result of func
+        '''
+        if self.pool:
+            future = self.pool.submit(func, *args)
+        else:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+        self.futures.append(future)
+        return future
+
+    def wait(self):
+        '''
+            wait all tasks finished, raise exception if any task fail
+        '''
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown(wait=True)
+            self.pool = None
@@ -1,6 +1,5 @@
 import os
 import gettext
-import babel
 from collections import OrderedDict
 
 babel_cfg_default = """
@@ -40,6 +39,7 @@ def set_locale(locale_in):
     tr = lang.gettext
 
 def get_languages(locales):
+    import babel
     languages = OrderedDict()
     for locale in locales:
         obj = babel.Locale.parse(locale)
@@ -47,19 +47,24 @@ def get_languages(locales):
     return languages
 
 def extract(src_path, config_file_path, out_path):
-    from babel.messages.frontend import extract_messages
-    cmdinst = extract_messages()
-    cmdinst.initialize_options()
-    cmdinst.mapping_file = config_file_path
-    cmdinst.output_file = out_path
-    cmdinst.input_paths = src_path
-    cmdinst.omit_header = True
-    cmdinst.header_comment = "#"
+    '''
+        same as `pybabel extract -F config_file_path -o out_path src_path` with omit header,
+        but file locations are relative to src_path, so no need to change working dir
+    '''
+    from babel.messages.catalog import Catalog
+    from babel.messages.extract import extract_from_dir
+    from babel.messages.pofile import write_po
     try:
-        cmdinst.ensure_finalized()
-        cmdinst.run()
-    except Exception as err:
-        raise err
+        from babel.messages.frontend import parse_mapping_cfg as parse_mapping
+    except ImportError:
+        from babel.messages.frontend import parse_mapping
+    with open(config_file_path, encoding="utf-8") as f:
+        method_map, options_map = parse_mapping(f)
+    catalog = Catalog(header_comment="#")
+    for filename, lineno, message, comments, context in extract_from_dir(src_path, method_map, options_map):
+        catalog.add(message, None, [(os.path.normpath(filename), lineno)], auto_comments=comments, context=context)
+    with open(out_path, "wb") as f:
+        write_po(f, catalog, omit_header=True)
 
 def init(template_path, out_dir, locale, domain="messages"):
     from babel.messages.frontend import init_catalog
@@ -144,36 +149,38 @@ def main(cmd, root_dir, cfg_path=None, locales_path=None, locales=None, rm_meta=
             exec(f.read(), g)
             locales = g["locales"]
 
-    cwd = os.getcwd()
-    os.chdir(root_dir)
+    # use abs path but not change working dir, so builds of multiple sites can run in one process
+    locales_dir = os.path.join(root_dir, "locales")
+    pot_path = os.path.join(locales_dir, "messages.pot")
     if cmd == "prepare":
         print("-- translate locales: {}".format(locales))
         print("-- extract keys from files")
-        if not os.path.exists("locales"):
-            os.makedirs("locales")
+        if not os.path.exists(locales_dir):
+            os.makedirs(locales_dir)
         # os.system("pybabel extract -F babel.cfg -o locales/messages.pot ./")
-        extract("./", cfg_path_final, "locales/messages.pot")
+        extract(root_dir, cfg_path_final, pot_path)
         print("-- extract keys from files done")
         for locale in locales:
             print("-- generate {} po files from pot files".format(locale))
-            if os.path.exists('locales/{}/LC_MESSAGES/messages.po'.format(locale)):
+            po_path = os.path.join(locales_dir, locale, "LC_MESSAGES", "messages.po")
+            if os.path.exists(po_path):
                 print("-- file already exits, only update")
                 # "pybabel update -i locales/messages.pot -d locales -l {}".format(locale)
-                update("locales/messages.pot", "locales", locale)
+                update(pot_path, locales_dir, locale)
             else:
                 print("-- file not exits, now create")
                 # "pybabel init -i locales/messages.pot -d locales -l {}".format(locale)
-                init("locales/messages.pot", "locales", locale)
+                init(pot_path, locales_dir, locale)
             # remove meta info from header first msgid to charactor "#"
             if rm_meta:
-                rm_po_meta("locales/{}/LC_MESSAGES/messages.po".format(locale))
+                rm_po_meta(po_path)
             print("-- generate {} po files done".format(locale))
     elif cmd == "finish":
         print("-- translate locales: {}".format(locales))
         for locale in locales:
             print("-- generate {} mo file from po files".format(locale))
             # "pybabel compile -d locales -l {}".format(locale)
-            compile("locales", locale)
+            compile(locales_dir, locale)
         print("-- generate mo files done")
     elif cmd == "all":
         ret = main("prepare", root_dir, cfg_path, locales_path, locales=locales, rm_meta=rm_meta)
@@ -183,7 +190,6 @@ def main(cmd, root_dir, cfg_path=None, locales_path=None, locales=None, rm_meta=
                 print("finish failed")
         else:
             print("prepare failed")
-    os.chdir(cwd)
     return ret
 
 
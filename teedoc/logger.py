@@ -7,14 +7,80 @@
 
 
 
+import os
+import time
+import json
+import atexit
 import logging
+import threading
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+
+
+class _Message:
+    '''
+        join args only when record is really formatted by handlers,
+        or format `fmt.format(*args)` for `log.df(fmt, *args)`
+    '''
+    __slots__ = ("args", "fmt")
+
+    def __init__(self, args, fmt = None):
+        self.args = args
+        self.fmt = fmt
+
+    def __str__(self):
+        if self.fmt is not None:
+            return " " + self.fmt.format(*self.args)
+        out = ""
+        for arg in self.args:
+            out += " " + str(arg)
+        return out
+
+class _Dispatch_Handler(logging.Handler):
+    '''
+        in main process, send records from sub processes to logger's handlers
+    '''
+    def __init__(self, logger):
+        super().__init__()
+        self.logger = logger
+
+    def emit(self, record):
+        self.logger.handle(record)
+
+class JSON_Formatter(logging.Formatter):
+    '''
+        one json object per line, for CI analysis
+    '''
+    def __init__(self, start_time):
+        super().__init__()
+        self.start_time = start_time
+
+    def format(self, record):
+        return json.dumps({
+            "time": record.created,
+            "elapsed": round(record.created - self.start_time, 3),
+            "level": record.levelname,
+            "pid": record.process,
+            "process": record.processName,
+            "thread": record.threadName,
+            "route": getattr(record, "route", None),
+            "msg": record.getMessage().strip()
+        }, ensure_ascii=False)
 
 
 class Logger:
     '''
-        use logging module to record log to console or file
+        use logging module to record log to console or file,
+        logs of sub processes are sent to main process by queue and output by main process, so lines won't interleave
     '''
-    def __init__(self, level="d", file_path=None, fmt = '%(asctime)s - [%(levelname)s] - [%(processName)s - %(threadName)s] %(message)s'):
+    def __init__(self, level="d", file_path=None, fmt = '%(asctime)s - [%(levelname)s] - [%(processName)s - %(threadName)s] %(message)s',
+                 json_path = None):
+        '''
+            @json_path if not None, also write log to this file, one json per line, with pid, route and elapsed time
+        '''
+        self.start_time = time.time()
+        self._pid = os.getpid()
+        self._ctx = threading.local()
         self.log = logging.getLogger("logger")
         formatter=logging.Formatter(fmt=fmt)
         level_ = logging.DEBUG
@@ -60,30 +126,84 @@ class Logger:
             fh.setFormatter(formatter)
             fh.setLevel(level_)
             self.log.addHandler(fh)
+        if json_path:
+            jh = logging.FileHandler(json_path, mode="w", encoding="utf-8")
+            jh.setFormatter(JSON_Formatter(self.start_time))
+            jh.setLevel(level_)
+            self.log.addHandler(jh)
+        self.level = level_
+        # sub processes put records to queue, main process output them
+        self.queue = multiprocessing.Queue(-1)
+        self.listener = QueueListener(self.queue, _Dispatch_Handler(self.log))
+        self.listener.start()
+        atexit.register(self.close)
+        self._worker_log = None
+
+    def __getstate__(self):
+        # for spawn start method, only queue is needed in sub process
+        state = self.__dict__.copy()
+        state["listener"] = None
+        state["_ctx"] = None
+        state["_worker_log"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._ctx = threading.local()
+
+    def close(self):
+        '''
+            flush logs of sub processes, only valid in main process
+        '''
+        if self.listener and os.getpid() == self._pid:
+            try:
+                self.listener.stop()
+            except Exception:
+                pass
+            self.listener = None
+
+    def _get_log(self):
+        if os.getpid() == self._pid:
+            return self.log
+        # in sub process, only output to queue
+        if not self._worker_log or self._worker_log[0] != os.getpid():
+            log = logging.getLogger("logger.worker")
+            log.handlers = [QueueHandler(self.queue)]
+            log.propagate = False
+            log.setLevel(self.level)
+            self._worker_log = (os.getpid(), log)
+        return self._worker_log[1]
+
+    def set_route(self, route):
+        '''
+            set route(doc url) of current thread, will be recorded in json log
+        '''
+        self._ctx.route = route
+
+    def _log(self, level, args, fmt = None):
+        log = self._get_log()
+        # check level first, avoid convert args to str
+        if not log.isEnabledFor(level):
+            return
+        log.log(level, "%s", _Message(args, fmt), extra = {"route": getattr(self._ctx, "route", None)})
 
     def d(self, *args):
-        out = ""
-        for arg in args:
-            out += " " + str(arg)
-        self.log.debug(out)
+        self._log(logging.DEBUG, args)
+
+    def df(self, fmt, *args):
+        '''
+            debug log of `fmt.format(*args)`, only formatted if debug level enabled
+        '''
+        self._log(logging.DEBUG, args, fmt)
 
     def i(self, *args):
-        out = ""
-        for arg in args:
-            out += " " + str(arg)
-        self.log.info(out)
+        self._log(logging.INFO, args)
 
     def w(self, *args):
-        out = ""
-        for arg in args:
-            out += " " + str(arg)
-        self.log.warning(out)
+        self._log(logging.WARNING, args)
 
     def e(self, *args):
-        out = ""
-        for arg in args:
-            out += " " + str(arg)
-        self.log.error(out)
+        self._log(logging.ERROR, args)
 
 class Fake_Logger:
     '''
@@ -95,6 +215,9 @@ class Fake_Logger:
     def d(self, *args):
         print(args)
 
+    def df(self, fmt, *args):
+        print(fmt.format(*args))
+
     def i(self, *args):
         print(args)
 
@@ -104,9 +227,11 @@ class Fake_Logger:
     def e(self, *args):
         print(args)
 
+    def set_route(self, route):
+        pass
+
 
 if __name__ == "__main__":
-    import os
     log = Logger(file_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.log"))
     log.d("debug", "hello")
     log.i("info:", 1)
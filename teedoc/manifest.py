@@ -0,0 +1,184 @@
+'''
+    build output manifest, list every output file with size, content hash, source file and producing plugin,
+    saved to `out/.teedoc-manifest.json`, e.g.
+    {
+        "version": 1,
+        "files": {
+            "get_started/zh/index.html": {
+                "size": 1234,
+                "mtime": 1650000000000000000,
+                "sha256": "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855",
+                "source": "docs/get_started/zh/README.md",
+                "plugin": "teedoc-plugin-markdown-parser"
+            }
+        }
+    }
+    tools like teedoc_compare and teedoc_upload can use it instead of reading the whole out dir
+    reproducible build(env SOURCE_DATE_EPOCH set), modify time of out files newer than it are set to it when save,
+    so manifest and archives are the same every build, and rewritten files still detected by modify time
+'''
+
+import os
+import json
+import hashlib
+import threading
+
+try:
+    from .utils import get_source_date_epoch
+except Exception:
+    from utils import get_source_date_epoch
+
+MANIFEST_NAME = ".teedoc-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def get_manifest_path(out_dir):
+    return os.path.join(out_dir, MANIFEST_NAME)
+
+def hash_file(path, chunk_size = 1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while 1:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            sha.update(data)
+    return sha.hexdigest()
+
+def file_entry(content = None, source = None, plugin = None):
+    '''
+        create manifest entry, can be created in sub process and send to main process by queue
+        @content str or bytes, file content already in memory, None means hash file when save manifest
+        @source source file abs path, None means not from source dir
+        @plugin producing plugin name, None means teedoc self
+    '''
+    entry = {
+        "source": source,
+        "plugin": plugin
+    }
+    if content is not None:
+        if type(content) == str:
+            content = content.encode("utf-8")
+        entry["size"] = len(content)
+        entry["sha256"] = hashlib.sha256(content).hexdigest()
+    return entry
+
+def load_manifest(out_dir):
+    '''
+        @return dict, files of manifest, {} if manifest not exists or broken
+    '''
+    path = get_manifest_path(out_dir)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest["files"]
+    except Exception:
+        return {}
+
+
+class Manifest:
+    def __init__(self, out_dir, doc_src_path = None):
+        '''
+            load manifest from out_dir if exists, so partial rebuild only update changed files
+            @out_dir site out dir, manifest saved to this dir
+            @doc_src_path source dir, source path in manifest will be relative to it
+        '''
+        self.out_dir = os.path.abspath(out_dir).replace("\\", "/")
+        self.doc_src_path = os.path.abspath(doc_src_path).replace("\\", "/") if doc_src_path else None
+        self.files = load_manifest(self.out_dir)
+        self.lock = threading.Lock()
+
+    def _rel_path(self, path):
+        return os.path.relpath(os.path.abspath(path), self.out_dir).replace("\\", "/")
+
+    def _source_path(self, source):
+        '''
+            only keep source in doc dir, others like plugins' temp files is useless and differ every build
+        '''
+        if not source or not self.doc_src_path:
+            return None
+        source = os.path.abspath(source).replace("\\", "/")
+        if not source.startswith(self.doc_src_path + "/"):
+            return None
+        return source[len(self.doc_src_path) + 1:]
+
+    def add(self, path, source = None, plugin = None, content = None):
+        '''
+            record one output file
+            @path output file abs path
+            @content file content if already in memory, or will read file to calculate hash when save
+        '''
+        self.update({path: file_entry(content, source, plugin)})
+
+    def add_dir(self, out_path, in_path, plugin = None):
+        '''
+            record all files of out_path, copied from in_path
+        '''
+        for root, dirs, files in os.walk(out_path):
+            for name in files:
+                path = os.path.join(root, name)
+                self.add(path, os.path.join(in_path, os.path.relpath(path, out_path)), plugin)
+
+    def update(self, entries):
+        '''
+            @entries {abs_path: entry}, entry created by file_entry
+        '''
+        with self.lock:
+            for path, entry in entries.items():
+                entry = entry.copy()
+                entry["source"] = self._source_path(entry["source"])
+                self.files[self._rel_path(path)] = entry
+
+    def sync(self):
+        '''
+            make manifest consistent with files in out dir,
+            hash files new added or changed(size or modify time changed), remove files not exists
+        '''
+        files = {}
+        epoch = get_source_date_epoch()
+        epoch_ns = epoch * 1000000000 if epoch is not None else None
+        for root, dirs, names in os.walk(self.out_dir):
+            dirs.sort()
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                rel = self._rel_path(path)
+                if rel == MANIFEST_NAME or name.startswith(MANIFEST_NAME + "."):
+                    continue
+                st = os.stat(path)
+                entry = self.files.get(rel, {"source": None, "plugin": None})
+                if entry.get("size") != st.st_size or entry.get("mtime", st.st_mtime_ns) != st.st_mtime_ns or not entry.get("sha256"):
+                    entry["size"] = st.st_size
+                    entry["sha256"] = hash_file(path)
+                entry["mtime"] = st.st_mtime_ns
+                if epoch_ns is not None and st.st_mtime_ns > epoch_ns:
+                    os.utime(path, ns=(st.st_atime_ns, epoch_ns))
+                    entry["mtime"] = epoch_ns
+                files[rel] = {
+                    "size": entry["size"],
+                    "mtime": entry["mtime"],
+                    "sha256": entry["sha256"],
+                    "source": entry.get("source"),
+                    "plugin": entry.get("plugin")
+                }
+        self.files = files
+
+    def save(self):
+        '''
+            sync with out dir and save manifest atomically, so manifest never half written
+        '''
+        with self.lock:
+            if not os.path.exists(self.out_dir):
+                return
+            self.sync()
+            path = get_manifest_path(self.out_dir)
+            tmp_path = "{}.{}.{}".format(path, os.getpid(), threading.get_ident())
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, ensure_ascii=False, indent=1, sort_keys=True)
+            epoch = get_source_date_epoch()
+            if epoch is not None:
+                os.utime(tmp_path, (epoch, epoch))
+            os.replace(tmp_path, path)
@@ -0,0 +1,208 @@
+'''
+    memory report, record peak RSS of main process at every build stage and of every worker(sub process or thread),
+    and memory growth of every plugin(only in main process and worker sub processes, threads share RSS), to find out which part use too much memory when build killed by OOM.
+    RSS and peak RSS(VmRSS, VmHWM) are read from /proc/self/status, only peak RSS on systems have no /proc.
+    optional use tracemalloc to record top allocators of every stage, tracemalloc make build slow, only use to debug.
+'''
+
+import os
+import json
+import time
+import threading
+import multiprocessing
+
+try:
+    from .page_weight import format_size
+except Exception:
+    from page_weight import format_size
+
+
+def get_mem():
+    '''
+        @return (rss, peak_rss) bytes of current process, rss is None if not supported
+    '''
+    try:
+        rss = None
+        hwm = None
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    hwm = int(line.split()[1]) * 1024
+        if rss is not None and hwm is not None:
+            return rss, hwm
+    except Exception:
+        pass
+    try:
+        import resource
+        import sys
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return None, max_rss if sys.platform == "darwin" else max_rss * 1024
+    except Exception:
+        return None, 0
+
+def get_rss():
+    rss, hwm = get_mem()
+    return rss if rss is not None else hwm
+
+def _top_allocators(snapshot, prev = None, top = 10):
+    items = []
+    if prev:
+        stats = snapshot.compare_to(prev, "lineno")
+    else:
+        stats = snapshot.statistics("lineno")
+    for stat in stats[:top]:
+        frame = stat.traceback[0]
+        items.append({
+            "where": "{}:{}".format(frame.filename, frame.lineno),
+            "size": stat.size,
+            "size_diff": getattr(stat, "size_diff", stat.size),
+            "count": stat.count
+        })
+    return items
+
+
+class Worker_Mem:
+    '''
+        memory of one generate call, run in sub process or thread, result send to main process by queue
+    '''
+    def __init__(self, url, trace_top = 0, process_wide = False):
+        '''
+            @process_wide True if run in thread, RSS is of whole process shared by all threads,
+                          so memory growth of plugins and parts are not recorded
+        '''
+        self.url = url
+        self.trace_top = trace_top
+        self.process_wide = process_wide
+        self.start_rss = get_rss()
+        self.parts = {}
+        self._rss = 0
+
+    def begin(self):
+        if not self.process_wide:
+            self._rss = get_rss()
+
+    def end(self, name):
+        '''
+            @name plugin name or other part name like "render", accumulate memory growth since begin()
+        '''
+        if self.process_wide:
+            return
+        delta = get_rss() - self._rss
+        if delta > 0:
+            self.parts[name] = self.parts.get(name, 0) + delta
+
+    def result(self):
+        rss, hwm = get_mem()
+        result = {
+            "url": self.url,
+            "pid": os.getpid(),
+            "process": multiprocessing.current_process().name,
+            "thread": threading.current_thread().name,
+            "start_rss": self.start_rss,
+            "rss": rss,
+            "hwm": hwm,
+            "process_wide": self.process_wide,
+            "parts": self.parts
+        }
+        if self.trace_top:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                result["top"] = _top_allocators(tracemalloc.take_snapshot(), top = self.trace_top)
+        return result
+
+
+class Mem_Report:
+    def __init__(self, trace_top = 0):
+        '''
+            @trace_top > 0 means use tracemalloc, record top n allocators of every stage
+        '''
+        self.trace_top = trace_top
+        self.stages = []
+        self.workers = []
+        self.parts = {}
+        self._snapshot = None
+        self._t = time.time()
+        if trace_top:
+            import tracemalloc
+            tracemalloc.start()
+            self._snapshot = tracemalloc.take_snapshot()
+        self.stage("start")
+
+    def stage(self, name, **kw_args):
+        '''
+            record main process memory at the end of stage
+            @kw_args other info of this stage, e.g. pages=10
+        '''
+        rss, hwm = get_mem()
+        item = {
+            "stage": name,
+            "time": round(time.time() - self._t, 3),
+            "rss": rss,
+            "hwm": hwm
+        }
+        item.update(kw_args)
+        if self.trace_top:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            item["top"] = _top_allocators(snapshot, self._snapshot, self.trace_top)
+            self._snapshot = snapshot
+        self.stages.append(item)
+
+    def add_part(self, name, size):
+        '''
+            record memory growth of plugin or part in main process, e.g. plugin's on_htmls
+        '''
+        if size > 0:
+            self.parts[name] = self.parts.get(name, 0) + size
+
+    def add_worker(self, worker):
+        '''
+            @worker Worker_Mem.result()
+        '''
+        self.workers.append(worker)
+
+    def report(self):
+        parts = {}
+        for name, size in self.parts.items():
+            parts[name] = {"main": size, "workers": 0, "worker_max": 0}
+        for worker in self.workers:
+            for name, size in worker["parts"].items():
+                part = parts.setdefault(name, {"main": 0, "workers": 0, "worker_max": 0})
+                part["workers"] += size
+                part["worker_max"] = max(part["worker_max"], size)
+        # worker threads read RSS of main process, not count in workers peak
+        return {
+            "main_hwm": max([s["hwm"] for s in self.stages] + [0]),
+            "workers_hwm": max([w["hwm"] for w in self.workers if not w["process_wide"]] + [0]),
+            "stages": self.stages,
+            "workers": sorted(self.workers, key = lambda w: -w["hwm"]),
+            "parts": dict(sorted(parts.items(), key = lambda v: -max(v[1]["main"], v[1]["worker_max"])))
+        }
+
+def log_report(report, log, top = 5):
+    workers_hwm = format_size(report["workers_hwm"]) if report["workers_hwm"] else "-"
+    log.i("memory report, peak RSS: main process {}, worker {}".format(format_size(report["main_hwm"]), workers_hwm))
+    last = None
+    for stage in report["stages"]:
+        rss = format_size(stage["rss"]) if stage["rss"] is not None else "-"
+        grow = ""
+        if last and stage["rss"] is not None and last["rss"] is not None:
+            grow = " ({}{})".format("+" if stage["rss"] >= last["rss"] else "-", format_size(abs(stage["rss"] - last["rss"])))
+        log.i("  stage {:<24} rss {:>9}{:<12} peak {:>9}".format(stage["stage"], rss, grow, format_size(stage["hwm"])))
+        last = stage
+    for worker in report["workers"][:top]:
+        if worker["process_wide"]:
+            log.i("  worker {} {} peak {} (process-wide, shared by threads)".format(worker["thread"], worker["url"], format_size(worker["hwm"])))
+        else:
+            log.i("  worker {} {} peak {}".format(worker["process"], worker["url"], format_size(worker["hwm"])))
+    if report["parts"]:
+        log.i("  memory growth of plugins and parts(main process, workers total, max in one worker):")
+        for name, part in report["parts"].items():
+            log.i("    {:<40} {:>9} {:>9} {:>9}".format(name, format_size(part["main"]), format_size(part["workers"]), format_size(part["worker_max"])))
+
+def save_report(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
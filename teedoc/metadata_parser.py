@@ -7,6 +7,11 @@ import datetime
 import os
 import time
 
+try:
+    from .utils import get_source_date_epoch, date_to_timestamp, timestamp_to_datetime
+except Exception:
+    from utils import get_source_date_epoch, date_to_timestamp, timestamp_to_datetime
+
 class Metadata_Parser:
     def __init__(self):
         self.re_meta_flag = re.compile("[-]{2}[-]$\n(.*?)\n[-]{3}(.*)", re.MULTILINE|re.DOTALL)
@@ -90,16 +95,15 @@ class Metadata_Parser:
             metadata["date"] = metadata["update"][0]["date"]
         if (type(metadata["date"]) == datetime.datetime or type(metadata["date"]) == datetime.date):
             date = metadata["date"]
-            if type(date) == datetime.date:
-                metadata["ts"] = int(time.mktime(date.timetuple()))
-            else:
-                metadata["ts"] = int(date.timestamp())
+            metadata["ts"] = date_to_timestamp(date)
+            if type(date) == datetime.datetime:
                 metadata["date"] = datetime.datetime.date(date)
         elif not metadata["date"]:
             metadata["date"] = False
         elif self.file:
-            metadata["ts"] = int(os.stat(self.file).st_mtime)
-            metadata["date"] = datetime.datetime.date(datetime.datetime.fromtimestamp(metadata["ts"]))
+            epoch = get_source_date_epoch()
+            metadata["ts"] = int(os.stat(self.file).st_mtime) if epoch is None else epoch
+            metadata["date"] = datetime.datetime.date(timestamp_to_datetime(metadata["ts"]))
         return metadata
 
 
@@ -0,0 +1,316 @@
+'''
+    output stores, build always write site to out dir, then files listed in manifest are saved to store:
+        dir:     out dir self, default
+        zip, tar, tar.gz, tar.zst: one archive file, upload one file is much faster than upload lots of small files,
+                 tar.zst need `zstandard` package(pip install zstandard)
+        cas:     content addressed store, files with the same content(e.g. plugins' assets of every locale)
+                 only save one blob in store's objects dir, files in out dir are hardlinks of blobs,
+                 store dir should be in the same file system with out dir
+    preview server can serve out dir(dir and cas) or archive directly by `Archive_Reader`,
+    `serve --overlay` serve assets and files not parsed from source dirs directly by `Overlay`, not copy to out dir
+    reproducible build(env SOURCE_DATE_EPOCH set), archives have no owner and build time info, byte-identical every build
+'''
+
+import os
+import io
+import tarfile
+import zipfile
+import mimetypes
+import threading
+
+try:
+    from .manifest import MANIFEST_NAME, hash_file
+    from .utils import get_source_date_epoch
+except Exception:
+    from manifest import MANIFEST_NAME, hash_file
+    from utils import get_source_date_epoch
+
+STORE_TYPES = ["dir", "zip", "tar", "tar.gz", "tar.zst", "cas"]
+ARCHIVE_TYPES = ["zip", "tar", "tar.gz", "tar.zst"]
+
+
+def get_default_store_path(doc_src_path, store_type):
+    if store_type == "dir":
+        return os.path.join(doc_src_path, "out")
+    if store_type == "cas":
+        return os.path.join(doc_src_path, ".teedoc_cache", "objects")
+    return os.path.join(doc_src_path, "out.{}".format(store_type))
+
+def get_archive_type(path):
+    '''
+        @return archive type by file name, None if not archive
+    '''
+    for store_type in sorted(ARCHIVE_TYPES, key = lambda v: -len(v)):
+        if path.endswith("." + store_type):
+            return store_type
+    if path.endswith(".tgz"):
+        return "tar.gz"
+    return None
+
+def unlink_if_linked(path):
+    '''
+        out file may be hardlink of blob in cas store, remove it before write,
+        or all files with the same content will be changed
+    '''
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception("tar.zst store need zstandard package, install by `pip install zstandard`")
+    return zstandard
+
+
+class Dir_Store:
+    def __init__(self, path):
+        self.path = path
+
+    def add(self, arcname, path, sha256 = None):
+        pass
+
+    def close(self):
+        return "out dir {}".format(self.path)
+
+
+class Archive_Store:
+    def __init__(self, path, store_type):
+        '''
+            write archive to temp file and rename when close, so never get half written archive
+        '''
+        self.path = path
+        self.store_type = store_type
+        self.count = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        self._f = None
+        self._zstd_writer = None
+        self._gz = None
+        self.epoch = get_source_date_epoch()
+        if store_type == "zip":
+            self.archive = zipfile.ZipFile(self.tmp_path, "w", compression=zipfile.ZIP_DEFLATED)
+        elif store_type == "tar.zst":
+            zstandard = _zstd()
+            self._f = open(self.tmp_path, "wb")
+            self._zstd_writer = zstandard.ZstdCompressor(level=10, threads=-1).stream_writer(self._f)
+            self.archive = tarfile.open(fileobj=self._zstd_writer, mode="w|")
+        elif store_type == "tar.gz" and self.epoch is not None:
+            # gzip header has file name and time, tarfile can't set them
+            import gzip
+            self._f = open(self.tmp_path, "wb")
+            self._gz = gzip.GzipFile(filename="", mode="wb", fileobj=self._f, mtime=self.epoch)
+            self.archive = tarfile.open(fileobj=self._gz, mode="w")
+        else:
+            self.archive = tarfile.open(self.tmp_path, "w:gz" if store_type == "tar.gz" else "w")
+
+    def _normalize(self, info):
+        info.uid = info.gid = 0
+        info.uname = info.gname = ""
+        info.mtime = min(int(info.mtime), self.epoch)
+        return info
+
+    def add(self, arcname, path, sha256 = None):
+        if self.store_type == "zip":
+            self.archive.write(path, arcname)
+        else:
+            self.archive.add(path, arcname, recursive=False, filter=self._normalize if self.epoch is not None else None)
+        self.count += 1
+
+    def close(self):
+        self.archive.close()
+        if self._gz:
+            self._gz.close()
+            self._f.close()
+        elif self._zstd_writer:
+            self._zstd_writer.close()
+        elif self._f:
+            self._f.close()
+        os.replace(self.tmp_path, self.path)
+        return "{} files saved to {} ({} bytes)".format(self.count, self.path, os.path.getsize(self.path))
+
+
+class CAS_Store:
+    def __init__(self, path):
+        '''
+            @path objects dir, blob of file saved to path/sha256[:2]/sha256[2:]
+        '''
+        self.path = path
+        self.count = 0
+        self.blobs = set()
+        self.saved = 0
+        os.makedirs(path, exist_ok=True)
+
+    def add(self, arcname, path, sha256 = None):
+        if not sha256:
+            sha256 = hash_file(path)
+        blob = os.path.join(self.path, sha256[:2], sha256[2:])
+        self.count += 1
+        if sha256 in self.blobs:
+            self.saved += os.path.getsize(blob)
+        self.blobs.add(sha256)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.link(path, blob)
+            except OSError as e:
+                raise Exception("create hardlink {} fail, cas store should be in the same file system with out dir: {}".format(blob, e))
+            return
+        if os.path.samefile(path, blob):
+            return
+        # replace file with hardlink of blob
+        tmp_path = "{}.{}.{}".format(path, os.getpid(), threading.get_ident())
+        os.link(blob, tmp_path)
+        os.replace(tmp_path, path)
+
+    def gc(self):
+        '''
+            remove blobs no file in out dir use, @return removed blobs count
+        '''
+        count = 0
+        for root, dirs, names in os.walk(self.path):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.stat(path).st_nlink == 1:
+                    os.remove(path)
+                    count += 1
+        return count
+
+    def close(self):
+        removed = self.gc()
+        return "{} files, {} unique blobs in {}, {} bytes deduplicated, {} unused blobs removed".format(
+                    self.count, len(self.blobs), self.path, self.saved, removed)
+
+
+def get_store(store_type, path):
+    if store_type == "dir":
+        return Dir_Store(path)
+    if store_type == "cas":
+        return CAS_Store(path)
+    if store_type in ARCHIVE_TYPES:
+        return Archive_Store(path, store_type)
+    raise Exception("store type {} error, should be one of {}".format(store_type, STORE_TYPES))
+
+def save_store(store, serve_dir, out_dir, files):
+    '''
+        save files of manifest to store
+        @serve_dir root dir of server, path in store is relative to it
+        @out_dir site out dir, manifest files are relative to it, sub dir of serve_dir if site_root_url is not "/"
+        @files manifest files, {rel_path: entry}
+        @return str, store info
+    '''
+    prefix = os.path.relpath(out_dir, serve_dir).replace("\\", "/")
+    prefix = "" if prefix == "." else prefix + "/"
+    for rel in sorted(files):
+        path = os.path.join(out_dir, rel)
+        if os.path.exists(path):
+            store.add(prefix + rel, path, files[rel].get("sha256"))
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    if not isinstance(store, CAS_Store) and os.path.exists(manifest_path):
+        store.add(prefix + MANIFEST_NAME, manifest_path)
+    return store.close()
+
+
+class Archive_Reader:
+    def __init__(self, path):
+        '''
+            load index of archive, tar.zst can't random access, so load all files to memory, only for preview
+        '''
+        self.path = path
+        self.store_type = get_archive_type(path)
+        self.lock = threading.Lock()
+        self._data = None
+        if self.store_type == "zip":
+            self.archive = zipfile.ZipFile(path)
+            self.names = set(self.archive.namelist())
+        elif self.store_type == "tar.zst":
+            zstandard = _zstd()
+            self._data = {}
+            with open(path, "rb") as f:
+                with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+                    with tarfile.open(fileobj=reader, mode="r|") as archive:
+                        for info in archive:
+                            if info.isfile():
+                                self._data[info.name] = archive.extractfile(info).read()
+            self.names = set(self._data.keys())
+        else:
+            self.archive = tarfile.open(path)
+            self.names = set(info.name for info in self.archive.getmembers() if info.isfile())
+
+    def exists(self, rel):
+        return rel in self.names
+
+    def open(self, rel):
+        if self._data is not None:
+            return io.BytesIO(self._data[rel])
+        with self.lock:
+            if self.store_type == "zip":
+                data = self.archive.read(rel)
+            else:
+                data = self.archive.extractfile(rel).read()
+        return io.BytesIO(data)
+
+
+class Overlay:
+    def __init__(self, serve_dir):
+        '''
+            files map and dirs map from path relative to serve_dir to source path,
+            files not parsed are looked up before out dir, assets dirs after out dir,
+            because plugins may copy processed files to the same path, e.g. teedoc-plugin-assets
+        '''
+        self.serve_dir = os.path.abspath(serve_dir)
+        self.files = {}
+        self.dirs = []
+        self.lock = threading.Lock()
+
+    def _rel_path(self, path):
+        return os.path.relpath(os.path.abspath(path), self.serve_dir).replace("\\", "/")
+
+    def set_dirs(self, dirs):
+        '''
+            @dirs {out_dir_path: src_dir_path}, e.g. assets dirs of route
+        '''
+        items = []
+        for dst, src in dirs.items():
+            rel = self._rel_path(dst)
+            items.append(("" if rel == "." else rel + "/", os.path.abspath(src)))
+        # longest prefix first
+        self.dirs = sorted(items, key = lambda v: -len(v[0]))
+
+    def update(self, files):
+        '''
+            @files {out_file_path: src_file_path}
+        '''
+        with self.lock:
+            for dst, src in files.items():
+                self.files[self._rel_path(dst)] = src
+
+    def find(self, rel):
+        '''
+            find files not parsed
+            @rel path relative to serve_dir
+            @return source file path or None
+        '''
+        src = self.files.get(rel)
+        if src and os.path.isfile(src):
+            return src
+        return None
+
+    def find_in_dirs(self, rel):
+        '''
+            find files in assets dirs
+            @rel path relative to serve_dir
+            @return source file path or None
+        '''
+        for prefix, dir in self.dirs:
+            if rel.startswith(prefix):
+                path = os.path.abspath(os.path.join(dir, rel[len(prefix):]))
+                if path.startswith(dir + os.sep) and os.path.isfile(path):
+                    return path
+        return None
+
+def guess_mimetype(path):
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
@@ -0,0 +1,268 @@
+'''
+    page weight report, html size of every page and size of referenced js, css, image and font files,
+    data is collected when render pages, not parse output html files again.
+
+    config in site_config:
+    "page_weight": {
+        "budgets": {           # optional, 0 or not set means no limit
+            "total": "300KB",  # html and all resources
+            "html": "100KB",
+            "js": "150KB",
+            "css": "50KB",
+            "image": "200KB",
+            "font": "100KB"
+        },
+        "compressed": true,    # compare budgets with estimated gzip size(transfer size), default true
+        "fail": false,         # build fail if some pages exceed budgets, for CI, default false
+        "report": "out/page_weight.json", # optional, report file path relative to doc root
+        "top": 10              # show top n heaviest pages in log, default 10
+    }
+'''
+
+import os
+import re
+import zlib
+import json
+from urllib.parse import urlparse, unquote
+
+RESOURCE_TYPES = {
+    "js": ["js", "mjs"],
+    "css": ["css"],
+    "image": ["png", "jpg", "jpeg", "gif", "svg", "webp", "avif", "ico", "bmp"],
+    "font": ["woff", "woff2", "ttf", "otf", "eot"]
+}
+COMPRESSIBLE_TYPES = ["html", "js", "mjs", "css", "svg", "json", "txt", "xml", "ttf", "otf", "eot"]
+BUDGET_KEYS = ["total", "html", "js", "css", "image", "font"]
+
+_ref_re = re.compile(r'''<(?:script|img|link|source|video|audio|iframe|embed)\b[^>]*?\s(?:src|href)\s*=\s*["']([^"']+)["']''', re.I)
+_css_url_re = re.compile(r'''url\(\s*["']?([^"')]+)["']?\s*\)''', re.I)
+_inline_re = re.compile(r'''<(script|style)\b([^>]*)>(.*?)</\1>''', re.I | re.S)
+
+
+def parse_size(size):
+    '''
+        @size int or str, e.g. 1024, "300KB", "1.5MB", "100KiB"
+        @return int, bytes
+    '''
+    if type(size) in [int, float]:
+        return int(size)
+    match = re.match(r"^\s*([\d.]+)\s*([kmg]?)(i?)b?\s*$", str(size), re.I)
+    if not match:
+        raise Exception("size format error: {}, should be like 300KB".format(size))
+    unit = 1024 if match[3] else 1000
+    return int(float(match[1]) * {"": 1, "k": unit, "m": unit ** 2, "g": unit ** 3}[match[2].lower()])
+
+def format_size(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1000 or unit == "GB":
+            break
+        size /= 1000
+    return "{}{}".format(size, unit) if unit == "B" else "{:.1f}{}".format(size, unit)
+
+def gzip_size(data):
+    '''
+        estimate transfer size, 18 bytes of gzip header and tail
+    '''
+    return len(zlib.compress(data, 6)) + 18
+
+def _len(s):
+    if not s:
+        return 0
+    if type(s) in [list, tuple]:
+        return sum(_len(v) for v in s)
+    return len(str(s).encode("utf-8"))
+
+def _find_refs(html):
+    if not html:
+        return []
+    if type(html) in [list, tuple]:
+        refs = []
+        for v in html:
+            refs.extend(_find_refs(v))
+        return refs
+    return _ref_re.findall(str(html))
+
+def collect_page_weight(vars):
+    '''
+        call when render page, collect size of every part of html and resources referenced
+        @vars render vars of page, after plugins' on_render_vars
+        @return dict, can be sent to main process by queue, call update_page_weight_size after html generated
+    '''
+    items = list(vars.get("header_items") or []) + list(vars.get("footer_js_items") or [])
+    inline = 0
+    for item in items:
+        for tag, attrs, content in _inline_re.findall(str(item)):
+            inline += _len(content)
+    parts = {
+        "body": _len(vars.get("body")),
+        "toc": _len(vars.get("toc")),
+        "sidebar": _len(vars.get("sidebar_title")) + _len(vars.get("sidebar_items_html")),
+        "navbar": _len([vars.get(k) for k in ["navbar_title", "navbar_main", "navbar_options", "navbar_plugins"]]),
+        "footer": _len(vars.get("footer_top")) + _len(vars.get("footer_bottom")),
+        "plugins_items": _len(items) - inline,
+        "plugins_inline": inline
+    }
+    refs = _find_refs(items) + _find_refs(vars.get("body")) + _find_refs(vars.get("navbar_main")) \
+           + _find_refs(vars.get("footer_top")) + _find_refs(vars.get("footer_bottom"))
+    return {
+        "parts": parts,
+        "refs": list(dict.fromkeys(refs))
+    }
+
+def update_page_weight_size(weight, html):
+    '''
+        @html final html str write to file
+    '''
+    data = html.encode("utf-8")
+    weight["size"] = len(data)
+    weight["gzip"] = gzip_size(data)
+    # layout template and others not count in parts
+    weight["parts"]["template"] = max(0, len(data) - sum(weight["parts"].values()))
+    return weight
+
+def get_resource_type(path):
+    ext = os.path.splitext(path)[1][1:].lower()
+    for name, exts in RESOURCE_TYPES.items():
+        if ext in exts:
+            return name
+    return "other"
+
+
+class Page_Weight_Report:
+    def __init__(self, out_dir, site_root_url, manifest_files, config):
+        '''
+            @out_dir site out dir
+            @manifest_files files of Manifest, to get files' size without read files
+            @config page_weight config of site_config
+        '''
+        self.out_dir = out_dir
+        self.site_root_url = site_root_url
+        self.files = manifest_files
+        self.compressed = config.get("compressed", True)
+        self.budgets = {}
+        for k, v in config.get("budgets", {}).items():
+            if not k in BUDGET_KEYS:
+                raise Exception("page_weight budget key {} error, should be one of {}".format(k, BUDGET_KEYS))
+            if v:
+                self.budgets[k] = parse_size(v)
+        self._resources = {}
+
+    def _resolve(self, ref, page):
+        '''
+            @return path relative to out dir, None if not local file
+        '''
+        url = urlparse(ref)
+        if url.scheme or url.netloc or not url.path or ref.startswith("#"):
+            return None
+        path = unquote(url.path)
+        if path.startswith("/"):
+            rel = path[1:]
+            if not rel in self.files and path.startswith(self.site_root_url):
+                rel = path[len(self.site_root_url):]
+        else:
+            rel = os.path.normpath(os.path.join(os.path.dirname(page), path)).replace("\\", "/")
+        if rel.endswith("/") or rel == "":
+            rel += "index.html"
+        return rel if rel in self.files else None
+
+    def _resource_info(self, rel):
+        '''
+            @return (size, gzip_size, sub resources) of resource, css's fonts and images are sub resources
+        '''
+        if rel in self._resources:
+            return self._resources[rel]
+        size = self.files[rel]["size"]
+        ext = os.path.splitext(rel)[1][1:].lower()
+        gz = size
+        subs = []
+        if (self.compressed and ext in COMPRESSIBLE_TYPES) or ext == "css":
+            with open(os.path.join(self.out_dir, rel), "rb") as f:
+                data = f.read()
+            if self.compressed and ext in COMPRESSIBLE_TYPES:
+                gz = gzip_size(data)
+            if ext == "css":
+                for ref in _css_url_re.findall(data.decode("utf-8", errors="ignore")):
+                    sub = self._resolve(ref.strip(), rel)
+                    if sub and sub != rel:
+                        subs.append(sub)
+        self._resources[rel] = (size, gz, subs)
+        return self._resources[rel]
+
+    def page_report(self, page, weight):
+        '''
+            @page page path relative to out dir
+            @weight collected by collect_page_weight
+        '''
+        resources = {}
+        todo = [r for r in (self._resolve(ref, page) for ref in weight["refs"]) if r]
+        while todo:
+            rel = todo.pop(0)
+            if rel in resources or rel == page:
+                continue
+            size, gz, subs = self._resource_info(rel)
+            resources[rel] = (size, gz)
+            todo.extend(subs)
+        types = {}
+        for rel, (size, gz) in resources.items():
+            t = types.setdefault(get_resource_type(rel), {"count": 0, "size": 0, "gzip": 0})
+            t["count"] += 1
+            t["size"] += size
+            t["gzip"] += gz
+        total = {
+            "size": weight["size"] + sum(v["size"] for v in types.values()),
+            "gzip": weight["gzip"] + sum(v["gzip"] for v in types.values())
+        }
+        key = "gzip" if self.compressed else "size"
+        values = {
+            "total": total[key],
+            "html": weight[key]
+        }
+        for name in RESOURCE_TYPES:
+            values[name] = types[name][key] if name in types else 0
+        exceeded = {}
+        for name, budget in self.budgets.items():
+            if values[name] > budget:
+                exceeded[name] = [values[name], budget]
+        return {
+            "page": page,
+            "total": total,
+            "html": {
+                "size": weight["size"],
+                "gzip": weight["gzip"],
+                "parts": weight["parts"]
+            },
+            "resources": types,
+            "resources_files": sorted(resources.keys()),
+            "exceeded": exceeded
+        }
+
+    def generate(self, page_weights):
+        '''
+            @page_weights {page_path_relative_to_out_dir: weight}
+            @return report dict, pages sorted by total weight
+        '''
+        pages = [self.page_report(page, weight) for page, weight in page_weights.items()]
+        key = "gzip" if self.compressed else "size"
+        pages = sorted(pages, key = lambda v: (-v["total"][key], v["page"]))
+        return {
+            "compressed": self.compressed,
+            "budgets": self.budgets,
+            "pages": pages,
+            "exceeded": [p["page"] for p in pages if p["exceeded"]]
+        }
+
+def log_report(report, log, top = 10):
+    key = "gzip" if report["compressed"] else "size"
+    log.i("page weight{}, top {} heaviest pages:".format(" (gzip estimate)" if report["compressed"] else "", top))
+    for page in report["pages"][:top]:
+        types = ", ".join("{} {}".format(name, format_size(v[key])) for name, v in sorted(page["resources"].items()))
+        log.i("  {:>9} {} (html {}{})".format(format_size(page["total"][key]), page["page"], format_size(page["html"][key]), ", " + types if types else ""))
+    for page in report["pages"]:
+        if page["exceeded"]:
+            log.w("page {} exceed budget: {}".format(page["page"], ", ".join(
+                "{} {} > {}".format(name, format_size(v), format_size(b)) for name, (v, b) in page["exceeded"].items())))
+
+def save_report(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
@@ -0,0 +1,330 @@
+'''
+    cache of plugins' parse result(parsed markdown body, converted notebook), key is hash of file content,
+    file path relative to doc root, plugins and their config, so the same file in different versions(git refs)
+    or on different machines only parsed once.
+    cache is saved to files in `.teedoc_cache/parse`, so sub processes and next build can share it.
+    optional remote cache shared by CI runners, like ccache/sccache, `teedoc build --cache <dir or url>`:
+        dir:  local dir or NFS path
+        url:  http(s) endpoint, GET and PUT `<url>/<key>`, e.g. S3 compatible bucket or `teedoc cache-server`,
+              auth header `Authorization: Bearer $TEEDOC_CACHE_TOKEN` if env set
+    remote is read through(hit saved to local), written behind by a thread, and disabled after first error,
+    build never fails because of cache.
+    cache items are saved as json(dates encoded explicitly), never executable data, items can't be encoded are not cached.
+    `teedoc cache-server` need env TEEDOC_CACHE_TOKEN unless listen on loopback address.
+'''
+
+import os
+import json
+import hashlib
+import datetime
+import threading
+
+PARSE_CACHE_VERSION = 3
+# seconds of every remote request
+REMOTE_TIMEOUT = 5
+
+
+class Dir_Backend:
+    def __init__(self, path):
+        self.path = path
+
+    def _path(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def get(self, key):
+        '''
+            @return bytes or None if not exists
+        '''
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "{}.{}.{}".format(path, os.getpid(), threading.get_ident())
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def __str__(self):
+        return self.path
+
+
+class HTTP_Backend:
+    def __init__(self, url):
+        self.url = url if url.endswith("/") else url + "/"
+        self.headers = {}
+        token = os.environ.get("TEEDOC_CACHE_TOKEN")
+        if token:
+            self.headers["Authorization"] = "Bearer {}".format(token)
+
+    def get(self, key):
+        from urllib.request import Request, urlopen
+        from urllib.error import HTTPError
+        try:
+            with urlopen(Request(self.url + key, headers=self.headers), timeout=REMOTE_TIMEOUT) as res:
+                return res.read()
+        except HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    def put(self, key, data):
+        from urllib.request import Request, urlopen
+        headers = {"Content-Type": "application/octet-stream"}
+        headers.update(self.headers)
+        with urlopen(Request(self.url + key, data=data, headers=headers, method="PUT"), timeout=REMOTE_TIMEOUT) as res:
+            res.read()
+
+    def __str__(self):
+        return self.url
+
+def _encode(obj):
+    if isinstance(obj, datetime.datetime):
+        return {"__datetime__": obj.isoformat()}
+    if isinstance(obj, datetime.date):
+        return {"__date__": obj.isoformat()}
+    raise TypeError("{} can not be cached".format(type(obj)))
+
+def _decode(obj):
+    if len(obj) == 1:
+        if "__datetime__" in obj:
+            return datetime.datetime.fromisoformat(obj["__datetime__"])
+        if "__date__" in obj:
+            return datetime.date.fromisoformat(obj["__date__"])
+    return obj
+
+def dumps(value):
+    '''
+        @return bytes, or None if value can't be encoded to json exactly(e.g. objects, tuples, not str keys)
+    '''
+    try:
+        data = json.dumps(value, default=_encode, ensure_ascii=False).encode("utf-8")
+    except (TypeError, ValueError):
+        return None
+    if loads(data) != value:
+        return None
+    return data
+
+def loads(data):
+    return json.loads(data.decode("utf-8"), object_hook=_decode)
+
+def is_loopback(host):
+    return host in ["localhost", "::1"] or host.startswith("127.")
+
+def get_backend(uri):
+    if uri.startswith("http://") or uri.startswith("https://"):
+        return HTTP_Backend(uri)
+    return Dir_Backend(os.path.abspath(uri))
+
+
+class Parse_Cache:
+    def __init__(self, cache_dir, remote = None, log = None):
+        '''
+            @cache_dir local cache dir
+            @remote remote backend object, or None
+        '''
+        self.local = Dir_Backend(cache_dir)
+        self.remote = remote
+        self.log = log
+        self.remote_ok = True
+        self.plugins_hash = {}
+        # write behind queue, thread created in the process put items, sub process need its own
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        # stats of all workers, updated by main process
+        self.stats = {"hits": 0, "misses": 0, "remote_hits": 0}
+
+    def _plugin_hash(self, plugin):
+        '''
+            hash of plugin source files, so local plugin under development invalidate cache when code changed,
+            and installed plugin get the same hash on different machines
+        '''
+        path = getattr(plugin, "module_path", None)
+        if not path:
+            return None
+        if path not in self.plugins_hash:
+            sha = hashlib.sha256()
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+                for name in sorted(files):
+                    if name.endswith(".py"):
+                        sha.update(os.path.relpath(os.path.join(root, name), path).encode("utf-8"))
+                        with open(os.path.join(root, name), "rb") as f:
+                            sha.update(f.read())
+            self.plugins_hash[path] = sha.hexdigest()
+        return self.plugins_hash[path]
+
+    def get_salt(self, plugin_func, plugins_objs, doc_config):
+        '''
+            parse result depends on plugins, plugins' config and doc config, calculate once for all files of route
+        '''
+        try:
+            from .version import __version__
+        except Exception:
+            from version import __version__
+        # dates fall back to SOURCE_DATE_EPOCH in reproducible build
+        items = [PARSE_CACHE_VERSION, __version__, plugin_func, doc_config, os.environ.get("SOURCE_DATE_EPOCH")]
+        for plugin in plugins_objs:
+            items.append([plugin.name, self._plugin_hash(plugin), plugin.config])
+        return hashlib.sha256(json.dumps(items, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get_key(self, file, rel_path, salt):
+        sha = hashlib.sha256(salt.encode("utf-8"))
+        sha.update(rel_path.encode("utf-8"))
+        with open(file, "rb") as f:
+            sha.update(f.read())
+        return sha.hexdigest()
+
+    def _remote_error(self, op, e):
+        if self.remote_ok:
+            self.remote_ok = False
+            if self.log:
+                self.log.w("remote cache {} {} fail, not use remote cache any more: {}".format(self.remote, op, e))
+
+    def get(self, key, stats = None):
+        '''
+            @stats dict, count hits, misses and remote_hits to it
+            @return [html, is_draft, producer] or None if not cached
+        '''
+        data = None
+        try:
+            data = self.local.get(key)
+        except Exception:
+            pass
+        from_remote = False
+        if data is None and self.remote and self.remote_ok:
+            try:
+                data = self.remote.get(key)
+                from_remote = data is not None
+            except Exception as e:
+                self._remote_error("get", e)
+        value = None
+        if data is not None:
+            try:
+                value = loads(data)
+            except Exception:
+                value = None
+        if stats is not None:
+            stats["hits" if value is not None else "misses"] += 1
+            if value is not None and from_remote:
+                stats["remote_hits"] += 1
+        if value is not None and from_remote:
+            try:
+                self.local.put(key, data)
+            except Exception:
+                pass
+        return value
+
+    def put(self, key, value):
+        data = dumps(value)
+        if data is None:
+            # value can't be encoded, e.g. plugin put object in html item, just not cache
+            return
+        try:
+            self.local.put(key, data)
+        except Exception:
+            pass
+        if self.remote and self.remote_ok:
+            self._write_behind(key, data)
+
+    def _write_behind(self, key, data):
+        if self._pid != os.getpid():
+            import queue
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._write_loop, args=(self._queue,), daemon=True)
+            self._thread.start()
+        self._queue.put((key, data))
+
+    def _write_loop(self, q):
+        while True:
+            key, data = q.get()
+            try:
+                if self.remote_ok:
+                    self.remote.put(key, data)
+            except Exception as e:
+                self._remote_error("put", e)
+            finally:
+                q.task_done()
+
+    def flush(self):
+        '''
+            wait remote writes of this process finished, call before process exit
+        '''
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def add_stats(self, stats):
+        for k, v in stats.items():
+            self.stats[k] += v
+
+    def summary(self):
+        info = "parse cache: {} hits, {} misses".format(self.stats["hits"], self.stats["misses"])
+        if self.remote:
+            info += ", {} hits from remote {}{}".format(self.stats["remote_hits"], self.remote, "" if self.remote_ok else "(unreachable)")
+        return info
+
+
+def serve_cache(path, host, port, log):
+    '''
+        simple http cache server, GET and PUT files in path, stand-in of remote cache for local network or tests
+        @return False if can't start, or serve forever
+    '''
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    backend = Dir_Backend(path)
+    token = os.environ.get("TEEDOC_CACHE_TOKEN")
+    if not token:
+        if not is_loopback(host):
+            log.e("env TEEDOC_CACHE_TOKEN not set, anyone can access {} can write cache, set it or listen on 127.0.0.1".format(host))
+            return False
+        log.w("env TEEDOC_CACHE_TOKEN not set, only listen on loopback address {}".format(host))
+
+    class Handler(BaseHTTPRequestHandler):
+        def _key(self):
+            if token and self.headers.get("Authorization") != "Bearer {}".format(token):
+                self.send_response(401)
+                self.end_headers()
+                return None
+            key = self.path.strip("/").split("?")[0]
+            if len(key) < 3 or not all(c in "0123456789abcdef" for c in key):
+                self.send_response(400)
+                self.end_headers()
+                return None
+            return key
+
+        def do_GET(self):
+            key = self._key()
+            if not key:
+                return
+            data = backend.get(key)
+            if data is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_PUT(self):
+            key = self._key()
+            if not key:
+                return
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            backend.put(key, data)
+            self.send_response(201)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            log.d(format % args)
+
+    os.makedirs(path, exist_ok=True)
+    server = ThreadingHTTPServer((host, port), Handler)
+    log.i("cache server dir: {}".format(path))
+    log.i("Starting cache server at {}:{} ....".format(host, port))
+    server.serve_forever()
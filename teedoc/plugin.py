@@ -1,5 +1,105 @@
 import os
+import time
 import tempfile
+import shutil
+import getpass
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    from .vendor import get_vendor_files
+except Exception:
+    from vendor import get_vendor_files
+
+# assets cache is LRU, entries not used for max age or over max entries are removed by prune_assets_cache,
+# entries used in min age are always kept, other builds on the same machine may be using them
+ASSETS_CACHE_MAX_AGE = 7 * 24 * 3600
+ASSETS_CACHE_MAX_ENTRIES = 1000
+ASSETS_CACHE_MIN_AGE = 3600
+
+_assets_cache_dir = None
+
+
+def get_assets_cache_dir():
+    '''
+        per user dir in temp dir, shared by builds of the same user,
+        or a new temp dir if it can't be created or not owned by current user(e.g. shared CI machine)
+    '''
+    global _assets_cache_dir
+    if _assets_cache_dir is None:
+        try:
+            uid = os.getuid() if hasattr(os, "getuid") else getpass.getuser()
+            path = os.path.join(tempfile.gettempdir(), "teedoc_assets_cache_{}".format(uid))
+            os.makedirs(path, mode=0o700, exist_ok=True)
+            if (hasattr(os, "getuid") and os.stat(path).st_uid != uid) or not os.access(path, os.W_OK):
+                raise PermissionError("{} not owned by current user".format(path))
+        except Exception:
+            path = tempfile.mkdtemp(prefix="teedoc_assets_cache_")
+        _assets_cache_dir = path
+    return _assets_cache_dir
+
+def prune_assets_cache(cache_dir = None, max_age = ASSETS_CACHE_MAX_AGE, max_entries = ASSETS_CACHE_MAX_ENTRIES):
+    '''
+        remove entries not used for max_age, and least recently used entries over max_entries
+        @return int, removed entries number
+    '''
+    if not cache_dir:
+        cache_dir = get_assets_cache_dir()
+    try:
+        names = os.listdir(cache_dir)
+    except FileNotFoundError:
+        return 0
+    entries = []
+    for name in names:
+        try:
+            entries.append((os.stat(os.path.join(cache_dir, name)).st_mtime, name))
+        except FileNotFoundError:
+            continue
+    entries.sort(reverse=True)
+    now = time.time()
+    removed = 0
+    for i, (mtime, name) in enumerate(entries):
+        age = now - mtime
+        if age > ASSETS_CACHE_MIN_AGE and (age > max_age or i >= max_entries):
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+def render_file_var(path, vars, cache_dir = None):
+    '''
+        replace `${var}` in file with vars, rendered file saved to cache dir named by hash of (file content, name, vars),
+        so the same file only rendered once even across builds, files are written to temp file then renamed
+        @path source file abs path
+        @vars dict, value None will be replaced with "null"
+        @cache_dir default get_assets_cache_dir()
+        @return rendered file path, file name is the same as source file
+    '''
+    if not cache_dir:
+        cache_dir = get_assets_cache_dir()
+    path = os.path.abspath(path)
+    vars = sorted((k.strip(), "null" if v is None else str(v)) for k, v in vars.items())
+    with open(path, "rb") as f:
+        data = f.read()
+    sha = hashlib.sha256(data)
+    sha.update("\n{}\n{}".format(os.path.basename(path), repr(vars)).encode("utf-8"))
+    out_path = os.path.join(cache_dir, sha.hexdigest()[:32], os.path.basename(path))
+    if os.path.exists(out_path):
+        # mark used for LRU prune
+        try:
+            os.utime(os.path.dirname(out_path))
+        except OSError:
+            pass
+        return out_path
+    content = data.decode("utf-8")
+    for k, v in vars:
+        content = content.replace("${}{}{}".format("{", k, "}"), v)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = "{}.{}.{}".format(out_path, os.getpid(), threading.get_ident())
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, out_path)
+    return out_path
 
 class Plugin_Base:
     '''
@@ -14,7 +114,8 @@ class Plugin_Base:
                 on_html_template_i18n_dir
                     (new multiprocess or threads)
                     on_new_process_init (only multiprocess)
-                    on_parse_files / on_parse_pages / on_parse_blog
+                    iter_parse_files / iter_parse_pages / iter_parse_blog
+                        (default call on_parse_files / on_parse_pages / on_parse_blog)
                     on_js_vars
                     on_add_navbar_items
                     on_render_vars
@@ -23,6 +124,10 @@ class Plugin_Base:
             on_htmls
             on_copy_files
             on_del
+        `teedoc vendor` command only call:
+            __init__
+            on_init
+            on_vendor_assets
             __del__
     '''
     name = "markdown-plugin"
@@ -40,6 +145,7 @@ class Plugin_Base:
                           but thread mode them share the memory, so, be careful to use variables in new threads or new process
         '''
         self._pid = os.getpid()
+        self._doc_src_path = doc_src_path
         self.on_init(config, doc_src_path, site_config, logger, multiprocess = multiprocess, **kw_args)
 
     def on_init(self, config, doc_src_path, site_config, logger, multiprocess = True, **kw_args):
@@ -79,6 +185,18 @@ class Plugin_Base:
         '''
         return {}
 
+    def on_vendor_assets(self):
+        '''
+            third-party assets(e.g. js libs on CDN) used by this plugin, `teedoc vendor` command fetch them to local cache,
+            then use `self.get_vendor_files(name)` to get local files and copy them to out dir instead of using CDN,
+            asset format see teedoc/vendor.py
+            @return list, e.g. [{
+                        "name": "mermaid",
+                        "url": "https://cdn.jsdelivr.net/npm/mermaid@9/dist/mermaid.min.js"
+                    }]
+        '''
+        return []
+
     def on_htmls(self, htmls_files, htmls_pages, htmls_blog=None):
         '''
             update htmls, may not all html, just partially, DO NOT change params' value, read only, or will lead to other plugins error
@@ -119,6 +237,8 @@ class Plugin_Base:
         # DO NOT implement this function, use on_end() instead !!!!!! this functioin may be called multi times
         if os.getpid() == self._pid:
             self.on_del()
+            if getattr(self, "_temp_dir_auto", None) and os.path.exists(self._temp_dir_auto):
+                shutil.rmtree(self._temp_dir_auto, ignore_errors=True)
 
     def on_del(self):
         pass
@@ -249,6 +369,32 @@ class Plugin_Base:
     def on_parse_blog(self, pages):
         return None
 
+    def iter_parse_files(self, files):
+        '''
+            generator version of on_parse_files, yield (file_path, record) for every file in `files`,
+            in the same order of `files`, so teedoc can render and write one page while parsing the next,
+            record can be:
+                dict:  parsed result, same as one item of "htmls" returned by on_parse_files
+                None:  file not parsed by this plugin
+                False: draft file, will not be rendered or copied
+            raise Exception if parse fail.
+            default call on_parse_files and yield items of the result,
+            override this function to parse files one by one and save memory
+        '''
+        yield from self._iter_parse_result(self.on_parse_files(files), files, "on_parse_files")
+
+    def iter_parse_pages(self, pages):
+        '''
+            generator version of on_parse_pages, see iter_parse_files
+        '''
+        yield from self._iter_parse_result(self.on_parse_pages(pages), pages, "on_parse_pages")
+
+    def iter_parse_blog(self, pages):
+        '''
+            generator version of on_parse_blog, see iter_parse_files
+        '''
+        yield from self._iter_parse_result(self.on_parse_blog(pages), pages, "on_parse_blog")
+
     def on_add_navbar_items(self):
         '''
             @return list items(navbar item, e.g. "<a href=></a>")
@@ -273,22 +419,62 @@ class Plugin_Base:
     ############### run in new process end ######################
 
     ####################### utils ###############################
-    def update_file_var(self, files, vars, temp_dir):
+    def _iter_parse_result(self, result, files, func_name):
+        '''
+            adapter from on_parse_* result dict to iter_parse_* items
+        '''
+        if not result:
+            for file in files:
+                yield file, None
+            return
+        if not result['ok']:
+            raise Exception("plugin <{}> {} error: {}".format(self.name, func_name, result['msg']))
+        drafts = set(result.get("drafts", []))
+        htmls = result['htmls']
+        for file in files:
+            if file in drafts:
+                yield file, False
+            else:
+                yield file, htmls.get(file)
+
+    def collect_parse_result(self, items):
+        '''
+            collect iter_parse_* items to on_parse_* result dict,
+            for plugins implement iter_parse_* and keep on_parse_* API
+        '''
+        result = {
+            "ok": False,
+            "msg": "",
+            "htmls": OrderedDict(),
+            "drafts": []
+        }
+        for file, html in items:
+            if html is False:
+                result["drafts"].append(file)
+            else:
+                result["htmls"][file] = html
+        result['ok'] = True
+        return result
+
+    def update_file_var(self, files, vars, temp_dir = None):
+        '''
+            replace `${var}` of files with vars, see render_file_var
+            @files {url: file_abs_path}, path will be updated to rendered file path
+            @temp_dir not used any more, rendered files are saved in assets cache dir
+        '''
         for url, path in files.items():
-            with open(path, encoding='utf-8') as f:
-                content = f.read()
-                for k, v in vars.items():
-                    if v is None:
-                        v = "null"
-                    content = content.replace("${}{}{}".format("{", k.strip(), "}"), str(v))
-                temp_path = os.path.join(temp_dir, os.path.basename(path))
-                with open(temp_path, "w", encoding='utf-8') as fw:
-                    fw.write(content)
-                files[url] = temp_path
+            files[url] = render_file_var(path, vars)
         return files
 
+    def get_vendor_files(self, name):
+        '''
+            @name name of asset returned by on_vendor_assets
+            @return dict, {rel_path: abs_path} files of asset fetched by `teedoc vendor`, None if not vendored
+        '''
+        return get_vendor_files(self._doc_src_path, name)
+
     def get_temp_dir(self):
-        self.temp_dir = os.path.join(tempfile.gettempdir(), self.name)
-        if not os.path.exists(self.temp_dir):
-            os.makedirs(self.temp_dir)
+        if not getattr(self, "temp_dir", None) or not os.path.exists(self.temp_dir):
+            self.temp_dir = tempfile.mkdtemp(prefix="{}_".format(self.name))
+            self._temp_dir_auto = self.temp_dir
         return self.temp_dir
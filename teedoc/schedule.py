@@ -0,0 +1,176 @@
+'''
+    cost aware schedule of files to workers(sub processes or threads),
+    split files to chunks by estimated cost instead of files count, so one chunk of heavy files(e.g. big ipynb)
+    won't be the straggler while other workers are idle.
+    cost of file is estimated by time recorded in last build(scaled by file size change),
+    or by file size and file type if file not built before,
+    timings are saved to `.teedoc_cache/timings.json` in doc root dir, e.g.
+    {
+        "version": 1,
+        "files": {
+            "docs/get_started/zh/README.md": {
+                "size": 1234,
+                "time": 0.012
+            }
+        }
+    }
+'''
+
+import os
+import json
+import heapq
+import threading
+
+CACHE_DIR_NAME = ".teedoc_cache"
+TIMINGS_NAME = "timings.json"
+TIMINGS_VERSION = 1
+
+# (base seconds, seconds per byte) of file types not built before, will be corrected by recorded timings
+DEFAULT_COSTS = {
+    "md": (0.002, 1e-6),
+    "ipynb": (0.02, 2e-6),
+    "html": (0.001, 2e-7),
+    "": (0.0002, 1e-9)     # not parsed files, just copy
+}
+
+
+def get_cache_dir(doc_src_path):
+    return os.path.join(doc_src_path, CACHE_DIR_NAME)
+
+def _file_type(path):
+    ext = os.path.splitext(path)[1][1:].lower()
+    return ext if ext in DEFAULT_COSTS else ""
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except Exception:
+        return 0
+
+
+class Timings:
+    def __init__(self, doc_src_path):
+        self.doc_src_path = doc_src_path
+        self.path = os.path.join(get_cache_dir(doc_src_path), TIMINGS_NAME)
+        self.files = {}
+        self.updated = {}
+        self.routes = []
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                timings = json.load(f)
+            if timings.get("version") == TIMINGS_VERSION:
+                self.files = timings["files"]
+        except Exception:
+            self.files = {}
+        self.costs = self._fit_costs()
+
+    def _rel(self, path):
+        return os.path.relpath(path, self.doc_src_path).replace("\\", "/")
+
+    def _fit_costs(self):
+        '''
+            correct seconds per byte of every file type by recorded timings, base cost keep default
+        '''
+        costs = dict(DEFAULT_COSTS)
+        totals = {}
+        for path, item in self.files.items():
+            t = _file_type(path)
+            time_total, size_total = totals.get(t, (0, 0))
+            totals[t] = (time_total + max(0, item["time"] - costs[t][0]), size_total + item["size"])
+        for t, (time_total, size_total) in totals.items():
+            if size_total > 0:
+                costs[t] = (costs[t][0], time_total / size_total)
+        return costs
+
+    def estimate(self, path, size = None):
+        '''
+            @return estimated seconds to build file
+        '''
+        if size is None:
+            size = _size(path)
+        item = self.files.get(self._rel(path))
+        base, per_byte = self.costs[_file_type(path)]
+        if item:
+            # file changed, scale the part of time related to size
+            return item["time"] + (size - item["size"]) * per_byte
+        return base + size * per_byte
+
+    def partition(self, files, n):
+        '''
+            split files to n chunks, longest processing time first, every time give the most costly file
+            to the chunk with least total cost.
+            files in every chunk keep the origin order
+            @return list of (files list, estimated cost)
+        '''
+        costs = {path: max(self.estimate(path), 0) for path in files}
+        bins = [(0, i) for i in range(min(n, len(files)))]
+        heapq.heapify(bins)
+        chunks = [[] for _ in bins]
+        totals = [0] * len(bins)
+        for path in sorted(files, key = lambda v: -costs[v]):
+            total, i = heapq.heappop(bins)
+            chunks[i].append(path)
+            totals[i] = total + costs[path]
+            heapq.heappush(bins, (totals[i], i))
+        order = {path: i for i, path in enumerate(files)}
+        return [(sorted(chunk, key = lambda v: order[v]), total) for chunk, total in zip(chunks, totals) if chunk]
+
+    def update(self, file_times):
+        '''
+            @file_times {file_abs_path: seconds}, recorded by workers
+        '''
+        with self.lock:
+            self.updated.update(file_times)
+
+    def add_route(self, url, estimated, elapsed):
+        '''
+            record load balance of one route built by multiple workers
+            @estimated list, estimated cost of every worker
+            @elapsed list, real time of every worker
+        '''
+        with self.lock:
+            self.routes.append({"url": url, "estimated": estimated, "elapsed": elapsed})
+
+    def save(self):
+        '''
+            merge timings of this build to last build's and save atomically, files not exist any more are removed
+        '''
+        with self.lock:
+            files = {}
+            for path, item in self.files.items():
+                if os.path.exists(os.path.join(self.doc_src_path, path)):
+                    files[path] = item
+            for path, t in self.updated.items():
+                files[self._rel(path)] = {"size": _size(path), "time": round(t, 6)}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = "{}.{}.{}".format(self.path, os.getpid(), threading.get_ident())
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": TIMINGS_VERSION, "files": files}, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.files = files
+            self.updated = {}
+
+    def log_balance(self, log, top = 5):
+        '''
+            log load imbalance(busiest worker time / mean worker time) of routes built by multiple workers
+        '''
+        if not self.routes:
+            return
+        idle = 0
+        total = 0
+        items = []
+        for route in self.routes:
+            elapsed = route["elapsed"]
+            busiest = max(elapsed)
+            mean = sum(elapsed) / len(elapsed)
+            idle += sum(busiest - t for t in elapsed)
+            total += busiest * len(elapsed)
+            items.append((busiest - mean, route["url"], len(elapsed), busiest, mean, busiest / mean if mean > 0 else 1))
+        log.i("load balance of workers, {:.1f}% of worker time idle".format(idle * 100 / total if total > 0 else 0))
+        for waste, url, n, busiest, mean, imbalance in sorted(items, reverse = True)[:top]:
+            log.i("  {}: {} workers, busiest {:.2f}s, mean {:.2f}s, imbalance {:.2f}".format(url, n, busiest, mean, imbalance))
+        self.routes = []
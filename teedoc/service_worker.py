@@ -0,0 +1,89 @@
+'''
+    generate service worker `sw.js` to site root when build, so pages can be read on bad network or offline.
+    theme assets, css and search index are precached when service worker installed, revision of every file
+    is sha256 in build manifest, `sw.js` only changes when precached files changed, and clients only download
+    changed files; pages are cached when visited, stale-while-revalidate, offline page shown if page not cached.
+
+    config in site_config, or use `teedoc build --service-worker` to enable with default config:
+    "service_worker": {
+        "precache": ["static/js/theme_default/*", "*.css", "static/search_index/*.json"], # default, glob relative to site root
+        "exclude": [],             # files not precache, glob
+        "offline_page": "404.html" # default 404.html
+    }
+'''
+
+import os
+import json
+from fnmatch import fnmatchcase
+
+try:
+    from .out_store import unlink_if_linked
+except Exception:
+    from out_store import unlink_if_linked
+
+SW_NAME = "sw.js"
+DEFAULT_PRECACHE = ["static/js/theme_default/*", "*.css", "static/search_index/*.json"]
+DEFAULT_OFFLINE_PAGE = "404.html"
+
+
+def get_service_worker_config(site_config):
+    '''
+        @return dict, or None if not enabled
+    '''
+    config = site_config.get("service_worker")
+    if config is None or config is False:
+        return None
+    if config is True:
+        config = {}
+    if type(config) != dict:
+        raise Exception("service_worker config should be dict or bool")
+    return config
+
+def get_register_script(site_root_url):
+    return '<script>if("serviceWorker" in navigator){{navigator.serviceWorker.register("{}{}")}}</script>'.format(site_root_url, SW_NAME)
+
+def get_precache_files(files, config):
+    '''
+        @files manifest files, {rel_path: entry}
+        @return list, [[rel_path, revision]], sorted
+    '''
+    patterns = config.get("precache", DEFAULT_PRECACHE)
+    excludes = config.get("exclude", [])
+    offline_page = config.get("offline_page", DEFAULT_OFFLINE_PAGE)
+    result = []
+    for rel in sorted(files):
+        if rel == SW_NAME:
+            continue
+        if rel != offline_page:
+            if not any(fnmatchcase(rel, p) for p in patterns) or any(fnmatchcase(rel, p) for p in excludes):
+                continue
+        result.append([rel, files[rel]["sha256"][:16]])
+    return result
+
+def generate_service_worker(config, site_root_url, out_dir, manifest, log):
+    '''
+        @manifest Manifest object, should be synced, sw.js is added to it
+        @return bool, True if sw.js changed
+    '''
+    precache = get_precache_files(manifest.files, config)
+    curr_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(curr_dir, "static", "js", SW_NAME), encoding="utf-8") as f:
+        content = f.read()
+    offline_page = config.get("offline_page", DEFAULT_OFFLINE_PAGE)
+    items = "[\n{}\n]".format(",\n".join("    " + json.dumps([site_root_url + rel, rev]) for rel, rev in precache))
+    content = content.replace("__ROOT__", json.dumps(site_root_url)).replace(
+                "__PRECACHE__", items).replace(
+                "__OFFLINE_PAGE__", json.dumps(site_root_url + offline_page if offline_page in manifest.files else None))
+    out_path = os.path.join(out_dir, SW_NAME)
+    changed = True
+    if os.path.exists(out_path):
+        with open(out_path, encoding="utf-8") as f:
+            changed = f.read() != content
+    # not rewrite if not changed, so browsers not update service worker
+    if changed:
+        unlink_if_linked(out_path)
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(content)
+    manifest.add(out_path, content = content)
+    log.i("generate service worker, {} files precached{}".format(len(precache), "" if changed else ", not changed"))
+    return changed
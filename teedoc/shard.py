@@ -0,0 +1,373 @@
+'''
+    split `teedoc build` to shards and merge shards' output,
+    e.g. build on 8 machines by `teedoc build --shard 1/8` ... `teedoc build --shard 8/8`,
+    then copy all shards dirs to one machine and run `teedoc merge`
+    scoped build(`teedoc build --only /develop/zh/ --locale zh`) only build some routes to out dir of last build,
+    sitemap.xml, search index and blog index are merged with outputs of last build
+'''
+
+import os
+import re
+import json
+import shutil
+from urllib.parse import urlparse
+from collections import OrderedDict
+try:
+    from .manifest import Manifest, MANIFEST_NAME, load_manifest
+    from .out_store import unlink_if_linked
+except Exception:
+    from manifest import Manifest, MANIFEST_NAME, load_manifest
+    from out_store import unlink_if_linked
+
+# outputs generated from all pages, relative to site out dir, scoped build merge them with last build
+SCOPED_MERGE_FILES = ["sitemap.xml", "static/search_index", "static/blog_index/index.json"]
+
+def parse_shard_arg(shard):
+    '''
+        @shard str, e.g. "3/8"
+        @return (3, 8), index start from 1
+    '''
+    try:
+        index, total = shard.split("/")
+        index = int(index)
+        total = int(total)
+    except Exception:
+        raise Exception('shard arg format error: "{}", should be like "3/8"'.format(shard))
+    if total < 1 or index < 1 or index > total:
+        raise Exception('shard arg error: "{}", index should be in range [1, {}]'.format(shard, total))
+    return index, total
+
+def get_shard_dir(shards_dir, index, total):
+    return os.path.join(shards_dir, "{}-{}".format(index, total)).replace("\\", "/")
+
+def _get_route_urls(site_config):
+    '''
+        @return list, [(type_name, url)] of routes and translates
+    '''
+    urls = []
+    for type_name in ["docs", "pages", "blog", "assets"]:
+        for url in site_config["route"].get(type_name, {}):
+            urls.append((type_name, url))
+    for type_name in ["docs", "pages"]:
+        for src, items in site_config.get("translate", {}).get(type_name, {}).items():
+            for item in items:
+                urls.append((type_name, item["url"]))
+    return urls
+
+def _locale_match(locale, locales):
+    '''
+        "zh" match "zh_CN" and "zh", "zh_CN" only match "zh_CN"
+        @locale locale of doc config, can have display name, e.g. "zh_CN:中文"
+    '''
+    if not locale:
+        return False
+    locale = locale.split(":")[0].replace("-", "_").lower()
+    for l in locales:
+        l = l.replace("-", "_").lower()
+        if locale == l or ("_" not in l and locale.split("_")[0] == l):
+            return True
+    return False
+
+def get_scoped_urls(site_config, only, locales, url_locales):
+    '''
+        urls of scoped build, selected routes and their translates, filtered by locales
+        @site_config site config, routes should be updated by check_udpate_routes first
+        @only list, route urls, e.g. ["/develop/zh/"], empty means all docs, pages and blog
+        @locales list, e.g. ["zh"], empty means all locales
+        @url_locales dict, {url: locale} of docs, pages and blog routes and translates
+        @return set
+    '''
+    route_urls = _get_route_urls(site_config)
+    if only:
+        all_urls = set(url for type_name, url in route_urls)
+        urls = set()
+        for url in only:
+            url = "/{}/".format(url.strip("/")) if url.strip("/") else "/"
+            if not url in all_urls:
+                raise Exception("url {} not in route or translate of site_config, should be one of {}".format(url, sorted(all_urls)))
+            urls.add(url)
+            for type_name in ["docs", "pages"]:
+                for item in site_config.get("translate", {}).get(type_name, {}).get(url, []):
+                    urls.add(item["url"])
+    else:
+        urls = set(url for type_name, url in route_urls if type_name != "assets")
+    if locales:
+        # assets have no locale, keep them if selected
+        assets_urls = set(url for type_name, url in route_urls if type_name == "assets")
+        urls = set(url for url in urls if url in assets_urls or _locale_match(url_locales.get(url), locales))
+    return urls
+
+def get_shard_urls(site_config, index, total):
+    '''
+        assign every url of routes and translates to shards, by round robin of sorted urls,
+        so every machine get the same result
+        @site_config site config, routes should be updated by check_udpate_routes first
+        @return set, urls this shard should build
+    '''
+    urls = sorted(set(_get_route_urls(site_config)))
+    shard_urls = set()
+    for i, (type_name, url) in enumerate(urls):
+        if i % total == index - 1:
+            shard_urls.add(url)
+    return shard_urls
+
+def get_shards_dirs(shards_dir):
+    '''
+        @return list, all shards dirs of last sharded build, sorted by shard index
+        raise Exception if some shards not found
+    '''
+    if not os.path.exists(shards_dir):
+        raise Exception("shards dir {} not found".format(shards_dir))
+    shards = []
+    for name in os.listdir(shards_dir):
+        match = re.match(r"^(\d+)-(\d+)$", name)
+        if match and os.path.isdir(os.path.join(shards_dir, name)):
+            shards.append((int(match[2]), int(match[1]), name))
+    if not shards:
+        raise Exception("no shard found in {}".format(shards_dir))
+    totals = set(total for total, index, name in shards)
+    if len(totals) > 1:
+        raise Exception("shards dir {} contains shards of different total number: {}".format(shards_dir, sorted(totals)))
+    total = totals.pop()
+    indexes = set(index for total, index, name in shards)
+    lost = [i for i in range(1, total + 1) if i not in indexes]
+    if lost:
+        raise Exception("shards {} of {} not found in {}".format(lost, total, shards_dir))
+    shards = sorted(shards)
+    return [os.path.join(shards_dir, name).replace("\\", "/") for total, index, name in shards]
+
+def _read_sitemap(path):
+    '''
+        @return (head, items), items is OrderedDict, {loc: item}
+    '''
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    idx = content.find("<url>")
+    head = (content[:idx] if idx >= 0 else content[:content.find("</urlset>")]).rstrip(" ")
+    items = OrderedDict()
+    for item in re.findall(r"<url>.*?</url>", content, flags=re.S):
+        loc = re.findall(r"<loc>(.*?)</loc>", item, flags=re.S)
+        items[loc[0].strip() if loc else item] = item
+    return head, items
+
+def _write_sitemap(head, items, out_path):
+    tail = '</urlset>\r\n'
+    unlink_if_linked(out_path)
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(head)
+        for item in items.values():
+            f.write("    {}\n    ".format(item))
+        f.write(tail)
+
+def _merge_sitemap(paths, out_path):
+    head = None
+    items = OrderedDict()
+    for path in paths:
+        _head, _items = _read_sitemap(path)
+        if head is None:
+            head = _head
+        items.update(_items)
+    _write_sitemap(head, items, out_path)
+
+def _read_search_index(index_dir):
+    '''
+        @return OrderedDict, {doc_url: [name, sub_index_path]}
+    '''
+    with open(os.path.join(index_dir, "index.json"), encoding="utf-8") as f:
+        index = json.load(f, object_pairs_hook=OrderedDict)
+    return OrderedDict((doc_url, [name, os.path.join(index_dir, os.path.basename(sub_url))]) for doc_url, (name, sub_url) in index.items())
+
+def _write_search_index(items, out_index_dir, site_root_url):
+    '''
+        number sub index files from 0 and write index.json
+        @items {doc_url: [name, sub_index_path]}
+    '''
+    index_content = OrderedDict()
+    os.makedirs(out_index_dir, exist_ok=True)
+    for count, (doc_url, (name, sub_path)) in enumerate(items.items()):
+        sub_name = "index_{}.json".format(count)
+        unlink_if_linked(os.path.join(out_index_dir, sub_name))
+        shutil.copyfile(sub_path, os.path.join(out_index_dir, sub_name))
+        index_content[doc_url] = [name, "{}static/search_index/{}".format(site_root_url, sub_name)]
+    unlink_if_linked(os.path.join(out_index_dir, "index.json"))
+    with open(os.path.join(out_index_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index_content, f, ensure_ascii=False, separators=(',', ':'))
+
+def _merge_search_index(shards_index_dirs, out_index_dir, site_root_url):
+    '''
+        every shard numbers its sub index files from 0, renumber them and update urls in index.json
+    '''
+    items = OrderedDict()
+    for index_dir in shards_index_dirs:
+        items.update(_read_search_index(index_dir))
+    _write_search_index(items, out_index_dir, site_root_url)
+
+def _write_blog_index(items, out_path):
+    index_content = {
+        "items": OrderedDict(sorted(items.items(), key=lambda v: v[1]["ts"], reverse=True))
+    }
+    unlink_if_linked(out_path)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(index_content, f, ensure_ascii=False)
+
+def _merge_blog_index(paths, out_path):
+    items = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            items.update(json.load(f)["items"])
+    _write_blog_index(items, out_path)
+
+def save_scoped_outputs(out_dir, save_dir):
+    '''
+        save outputs of last build need merge before scoped build, build overwrite or remove them
+        @out_dir out dir of site, e.g. /home/xxx/site/out/teedoc/
+        @return bool, False if no output of last build
+    '''
+    found = False
+    for rel in SCOPED_MERGE_FILES:
+        src = os.path.join(out_dir, rel)
+        dst = os.path.join(save_dir, rel)
+        if os.path.isdir(src):
+            shutil.copytree(src, dst)
+        elif os.path.exists(src):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(src, dst)
+        else:
+            continue
+        found = True
+    return found
+
+def _restore(save_dir, out_dir, rel):
+    src = os.path.join(save_dir, rel)
+    dst = os.path.join(out_dir, rel)
+    if os.path.isdir(src):
+        shutil.copytree(src, dst)
+    else:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copyfile(src, dst)
+
+def merge_scoped_outputs(save_dir, out_dir, site_config, scoped_urls, log):
+    '''
+        merge outputs of scoped build with outputs of last build saved by save_scoped_outputs,
+        items of scoped routes come from this build, others are kept from last build
+        @site_config site config, routes should be updated by check_udpate_routes first
+        @scoped_urls set, urls of scoped build, from get_scoped_urls
+    '''
+    site_root_url = site_config["site_root_url"]
+    root = site_root_url[:-1]
+    routes = [root + url for type_name, url in _get_route_urls(site_config)]
+    def in_scope(url):
+        # page belongs to the route with the longest url prefix
+        route = None
+        for item in routes:
+            if url.startswith(item) and (route is None or len(item) > len(route)):
+                route = item
+        return route is not None and route[len(root):] in scoped_urls
+    sitemap_rel, search_index_rel, blog_index_rel = SCOPED_MERGE_FILES
+    # sitemap.xml
+    if os.path.exists(os.path.join(save_dir, sitemap_rel)):
+        out_path = os.path.join(out_dir, sitemap_rel)
+        if not os.path.exists(out_path):
+            _restore(save_dir, out_dir, sitemap_rel)
+        else:
+            log.i("merge sitemap.xml")
+            head, last_items = _read_sitemap(os.path.join(save_dir, sitemap_rel))
+            head, new_items = _read_sitemap(out_path)
+            # keep order of last build, pages removed from scoped routes are dropped
+            items = OrderedDict((loc, new_items.get(loc, item)) for loc, item in last_items.items()
+                                if loc in new_items or not in_scope(urlparse(loc).path))
+            items.update(new_items)
+            if os.environ.get("SOURCE_DATE_EPOCH"):
+                items = OrderedDict(sorted(items.items()))
+            _write_sitemap(head, items, out_path)
+    # search index, keys are route urls
+    if os.path.exists(os.path.join(save_dir, search_index_rel, "index.json")):
+        index_dir = os.path.join(out_dir, search_index_rel)
+        if not os.path.exists(os.path.join(index_dir, "index.json")):
+            _restore(save_dir, out_dir, search_index_rel)
+        else:
+            log.i("merge search index")
+            # sub index files of two builds have the same names, move new ones away first
+            new_dir = os.path.join(save_dir, "search_index_new")
+            shutil.move(index_dir, new_dir)
+            new_items = _read_search_index(new_dir)
+            items = OrderedDict()
+            for doc_url, item in _read_search_index(os.path.join(save_dir, search_index_rel)).items():
+                if doc_url in new_items:
+                    items[doc_url] = new_items[doc_url]
+                elif not doc_url in scoped_urls:
+                    items[doc_url] = item
+            for doc_url, item in new_items.items():
+                if not doc_url in items:
+                    items[doc_url] = item
+            _write_search_index(items, index_dir, site_root_url)
+    # blog index, keys are page urls
+    if os.path.exists(os.path.join(save_dir, blog_index_rel)):
+        out_path = os.path.join(out_dir, blog_index_rel)
+        if not os.path.exists(out_path):
+            _restore(save_dir, out_dir, blog_index_rel)
+        else:
+            log.i("merge blog index")
+            with open(os.path.join(save_dir, blog_index_rel), encoding="utf-8") as f:
+                items = {url: item for url, item in json.load(f)["items"].items() if not in_scope(url)}
+            with open(out_path, encoding="utf-8") as f:
+                items.update(json.load(f)["items"])
+            _write_blog_index(items, out_path)
+
+def merge_shards(shards_dirs, serve_dir, site_root_url, log, doc_src_path = None):
+    '''
+        merge shards output to serve_dir,
+        html and assets files are copied, sitemap.xml, search index, blog index and manifest are merged
+        @shards_dirs shards dirs, returned by get_shards_dirs
+        @serve_dir out dir, e.g. /home/xxx/site/out
+        @site_root_url site root url, e.g. "/" or "/teedoc/"
+        @doc_src_path source dir, for manifest
+    '''
+    root_rel = site_root_url[1:]
+    sitemap_rel = "{}sitemap.xml".format(root_rel)
+    search_index_rel = "{}static/search_index/".format(root_rel)
+    blog_index_rel = "{}static/blog_index/index.json".format(root_rel)
+    manifest_rel = "{}{}".format(root_rel, MANIFEST_NAME)
+    sitemaps = []
+    search_index_dirs = []
+    blog_indexes = []
+    for shard_dir in shards_dirs:
+        log.i("merge shard {}".format(shard_dir))
+        for root, dirs, files in os.walk(shard_dir):
+            for name in files:
+                src = os.path.join(root, name)
+                rel = os.path.relpath(src, shard_dir).replace("\\", "/")
+                if rel == sitemap_rel:
+                    sitemaps.append(src)
+                    continue
+                if rel.startswith(search_index_rel):
+                    if rel == search_index_rel + "index.json":
+                        search_index_dirs.append(os.path.dirname(src))
+                    continue
+                if rel == blog_index_rel:
+                    blog_indexes.append(src)
+                    continue
+                if rel == manifest_rel:
+                    continue
+                dst = os.path.join(serve_dir, rel)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                # keep modify time so manifest entries of shards still valid, no need to hash again
+                unlink_if_linked(dst)
+                shutil.copy2(src, dst)
+    if sitemaps:
+        log.i("merge sitemap.xml")
+        _merge_sitemap(sitemaps, os.path.join(serve_dir, sitemap_rel))
+    if search_index_dirs:
+        log.i("merge search index")
+        _merge_search_index(search_index_dirs, os.path.join(serve_dir, search_index_rel), site_root_url)
+    if blog_indexes:
+        log.i("merge blog index")
+        out_path = os.path.join(serve_dir, blog_index_rel)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        _merge_blog_index(blog_indexes, out_path)
+    log.i("merge manifest")
+    manifest = Manifest(os.path.join(serve_dir, root_rel), doc_src_path)
+    for shard_dir in shards_dirs:
+        manifest.files.update(load_manifest(os.path.join(shard_dir, root_rel)))
+    manifest.save()
+    return True
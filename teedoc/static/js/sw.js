@@ -0,0 +1,96 @@
+/*
+    service worker generated by teedoc, precache list is filled when build
+    precached files: cache first, key has revision(content hash), only changed files are downloaded when update
+    pages:           stale-while-revalidate, show offline page if offline and page not cached
+*/
+const ROOT = __ROOT__;
+const PRECACHE = __PRECACHE__;
+const OFFLINE_PAGE = __OFFLINE_PAGE__;
+const PRECACHE_NAME = "teedoc-precache-" + ROOT;
+const PAGES_NAME = "teedoc-pages-" + ROOT;
+
+const revisions = new Map(PRECACHE);
+function precache_key(url) {
+    return url + "?__rev=" + revisions.get(url);
+}
+
+self.addEventListener("install", function(event) {
+    event.waitUntil(caches.open(PRECACHE_NAME).then(function(cache) {
+        return cache.keys().then(function(requests) {
+            const cached = new Set(requests.map(function(req) { return new URL(req.url).pathname + new URL(req.url).search; }));
+            return Promise.all(PRECACHE.filter(function(item) {
+                return !cached.has(precache_key(item[0]));
+            }).map(function(item) {
+                return fetch(item[0], {cache: "no-cache"}).then(function(res) {
+                    if (!res.ok) {
+                        throw new Error("precache " + item[0] + " fail: " + res.status);
+                    }
+                    return cache.put(precache_key(item[0]), res);
+                });
+            }));
+        });
+    }).then(function() {
+        return self.skipWaiting();
+    }));
+});
+
+self.addEventListener("activate", function(event) {
+    // remove old revisions
+    event.waitUntil(caches.open(PRECACHE_NAME).then(function(cache) {
+        return cache.keys().then(function(requests) {
+            return Promise.all(requests.map(function(req) {
+                const url = new URL(req.url);
+                if (revisions.has(url.pathname) && url.search == "?__rev=" + revisions.get(url.pathname)) {
+                    return null;
+                }
+                return cache.delete(req);
+            }));
+        });
+    }).then(function() {
+        return self.clients.claim();
+    }));
+});
+
+function is_page(req, url) {
+    return req.mode == "navigate" || url.pathname.endsWith("/") || url.pathname.endsWith(".html");
+}
+
+self.addEventListener("fetch", function(event) {
+    const req = event.request;
+    const url = new URL(req.url);
+    if (req.method != "GET" || url.origin != self.location.origin || !url.pathname.startsWith(ROOT)) {
+        return;
+    }
+    if (revisions.has(url.pathname)) {
+        event.respondWith(caches.open(PRECACHE_NAME).then(function(cache) {
+            return cache.match(precache_key(url.pathname)).then(function(res) {
+                return res || fetch(req);
+            });
+        }));
+        return;
+    }
+    if (!is_page(req, url)) {
+        return;
+    }
+    event.respondWith(caches.open(PAGES_NAME).then(function(cache) {
+        return cache.match(req, {ignoreSearch: true}).then(function(cached) {
+            const update = fetch(req).then(function(res) {
+                if (res.ok) {
+                    cache.put(req, res.clone());
+                }
+                return res;
+            });
+            if (cached) {
+                event.waitUntil(update.catch(function() {}));
+                return cached;
+            }
+            return update.catch(function() {
+                return caches.open(PRECACHE_NAME).then(function(precache) {
+                    return precache.match(precache_key(OFFLINE_PAGE));
+                }).then(function(res) {
+                    return res || Response.error();
+                });
+            });
+        });
+    }));
+});
@@ -1,19 +1,52 @@
 import os, sys
-from glob import glob
 import argparse
 import json
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from .manifest import MANIFEST_NAME, hash_file, load_manifest
+except Exception:
+    from manifest import MANIFEST_NAME, hash_file, load_manifest
+
+def _get_files(dir, rel, files):
+    with os.scandir(dir) as it:
+        entries = list(it)
+    for entry in entries:
+        # same as glob, ignore hidden files and dirs
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir():
+            _get_files(entry.path, f"{rel}{entry.name}/", files)
+        elif entry.is_file():
+            files.append(f"{rel}{entry.name}")
 
 def get_files(dir):
     files = []
-    files_raw = glob(f"{dir}/**", recursive=True)
-    for path in files_raw:
-        if os.path.isfile(path):
-            files.append(path[len(dir)+1:])
+    _get_files(dir, "", files)
     return files
 
-def is_content_different(path1, path2):
+def is_content_different(path1, path2, chunk_size = 1024 * 1024):
+    if os.path.getsize(path1) != os.path.getsize(path2):
+        return True
     with open(path1, "rb") as f1, open(path2, "rb") as f2:
-        return f1.read() != f2.read()
+        while 1:
+            data1 = f1.read(chunk_size)
+            data2 = f2.read(chunk_size)
+            if data1 != data2:
+                return True
+            if not data1:
+                return False
+
+def is_content_different_from_manifest(entry, path, new_entry = None):
+    '''
+        @entry old file's entry of manifest
+        @new_entry new file's entry of manifest if have, use hash of it if file not changed after manifest created
+    '''
+    st = os.stat(path)
+    if entry.get("size") != st.st_size:
+        return True
+    if new_entry and new_entry.get("size") == st.st_size and new_entry.get("mtime") == st.st_mtime_ns and new_entry.get("sha256"):
+        return new_entry["sha256"] != entry.get("sha256")
+    return hash_file(path) != entry.get("sha256")
 
 def remove_tail(path):
     if path == "/":
@@ -22,35 +55,52 @@ def remove_tail(path):
         return path[:-1]
     return path
 
-def get_changed_files(old, new):
-    old = remove_tail(old)
-    new = remove_tail(new)
+def _compare_files(old_dir_files, new_dir_files, is_different, max_workers = None):
+    '''
+        @is_different function(file), compare file exists in both, will be called in thread pool
+    '''
     new_files = []
     modified_files = []
-    deleted_files = []
-    old_dir_files = get_files(old)
-    new_dir_files = get_files(new)
-    flags = {}
-    for path in old_dir_files:
-        flags[path] = False
+    old_files_set = set(old_dir_files)
+    new_files_set = set(new_dir_files)
+    both_files = []
     for file in new_dir_files:
         # new file
-        if file not in old_dir_files:
+        if file not in old_files_set:
             new_files.append(file)
-            continue
-        # for find deleted file
-        flags[file] = True
-        # changed file
-        different = is_content_different(os.path.join(old, file), os.path.join(new, file))
-        if different:
-            modified_files.append(file)
-            continue
-    for path, exists in flags.items():
-        if not exists:
-            deleted_files.append(path)
-
+        else:
+            both_files.append(file)
+    # changed file, reading files is io bound, so use threads
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        for file, different in zip(both_files, executor.map(is_different, both_files, chunksize = 64)):
+            if different:
+                modified_files.append(file)
+    deleted_files = [path for path in old_dir_files if path not in new_files_set]
     return new_files, modified_files, deleted_files
 
+def get_changed_files(old, new, max_workers = None):
+    old = remove_tail(old)
+    new = remove_tail(new)
+    old_dir_files = get_files(old)
+    new_dir_files = get_files(new)
+    def is_different(file):
+        return is_content_different(os.path.join(old, file), os.path.join(new, file))
+    return _compare_files(old_dir_files, new_dir_files, is_different, max_workers)
+
+def get_changed_files_by_manifest(manifest_files, new, max_workers = None):
+    '''
+        compare files with manifest of old build instead of old directory
+        @manifest_files dict, files of manifest, can get by `load_manifest`
+        @new new directory, if contains manifest too, use hash of it if file not changed
+    '''
+    new = remove_tail(new)
+    new_manifest_files = load_manifest(new)
+    old_dir_files = [path for path in manifest_files if not os.path.basename(path).startswith(".") and not "/." in path]
+    new_dir_files = get_files(new)
+    def is_different(file):
+        return is_content_different_from_manifest(manifest_files[file], os.path.join(new, file), new_manifest_files.get(file))
+    return _compare_files(old_dir_files, new_dir_files, is_different, max_workers)
+
 def output_text(new, modified):
     out = ""
     for path in new:
@@ -67,18 +117,34 @@ Can be used to compare two time's build output.
 def main():
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument("-f", "--format", type=str, default="json", help="output format", choices=["json", "text"])
+    parser.add_argument("-m", "--manifest", action="store_true", default=False, help=f"old_path is a manifest file({MANIFEST_NAME}) of old build, or directory contains it, compare with it instead of old directory")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="threads number to compare files, default by cpu count")
     parser.add_argument("old_path", help="old directory")
     parser.add_argument("new_path", help="new directory")
     args = parser.parse_args()
 
-    if not os.path.isdir(args.old_path):
+    if args.manifest:
+        manifest_path = os.path.join(args.old_path, MANIFEST_NAME) if os.path.isdir(args.old_path) else args.old_path
+        if not os.path.isfile(manifest_path):
+            print("Manifest file not found: {}".format(manifest_path))
+            sys.exit(1)
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest_files = json.load(f)["files"]
+        except Exception as e:
+            print("Load manifest {} fail: {}".format(manifest_path, e))
+            sys.exit(1)
+    elif not os.path.isdir(args.old_path):
         print("Path should be directory: {}".format(args.old_path))
         sys.exit(1)
     if not os.path.isdir(args.new_path):
         print("Path should be directory: {}".format(args.new_path))
         sys.exit(1)
 
-    new, modified, deleted = get_changed_files(args.old_path, args.new_path)
+    if args.manifest:
+        new, modified, deleted = get_changed_files_by_manifest(manifest_files, args.new_path, args.jobs)
+    else:
+        new, modified, deleted = get_changed_files(args.old_path, args.new_path, args.jobs)
     output = {
         "new": new,
         "modified": modified,
@@ -4,12 +4,29 @@ try:
     from . import utils
     from .html_parser import generate_html_item_from_html_file
     from .layout_i18n import main as trans_main
+    from .manifest import Manifest, file_entry
+    from .page_weight import collect_page_weight, update_page_weight_size
+    from .mem_report import Worker_Mem, get_rss
+    from .schedule import Timings
+    from .out_store import unlink_if_linked, Overlay
+    from .versions import update_navbar_versions
+    from .io_pool import IO_Pool
+    from .service_worker import get_service_worker_config, get_register_script, generate_service_worker
+    from .vendor import get_site_vendor_files
 except Exception:
     from html_renderer import Renderer
     from html_parser import generate_html_item_from_html_file
     import utils
     from layout_i18n import main as trans_main
-import subprocess
+    from manifest import Manifest, file_entry
+    from page_weight import collect_page_weight, update_page_weight_size
+    from mem_report import Worker_Mem, get_rss
+    from schedule import Timings
+    from out_store import unlink_if_linked, Overlay
+    from versions import update_navbar_versions
+    from io_pool import IO_Pool
+    from service_worker import get_service_worker_config, get_register_script, generate_service_worker
+    from vendor import get_site_vendor_files
 import shutil
 import re
 from collections import OrderedDict
@@ -18,13 +35,12 @@ import copy
 import datetime
 import tempfile
 import gettext
-from babel import Locale
 
 class RebuildException(Exception):
     pass
 
 g_sitemap_content = {}
-def add_robots_txt(site_config, out_dir, log):
+def add_robots_txt(site_config, out_dir, log, manifest = None):
     if not "robots" in site_config:
         site_config["robots"] = {}
     out_path = os.path.join(out_dir, "robots.txt")
@@ -36,8 +52,11 @@ def add_robots_txt(site_config, out_dir, log):
     for k, v in robots_items.items():
         robots_txt += "{}: {}\n".format(k, v)
     robots_txt += "Sitemap: {}://{}/sitemap.xml\n".format(site_config["site_protocol"], site_config["site_domain"])
+    unlink_if_linked(out_path)
     with open(out_path, "w", encoding="utf-8") as f:
         f.write(robots_txt)
+    if manifest:
+        manifest.add(out_path, content = robots_txt)
 
 def get_last_modify_time(html, file_path, git = False):
     '''
@@ -82,9 +101,11 @@ def generate_sitemap(update_htmls, out_path, site_domain, site_protocol, log):
         </url>
     '''.format(url, last_edit_time, change_freq, priority)
             g_sitemap_content[url] = sitemap_item
-    for url in g_sitemap_content:
+    urls = sorted(g_sitemap_content) if utils.get_source_date_epoch() is not None else g_sitemap_content
+    for url in urls:
         sitemap_content += g_sitemap_content[url]
     sitemap_content += '</urlset>\r\n'
+    unlink_if_linked(out_path)
     with open(out_path, "w", encoding='utf-8') as f:
         f.write(sitemap_content)
 
@@ -95,6 +116,32 @@ def split_list(obj, n):
     for i in range(0, len(obj), dist):
         yield obj[i:i+dist]
 
+def get_sites_dirs(sites):
+    '''
+        @sites list, doc root dirs, or one file contains doc root dirs,
+               file content can be json list or one dir per line(`#` start line is comment),
+               relative path in file is relative to the file's dir
+        @return list, abs path of doc root dirs
+    '''
+    import json
+    if len(sites) == 1 and os.path.isfile(sites[0]):
+        sites_file = os.path.abspath(sites[0])
+        with open(sites_file, encoding="utf-8") as f:
+            content = f.read()
+        if content.strip().startswith("["):
+            sites = json.loads(content)
+        else:
+            sites = [line.strip() for line in content.splitlines() if line.strip() and not line.strip().startswith("#")]
+        sites = [os.path.join(os.path.dirname(sites_file), path) for path in sites]
+    dirs = []
+    for path in sites:
+        path = os.path.abspath(path).replace("\\", "/")
+        if not os.path.exists(os.path.join(path, "site_config.json")) and not os.path.exists(os.path.join(path, "site_config.yaml")):
+            raise Exception("site_config.json not found in {}".format(path))
+        if not path in dirs:
+            dirs.append(path)
+    return dirs
+
 def parse_site_config(doc_src_path):
     site_config_path = os.path.join(doc_src_path, "site_config.json")
     def check_site_config(config):
@@ -122,11 +169,16 @@ def copy_file(src, dst):
     if not os.path.exists(dir):
         os.makedirs(dir, exist_ok=True)
     try:
+        unlink_if_linked(dst)
         shutil.copyfile(src, dst)
     except Exception:
         return False
     return True
 
+def copy_file_raise(src, dst):
+    unlink_if_linked(dst)
+    shutil.copyfile(src, dst)
+
 def get_files(dir_path, except_dirs, warn=None):
     result = []
     files = os.listdir(dir_path)
@@ -152,11 +204,26 @@ def get_files(dir_path, except_dirs, warn=None):
             result.append(path.replace("\\", "/"))
     return result
 
-def write_to_file(files_content, in_path, out_path):
+def write_html_file(path, html):
+    '''
+        @html str or iterator of str chunks(stream render)
+    '''
+    unlink_if_linked(path)
+    with open(path, "w", encoding="utf-8") as f:
+        if type(html) == str:
+            f.write(html)
+        else:
+            for chunk in html:
+                f.write(chunk)
+
+def write_to_file(files_content, in_path, out_path, written = None, io_pool = None):
     '''
         @files_content      { "/home/neucrack/site/docs/get_started/zh/README.md": "<h1>index page</h1>"
         @in_path      "/home/neucrack/site/docs/get_started/zh"
         @out_path     "/home/neucrack/site/out/get_started/zh"
+        @written      dict, if not None, add written files to it, {out_file_path: (src_file_path, html or None)},
+                      html is None for stream rendered page
+        @io_pool      IO_Pool, if not None, write str html and copy files in pool threads, stream is always written now
     '''
     for file, html in files_content.items():
         f_path = file.replace(in_path, out_path)
@@ -169,12 +236,20 @@ def write_to_file(files_content, in_path, out_path):
                 f_path = os.path.join(os.path.dirname(f_path), "index.html")
             else:
                 f_path = "{}.html".format(os.path.splitext(f_path)[0])
-            with open(f_path, "w", encoding="utf-8") as f:
-                f.write(html)
+            if type(html) != str:
+                write_html_file(f_path, html)
+                html = None
+            elif io_pool:
+                io_pool.submit(write_html_file, f_path, html)
+            else:
+                write_html_file(f_path, html)
         else:    # normal files, just copy
-            with open(f_path, "wb") as f:
-                with open(file, "rb") as s:
-                    f.write(s.read())
+            if io_pool:
+                io_pool.submit(copy_file_raise, file, f_path)
+            else:
+                copy_file_raise(file, f_path)
+        if written is not None:
+            written[f_path] = (file, html)
     return True, ""
 
 def load_config(doc_dir, config_template_dir, config_name="config"):
@@ -297,6 +372,21 @@ def load_doc_config(doc_dir, config_template_dir):
     config = load_config(doc_dir, config_template_dir)
     return config
 
+def get_url_locales(site_config, config_template_dir):
+    '''
+        @site_config routes should be updated by check_udpate_routes first
+        @return dict, {url: locale} of docs, pages and blog routes and translates, locale default "en" like build
+    '''
+    url_locales = {}
+    for type_name in ["docs", "pages", "blog"]:
+        for url, (rel_dir, abs_dir) in site_config["route"].get(type_name, {}).items():
+            url_locales[url] = load_doc_config(abs_dir, config_template_dir).get("locale", "en")
+    for type_name in ["docs", "pages"]:
+        for src, items in site_config.get("translate", {}).get(type_name, {}).items():
+            for item in items:
+                url_locales[item["url"]] = load_doc_config(item["src"][1], config_template_dir).get("locale", "en")
+    return url_locales
+
 def get_sidebar(doc_dir, config_template_dir):
     return load_config(doc_dir, config_template_dir, config_name="sidebar")
 
@@ -315,6 +405,7 @@ def generate_navbar_language_items(routes, doc_configs, addtion_items={}):
         @doc_configs {url: doc_config_dict, }, doc_config_dict must have "locale" keyword
         @addtion_items {url: locale, }
     '''
+    from babel import Locale
     items = []
     for url, dir in routes.items():
         locale = doc_configs[url]["locale"]
@@ -821,7 +912,46 @@ def generate_footer_html(htmls, footer, doc_path, doc_url, plugins_objs):
         htmls[file] = html
     return htmls
 
-def construct_html(html_template, html_templates_i18n_dirs, htmls, header_items_in, js_items_in, site_config, sidebar_list, doc_config, doc_src_path, plugins_objs, log, is_build, layout_usage_queue = None):
+g_renderers = {}
+# fragment cache stats of worker processes, renderers of main process counted by get_fragment_cache_stats
+g_fragment_cache_stats = {"hits": 0, "misses": 0}
+# Parse_Cache object, set when build multiple versions or use --cache
+g_parse_cache = None
+# Overlay object, set when serve --overlay, files not parsed and assets are not copied to out dir,
+# server read them from source dirs
+g_overlay = None
+def get_template_locale(doc_config):
+    locale = doc_config["locale"].replace("-", "_") if "locale" in doc_config else None
+    if ":" in locale:
+        locale = locale[:locale.index(":")]
+    return locale
+
+def get_renderer(template_name, search_paths, html_templates_i18n_dirs, locale, log):
+    '''
+        get Renderer object from cache, the cache is shared by all routes and sites built in this process,
+        translations file's modify time is part of key, so translations updated will create new one
+    '''
+    mo_mtimes = []
+    for dir in html_templates_i18n_dirs:
+        path = os.path.join(dir, locale if locale else "en", "LC_MESSAGES", "messages.mo")
+        mo_mtimes.append(os.path.getmtime(path) if os.path.exists(path) else 0)
+    key = (template_name, tuple(search_paths), tuple(html_templates_i18n_dirs), locale, tuple(mo_mtimes))
+    if not key in g_renderers:
+        g_renderers[key] = Renderer(template_name, search_paths, log, html_templates_i18n_dirs, locale=locale)
+    return g_renderers[key]
+
+def get_fragment_cache_stats():
+    '''
+        @return dict, fragment cache hits and misses of cached renderers in current process
+    '''
+    stats = {"hits": 0, "misses": 0}
+    for renderer in g_renderers.values():
+        for k in stats:
+            stats[k] += renderer.env.fragment_cache_stats[k]
+    return stats
+
+def construct_html(html_template, html_templates_i18n_dirs, htmls, header_items_in, js_items_in, site_config, sidebar_list, doc_config, doc_src_path, plugins_objs, log, is_build, layout_usage_queue = None,
+                   weights = None, stream = False):
     '''
         @htmls  {
             "title": "",
@@ -838,14 +968,20 @@ def construct_html(html_template, html_templates_i18n_dirs, htmls, header_items_
             "date": "2021-3-14", # None means not set, False mean not show date
             "author": "", # may not exists
         }
+        @weights dict, if not None, collect page weight info of every file to it, {file: weight}
+        @stream bool, page with body larger than Renderer.stream_size is rendered to iterator of str chunks, not str
     '''
     template_root = os.path.join(doc_src_path, site_config["layout_root_dir"]) if "layout_root_dir" in site_config else os.path.join(doc_src_path, "layout")
     theme_layout_root = os.path.dirname(html_template)
-    locale = doc_config["locale"].replace("-", "_") if "locale" in doc_config else None
-    if ":" in locale:
-        locale = locale[:locale.index(":")]
+    locale = get_template_locale(doc_config)
     lang = locale.replace("_", "-") if locale else None
-    renderer0 = Renderer(os.path.basename(html_template), [theme_layout_root], log, html_templates_i18n_dirs, locale=locale)
+    # cached, avoid create jinja2 environment and load translations for every page
+    renderer0 = get_renderer(os.path.basename(html_template), [theme_layout_root], html_templates_i18n_dirs, locale, log)
+    def render(renderer, vars):
+        # large page render as stream, write to file chunk by chunk
+        if stream and Renderer.stream_size and vars["body"] and len(vars["body"]) >= Renderer.stream_size:
+            return renderer.generate(**vars)
+        return renderer.render(**vars)
     files = {}
     items = list(htmls.items())
     for i, (file, html) in enumerate(items):
@@ -875,7 +1011,7 @@ def construct_html(html_template, html_templates_i18n_dirs, htmls, header_items_
                         # mark file use layout
                         if layout_usage_queue is not None:
                             layout_usage_queue.put([layout.replace("\\", "/"), file.replace("\\", "/")])
-                        renderer = Renderer(html["metadata"]["layout"], [template_root, theme_layout_root], log, html_templates_i18n_dirs, locale=locale)
+                        renderer = get_renderer(html["metadata"]["layout"], [template_root, theme_layout_root], html_templates_i18n_dirs, locale, log)
                 id, classes = get_html_start_id_class(html, doc_config["id"] if "id" in doc_config else None, doc_config['class'] if 'class' in doc_config else None)
                 if "sidebar" in html:
                     previous_article = None
@@ -934,7 +1070,7 @@ def construct_html(html_template, html_templates_i18n_dirs, htmls, header_items_
                     }
                     for plugin in plugins_objs:
                         vars = plugin.__getattribute__("on_render_vars")(vars)
-                    rendered_html = renderer.render(**vars)
+                    rendered_html = render(renderer, vars)
                 else:
                     vars = {
                         "lang": lang,
@@ -965,16 +1101,27 @@ def construct_html(html_template, html_templates_i18n_dirs, htmls, header_items_
                     }
                     for plugin in plugins_objs:
                         vars = plugin.__getattribute__("on_render_vars")(vars)
-                    rendered_html = renderer.render(**vars)
+                    rendered_html = render(renderer, vars)
                 files[file] = rendered_html
+                if weights is not None:
+                    weights[file] = collect_page_weight(vars)
         except Exception as e:
             log.e("Error rendering file: %s" % file)
             raise e
     return files
 
-def update_html_abs_path(file_htmls, root_path):
+def update_html_abs_path(file_htmls, root_path, keep_prefixes = []):
+    '''
+        add root_path to abs url of src, href and url()
+        @keep_prefixes list, urls start with them are already full path, e.g. url of other versions
+    '''
     def re_del(c):
         content = c[0]
+        if keep_prefixes:
+            value = content[content.find("=") + 2:] if content[0] != "u" else content[4:].lstrip("\"'")
+            for prefix in keep_prefixes:
+                if value.startswith(prefix):
+                    return content
         if content.startswith("src"):
             if content[5] == "/" and content[6] != "/":
                 content = "{}{}{}".format(content[:5], root_path[:-1], content[5:])
@@ -988,12 +1135,33 @@ def update_html_abs_path(file_htmls, root_path):
                 content = "{}{}{}".format(content[:5], root_path[:-1], content[5:])
         return content
 
+    def update(html):
+        html = re.sub(r'href=".*?"', re_del, html)
+        html = re.sub(r'src=".*?"', re_del, html)
+        html = re.sub(r'url\(.*?\)', re_del, html)
+        return html
+
+    def update_stream(chunks):
+        '''
+            patterns never match newline, so update text before the last newline and keep the rest to next chunk
+        '''
+        rest = ""
+        for chunk in chunks:
+            rest += chunk
+            i = rest.rfind("\n")
+            if i >= 0:
+                yield update(rest[:i + 1])
+                rest = rest[i + 1:]
+        if rest:
+            yield update(rest)
+
     for path in file_htmls:
         if not file_htmls[path]:
             continue
-        file_htmls[path] = re.sub(r'href=".*?"', re_del, file_htmls[path])
-        file_htmls[path] = re.sub(r'src=".*?"', re_del, file_htmls[path])
-        file_htmls[path] = re.sub(r'url\(.*?\)', re_del, file_htmls[path])
+        if type(file_htmls[path]) == str:
+            file_htmls[path] = update(file_htmls[path])
+        else:
+            file_htmls[path] = update_stream(file_htmls[path])
     return file_htmls
 
 def add_url_item(htmls, url, dir, site_root_url):
@@ -1098,7 +1266,7 @@ def generate(multiprocess, html_template, html_templates_i18n_dirs, files, url,
              site_config, doc_src_path, log, out_dir, plugins_objs, header_items, js_items,
              sidebar, sidebar_list, allow_no_navbar, site_root_url, navbar, footer, queue, pipe_rx, pipe_tx,
              redirect_err_file, redirct_url, ref_doc_url, is_build, layout_usage_queue=None, sidebar_root_dir = None,
-             not_found_items = {}):
+             not_found_items = {}, collect_weight = False, collect_mem = False, mem_trace_top = 0):
     if not sidebar_root_dir:
         sidebar_root_dir = dir
     if pipe_tx is not None:
@@ -1119,11 +1287,20 @@ def generate(multiprocess, html_template, html_templates_i18n_dirs, files, url,
         def is_err():
             return is_err_flag
 
+    io_pool = None
     try:
+        log.set_route(url)
+        mem = Worker_Mem(url, mem_trace_top, process_wide = not multiprocess) if collect_mem else None
+        # renderers are copied to process with stats of main process, only send the increase
+        fragment_stats = get_fragment_cache_stats() if multiprocess else None
         # call init in new process
         if multiprocess:
             for p in plugins_objs:
+                if mem:
+                    mem.begin()
                 p.on_new_process_init()
+                if mem:
+                    mem.end(p.name)
 
         if url.startswith("/"):
             rel_url = url[1:]
@@ -1135,97 +1312,161 @@ def generate(multiprocess, html_template, html_templates_i18n_dirs, files, url,
             in_path = in_path[:-1]
         if out_path.endswith("/"):
             out_path = out_path[:-1]
-        # call plugins to parse files
-        result_htmls = {}
-        drafts = []
-        for plugin in plugins_objs:
-            # parse file content
-            result = plugin.__getattribute__(plugin_func)(files)
-            if result:
-                if not result['ok']:
-                    log.e("plugin <{}> {} error: {}".format(plugin.name, plugin_func, result['msg']))
-                    on_err()
-                    return generate_return(plugins_objs, False, multiprocess)
+        # call plugins to parse files, plugins yield files one by one,
+        # every page is rendered and written as soon as it's parsed
+        iter_func = plugin_func.replace("on_parse_", "iter_parse_")
+        # parse result cached by file content hash(e.g. the same file in multiple versions), only parse files not cached
+        cached = {}
+        cache_keys = {}
+        cache_stats = {"hits": 0, "misses": 0, "remote_hits": 0}
+        if g_parse_cache is not None:
+            salt = g_parse_cache.get_salt(plugin_func, plugins_objs, doc_config)
+            for file in files:
+                key = g_parse_cache.get_key(file, os.path.relpath(file, doc_src_path).replace("\\", "/"), salt)
+                value = g_parse_cache.get(key, cache_stats)
+                if value is None:
+                    cache_keys[file] = key
                 else:
-                    for key in result['htmls']:
-                        if result['htmls'][key]:
-                            result_htmls[key] = result['htmls'][key]  # will cover the before
-                        elif key not in result_htmls:
-                            result_htmls[key] = None
-                    drafts.extend(result.get("drafts", []))
+                    cached[file] = value
+            log.df("parse cache: {} files cached({} from remote), {} files to parse", len(cached), cache_stats["remote_hits"], len(cache_keys))
+        parse_files = [file for file in files if not file in cached]
+        # read next source files and write pages in background
+        io_pool = IO_Pool(parse_files)
+        iters = [plugin.__getattribute__(iter_func)(parse_files) for plugin in plugins_objs]
+        htmls_all = {}
+        manifest_entries = {}
+        page_weights = {}
+        file_times = {}
+        copies = {}
+        overlay_files = {}
+        parse_i = 0
+        for file in files:
+            t = time.time()
+            if not file in cached:
+                io_pool.prefetch(parse_i)
+                parse_i += 1
+            if file in cached:
+                html, is_draft, producer = cached[file]
+            else:
+                html = None
+                is_draft = False
+                producer = None
+                for plugin, it in zip(plugins_objs, iters):
+                    if mem:
+                        mem.begin()
+                    path, record = next(it, (None, None))
+                    if mem:
+                        mem.end(plugin.name)
+                    if path != file:
+                        raise Exception("plugin <{}> {} should yield items in the same order of files, expect {} but {}".format(plugin.name, iter_func, file, path))
+                    if record:
+                        html = record  # will cover the before
+                        producer = plugin.name
+                    elif record is False:
+                        is_draft = True
+                # date of page without date fall back to file's modify time, differs on every machine, not cache
+                if file in cache_keys and not (type(html) == dict and html.get("ts") == int(os.stat(file).st_mtime) and utils.get_source_date_epoch() is None):
+                    g_parse_cache.put(cache_keys[file], [html, is_draft, producer])
             if is_err():
                 return generate_return(plugins_objs, False, multiprocess)
-        # parse html files
-        unrecognized = []
-        for file, html in result_htmls.items():
             if not html:
+                if is_draft:
+                    continue
+                # parse html files
                 if file.endswith(".html"):
-                    result_htmls[file] = generate_html_item_from_html_file(file)
+                    html = generate_html_item_from_html_file(file)
+                # copy not parsed files
                 else:
-                    unrecognized.append(file)
-        for file in unrecognized:
-            result_htmls.pop(file)
-        # copy not parsed files
-        for path in files:
-            if path not in result_htmls and path not in drafts:
-                copy_file(path, path.replace(in_path, out_path))
+                    dst = file.replace(in_path, out_path)
+                    if g_overlay is not None:
+                        overlay_files[dst] = file
+                    else:
+                        copies[dst] = (file, io_pool.submit(copy_file, file, dst))
+                    file_times[file] = time.time() - t
+                    continue
+            htmls = {file: html}
+            # generate sidebar to html
+            if sidebar:
+                htmls = generate_sidebar_html(htmls, sidebar, sidebar_root_dir, url, sidebar["title"] if "title" in sidebar else "",
+                                            redirect_err_file=redirect_err_file, redirct_url=redirct_url, ref_doc_url=ref_doc_url)
+            # generate navbar to html
+            if navbar:
+                htmls = generate_navbar_html(htmls, navbar, dir, url, plugins_objs, log, not_found_items = not_found_items)
+            if footer:
+                htmls = generate_footer_html(htmls, footer, dir, url, plugins_objs)
+            # show source code url
+            if "source" in site_config:
+                label = None
+                if not "show_source" in doc_config:
+                    label = "Edit this page"
+                elif doc_config["show_source"]:
+                    label = doc_config["show_source"]
+                if label:
+                    htmls = htmls_add_source(htmls, site_config["source"], label, doc_src_path)
+
+            # consturct html page
+            weights = {} if collect_weight else None
+            if mem:
+                mem.begin()
+            htmls_str = construct_html(html_template, html_templates_i18n_dirs, htmls, header_items, js_items, site_config, sidebar_list, doc_config, doc_src_path, plugins_objs, log, is_build, layout_usage_queue,
+                                       weights = weights, stream = True)
+            if mem:
+                mem.end("render")
+            # check abspath
+            if site_root_url != "/":
+                keep_prefixes = [item["url"] for item in site_config["versions"]["items"]] if "versions" in site_config else []
+                htmls_str = update_html_abs_path(htmls_str, site_root_url, keep_prefixes)
+            # write to file
+            written = {}
+            ok, msg = write_to_file(htmls_str, in_path, out_path, written, io_pool)
+            htmls_str = None
+            for dst, (src, content) in written.items():
+                manifest_entries[dst] = file_entry(content, src, producer)
+                if weights and src in weights:
+                    if content is None: # stream rendered, already written
+                        with open(dst, encoding="utf-8") as f:
+                            content = f.read()
+                    page_weights[dst] = update_page_weight_size(weights[src], content)
+            if not ok:
+                log.e("write files error: {}".format(msg))
+                on_err()
+                return generate_return(plugins_objs, False, multiprocess)
+            if is_err():
+                return generate_return(plugins_objs, False, multiprocess)
+            # add url, add "url" keyword for htmls, will remove empty html items
+            htmls_all.update(add_url_item(htmls, rel_url, dir, site_root_url))
+            file_times[file] = time.time() - t
+        # all files written before send result to main process
+        io_pool.wait()
+        if g_parse_cache is not None:
+            g_parse_cache.flush()
+        for dst, (file, future) in copies.items():
+            if future.result():
+                manifest_entries[dst] = file_entry(source = file)
         # no file parsed, just return
-        if not result_htmls:
-            log.d("parse files empty: {}".format(files))
-            # on_err()
+        if not htmls_all and not manifest_entries and not overlay_files:
+            log.d("parse files empty:", files)
             return generate_return(plugins_objs, True, multiprocess)
-
-        htmls = result_htmls
-        # generate sidebar to html
-        if sidebar:
-            htmls = generate_sidebar_html(htmls, sidebar, sidebar_root_dir, url, sidebar["title"] if "title" in sidebar else "",
-                                        redirect_err_file=redirect_err_file, redirct_url=redirct_url, ref_doc_url=ref_doc_url)
-        if is_err():
-            return generate_return(plugins_objs, False, multiprocess)
-        # generate navbar to html
-        if navbar:
-            htmls = generate_navbar_html(htmls, navbar, dir, url, plugins_objs, log, not_found_items = not_found_items)
-        if footer:
-            htmls = generate_footer_html(htmls, footer, dir, url, plugins_objs)
-        if is_err():
-            return generate_return(plugins_objs, False, multiprocess)
-        # show source code url
-        if "source" in site_config:
-            label = None
-            if not "show_source" in doc_config:
-                label = "Edit this page"
-            elif doc_config["show_source"]:
-                label = doc_config["show_source"]
-            if label:
-                htmls = htmls_add_source(htmls, site_config["source"], label, doc_src_path)
-
-        # consturct html page
-        htmls_str = construct_html(html_template, html_templates_i18n_dirs, htmls, header_items, js_items, site_config, sidebar_list, doc_config, doc_src_path, plugins_objs, log, is_build, layout_usage_queue)
-        if is_err():
-            return generate_return(plugins_objs, False, multiprocess)
-        # check abspath
-        if site_root_url != "/":
-            htmls_str = update_html_abs_path(htmls_str, site_root_url)
-        if is_err():
-            return generate_return(plugins_objs, False, multiprocess)
-        # write to file
-        ok, msg = write_to_file(htmls_str, in_path, out_path)
-        if not ok:
-            log.e("write files error: {}".format(msg))
-            on_err()
-            return generate_return(plugins_objs, False, multiprocess)
-        if is_err():
-            return generate_return(plugins_objs, False, multiprocess)
-        # add url, add "url" keyword for htmls, will remove empty html items
-        htmls = add_url_item(htmls, rel_url, dir, site_root_url)
-        if len(htmls) > 0:
-            queue.put((url, htmls))
+        # info is extensible dict of other info need to send to main process
+        info = {"manifest": manifest_entries, "page_weight": page_weights, "timings": file_times}
+        if mem:
+            info["mem"] = mem.result()
+        if overlay_files:
+            info["overlay"] = overlay_files
+        if g_parse_cache is not None:
+            info["parse_cache"] = cache_stats
+        if multiprocess:
+            info["fragment_cache"] = {k: v - fragment_stats[k] for k, v in get_fragment_cache_stats().items()}
+        queue.put((url, htmls_all, info))
     except Exception as e:
         import traceback
         traceback.print_exc()
         log.e("generate html fail: {}".format(e))
         on_err()
         return generate_return(plugins_objs, False, multiprocess)
+    finally:
+        if io_pool:
+            io_pool.close()
     log.d("generate ok")
     return generate_return(plugins_objs, True, multiprocess)
 
@@ -1314,8 +1555,14 @@ def parse(type_name, plugin_func, routes, routes_trans, site_config, doc_src_pat
             sidebar, allow_no_navbar, update_files, max_threads_num, preview_mode, html_templates_i18n_dirs=[], multiprocess = True,
             translate = False, ref_doc_url="", ref_doc_dir = "", ref_locale = "en", translate_src_sidebar_list = None,
             doc_configs = {}, nav_lang_items = [], is_build = True, layout_usage_queue = None,
-            rebuild_docs = None):
+            rebuild_docs = None, only_urls = None, manifest = None, page_weights = None, mem_report = None,
+            timings = None):
     '''
+        @only_urls set, only parse docs whose url in it, None means all
+        @manifest Manifest object, record output files to it, None means not record
+        @page_weights dict, collect page weight info to it, {out_file_path: weight}, None means not collect
+        @timings Timings object, split files to workers by estimated cost and record build time of files to it,
+                 None means split by files count
         @return {
             "doc_url", {
                 "page_url": {
@@ -1351,6 +1598,9 @@ def parse(type_name, plugin_func, routes, routes_trans, site_config, doc_src_pat
         _dir, dir = dirs
         if rebuild_docs and dir not in rebuild_docs:
             continue
+        if only_urls is not None and url not in only_urls:
+            continue
+        log.set_route(url)
         # get files
         except_dirs = utils.get_sub_dirs(dir, routes_trans.get(url, []))
         if update_files:
@@ -1410,10 +1660,10 @@ def parse(type_name, plugin_func, routes, routes_trans, site_config, doc_src_pat
                 log.e("plugin <{}> error, on_add_html_header_items should return list type".format(plugin.name))
                 return False, None
             if items:
-                items = utils.convert_file_tag_items(items, out_dir, plugin.name)
+                items = utils.convert_file_tag_items(items, out_dir, plugin.name, manifest)
                 header_items.extend(items)
             if _js_items:
-                _js_items = utils.convert_file_tag_items(_js_items, out_dir, plugin.name)
+                _js_items = utils.convert_file_tag_items(_js_items, out_dir, plugin.name, manifest)
                 footer_js_items.extend(_js_items)
             temp = plugin.on_html_template(type_name)
             if temp and os.path.exists(temp):
@@ -1425,11 +1675,14 @@ def parse(type_name, plugin_func, routes, routes_trans, site_config, doc_src_pat
             log.e("no html templates for {}, please install theme plugin".format(type_name))
             return False
         if not update_files:
-            log.d("html_templates_i18n_dirs: {}".format("\n -- "+"\n -- ".join(html_templates_i18n_dirs)))
+            log.d("html_templates_i18n_dirs:", html_templates_i18n_dirs)
 
         # preview_mode js file
         if preview_mode:
             footer_js_items.append('<script type="text/javascript" src="/static/js/live.js"></script>')
+        # register service worker, not in serve and preview mode, or cached pages and assets will be served
+        elif is_build and get_service_worker_config(site_config) is not None:
+            footer_js_items.append(get_register_script(site_config["site_root_url"]))
 
         # get sidebar config
         sidebar_dict = {}
@@ -1445,6 +1698,7 @@ def parse(type_name, plugin_func, routes, routes_trans, site_config, doc_src_pat
             navbar = doc_config['navbar']
             # remove empty language item, update valid language item to selection item
             navbar = update_navbar_language(navbar, nav_lang_items)
+            navbar = update_navbar_versions(navbar, site_config.get("versions"))
         except Exception as e:
             if not allow_no_navbar:
                 log.e("parse config.json navbar fail: {}".format(e))
@@ -1469,11 +1723,17 @@ def parse(type_name, plugin_func, routes, routes_trans, site_config, doc_src_pat
             sidebar_list = {}
             not_found_items = {}
         if max_threads_num > 1 and len(all_files) > 10:
-            all_files = split_list(all_files, max_threads_num)
+            # compile template before create sub processes, so all sub processes can use it
+            get_renderer(os.path.basename(html_template), [os.path.dirname(html_template)], html_templates_i18n_dirs, get_template_locale(doc_config), log).load()
+            if timings is not None:
+                chunks = timings.partition(all_files, max_threads_num)
+            else:
+                chunks = [(files, 0) for files in split_list(all_files, max_threads_num)]
             ts = []
             pipes_child_to_parent = []
             pipes_parent_to_child = []
-            for files in all_files:
+            t_start = time.time()
+            for files, _ in chunks:
                 pipe_rx_c2p, pipe_tx_c2p = multiprocessing.Pipe()
                 pipes_child_to_parent.append((pipe_rx_c2p, pipe_tx_c2p))
                 pipe_rx_p2c, pipe_tx_p2c = multiprocessing.Pipe()
@@ -1483,7 +1743,8 @@ def parse(type_name, plugin_func, routes, routes_trans, site_config, doc_src_pat
                                             header_items, footer_js_items, sidebar_dict, sidebar_list, allow_no_navbar,
                                             site_root_url, navbar, footer, queue, pipe_rx_p2c, pipe_tx_c2p,
                                             redirect_err_file, redirct_url, ref_doc_url, is_build, layout_usage_queue,
-                                            None, not_found_items)
+                                            None, not_found_items, page_weights is not None,
+                                            mem_report is not None, mem_report.trace_top if mem_report else 0)
                 if multiprocess:
                     p = multiprocessing.Process(target=generate, args=args)
                 else:
@@ -1492,6 +1753,7 @@ def parse(type_name, plugin_func, routes, routes_trans, site_config, doc_src_pat
                 p.start()
                 ts.append(p)
             have_err = False
+            elapsed = [None] * len(ts)
             while 1:
                 for i in range(len(pipes_child_to_parent)):
                     rx = pipes_child_to_parent[i][0]
@@ -1503,20 +1765,26 @@ def parse(type_name, plugin_func, routes, routes_trans, site_config, doc_src_pat
                             tx = pipes_parent_to_child[j][0]
                             tx.send(True)
                 all_died = True
-                for p in ts:
+                for i, p in enumerate(ts):
                     if p.is_alive():
                         all_died = False
-                        break
+                        continue
                     elif have_err:
                         raise Exception("generate html fail, see log before")
+                    if elapsed[i] is None:
+                        elapsed[i] = time.time() - t_start
                 if all_died:
                     break
                 time.sleep(0.05)
+            if timings is not None:
+                timings.add_route(url, [cost for _, cost in chunks], elapsed)
         else:
             ok = generate(multiprocess, html_template, html_templates_i18n_dirs, all_files, url, dir, doc_config, plugin_func,
                           routes, site_config, doc_src_path, log, out_dir, plugins_objs, header_items,
                           footer_js_items, sidebar_dict, sidebar_list, allow_no_navbar, site_root_url, navbar, footer, queue, None, None,
-                          redirect_err_file, redirct_url, ref_doc_url, is_build, layout_usage_queue, None, not_found_items)
+                          redirect_err_file, redirct_url, ref_doc_url, is_build, layout_usage_queue, None, not_found_items,
+                          collect_weight = page_weights is not None, collect_mem = mem_report is not None,
+                          mem_trace_top = mem_report.trace_top if mem_report else 0)
             if not ok:
                 return False, None
         # create no_translate.html
@@ -1543,23 +1811,52 @@ def parse(type_name, plugin_func, routes, routes_trans, site_config, doc_src_pat
                         '<span id="visit_hint"></span>', f'<span id="visit_hint">{visit_hint}</span>').replace(
                             "no_translate_title", no_translate_title
                         )
-                tmp_dir = tempfile.gettempdir()
+                # content only depends on locale, one dir per locale so builds run at the same time(e.g. sharded build)
+                # won't overwrite each other, write to temp file then replace so never read half written file
+                tmp_dir = os.path.join(tempfile.gettempdir(), "teedoc_no_translate", str(doc_config.get("locale", "default")).replace(":", "_"))
+                os.makedirs(tmp_dir, exist_ok=True)
                 all_files = [os.path.join(tmp_dir, "no_translate.md")]
-                with open(all_files[0], "w") as f:
+                tmp_path = "{}.{}".format(all_files[0], os.getpid())
+                with open(tmp_path, "w") as f:
                     f.write(content)
+                os.replace(tmp_path, all_files[0])
                 ok = generate(multiprocess, html_template, html_templates_i18n_dirs, all_files, url, tmp_dir, doc_config, plugin_func,
                           routes, site_config, doc_src_path, log, out_dir, plugins_objs, header_items,
                           footer_js_items, sidebar_dict, sidebar_list, allow_no_navbar, site_root_url, navbar, footer, queue, None, None,
-                          redirect_err_file, redirct_url, ref_doc_url, is_build, layout_usage_queue, sidebar_root_dir=dir, not_found_items=not_found_items)
+                          redirect_err_file, redirct_url, ref_doc_url, is_build, layout_usage_queue, sidebar_root_dir=dir, not_found_items=not_found_items,
+                          collect_weight = page_weights is not None, collect_mem = mem_report is not None,
+                          mem_trace_top = mem_report.trace_top if mem_report else 0)
                 if not ok:
                     return False, None
-        log.d("generate {} ok".format(dir))
+        log.d("generate", dir, "ok")
+    log.set_route(None)
     htmls = {}
     for i in range(queue.qsize()):
-        url, _htmls = queue.get()
+        url, _htmls, info = queue.get()
+        if manifest:
+            manifest.update(info["manifest"])
+        if page_weights is not None:
+            page_weights.update(info["page_weight"])
+        if mem_report is not None and "mem" in info:
+            mem_report.add_worker(info["mem"])
+        if timings is not None:
+            timings.update(info["timings"])
+        if "overlay" in info:
+            g_overlay.update(info["overlay"])
+        if "parse_cache" in info:
+            g_parse_cache.add_stats(info["parse_cache"])
+        if "fragment_cache" in info:
+            for k, v in info["fragment_cache"].items():
+                g_fragment_cache_stats[k] += v
+        if not _htmls:
+            continue
         if not url in htmls:
             htmls[url] = {}
         htmls[url].update(_htmls)
+    if utils.get_source_date_epoch() is not None:
+        # order of queue items depends on which worker finished first, sort by page url so indexes are stable
+        for url in htmls:
+            htmls[url] = dict(sorted(htmls[url].items()))
     for plugin in plugins_objs:
 
         plugin.on_parse_end()
@@ -1568,7 +1865,8 @@ def parse(type_name, plugin_func, routes, routes_trans, site_config, doc_src_pat
 def build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir, log, update_files=None,
              preview_mode = False, max_threads_num = 1, multiprocess=True, parse_pages=True, copy_assets=True,
              is_build = True, layout_usage_queue = None,
-             rebuild_docs = None):
+             rebuild_docs = None, only_urls = None, manifest = None, page_weights = None, mem_report = None,
+            timings = None):
     '''
         "route": {
             "docs": {
@@ -1583,7 +1881,40 @@ def build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir,
             },
             "/blog": "blog"
         }
+        @only_urls set, only build docs, pages, blog and assets whose url in it, None means all
+        @manifest Manifest object, output files will be recorded to it, and caller should save it,
+                  if None, will load manifest from out_dir and save after build
+        @page_weights dict, collect page weight info to it, {out_file_path: weight}, None means not collect
+        @mem_report Mem_Report object, record memory usage of every stage and worker to it, None means not record
+        @timings Timings object, build time of every file, used to split files to workers,
+                 if None, will load timings of last build from doc root and save after full build
     '''
+    save_manifest = manifest is None
+    if save_manifest:
+        manifest = Manifest(out_dir, doc_src_path)
+    save_timings = timings is None
+    if save_timings:
+        timings = Timings(doc_src_path)
+    if not _build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir, log, update_files,
+                  preview_mode, max_threads_num, multiprocess, parse_pages, copy_assets,
+                  is_build, layout_usage_queue, rebuild_docs, only_urls, manifest, page_weights, mem_report, timings):
+        return False
+    if save_manifest:
+        manifest.save()
+    if save_timings and not update_files:
+        timings.log_balance(log)
+        try:
+            timings.save()
+        except Exception as e:
+            log.w("save build timings fail: {}".format(e))
+    return True
+
+def _build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir, log, update_files,
+             preview_mode, max_threads_num, multiprocess, parse_pages, copy_assets,
+             is_build, layout_usage_queue, rebuild_docs, only_urls, manifest, page_weights, mem_report, timings):
+    def mem_stage(name, htmls = None):
+        if mem_report is not None:
+            mem_report.stage(name, htmls = sum(len(v) for v in htmls.values()) if htmls else 0)
     # check routes
     if not update_files:
         if not check_udpate_routes(site_config, doc_src_path, log):
@@ -1599,9 +1930,10 @@ def build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir,
             ok, htmls_files = parse("doc", "on_parse_files", routes, routes_trans, site_config, doc_src_path, config_template_dir, log, out_dir, plugins_objs,
                         sidebar=True, allow_no_navbar=False, update_files=update_files, max_threads_num=max_threads_num, preview_mode=preview_mode,
                         html_templates_i18n_dirs = html_templates_i18n_dirs, multiprocess = multiprocess, is_build = is_build, layout_usage_queue=layout_usage_queue,
-                        rebuild_docs = rebuild_docs)
+                        rebuild_docs = rebuild_docs, only_urls = only_urls, manifest = manifest, page_weights = page_weights, mem_report = mem_report, timings = timings)
             if not ok:
                 return False
+            mem_stage("parse docs", htmls_files)
         # parse all pages
         if "pages" in site_config["route"]:
             routes = site_config["route"]["pages"]
@@ -1609,9 +1941,10 @@ def build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir,
             ok, htmls_pages = parse("page", "on_parse_pages", routes, routes_trans, site_config, doc_src_path, config_template_dir, log, out_dir, plugins_objs,
                         sidebar=False, allow_no_navbar=True, update_files=update_files, max_threads_num=max_threads_num, preview_mode=preview_mode,
                         html_templates_i18n_dirs = html_templates_i18n_dirs, multiprocess = multiprocess, is_build = is_build, layout_usage_queue = layout_usage_queue,
-                        rebuild_docs = rebuild_docs)
+                        rebuild_docs = rebuild_docs, only_urls = only_urls, manifest = manifest, page_weights = page_weights, mem_report = mem_report, timings = timings)
             if not ok:
                 return False
+            mem_stage("parse pages", htmls_pages)
         # parse all blogs
         htmls_blog = None
         if "blog" in site_config["route"]:
@@ -1619,9 +1952,10 @@ def build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir,
             ok, htmls_blog = parse("blog", "on_parse_blog", routes, {}, site_config, doc_src_path, config_template_dir, log, out_dir, plugins_objs,
                         sidebar={"items":[]}, allow_no_navbar=True, update_files=update_files, max_threads_num=max_threads_num, preview_mode=preview_mode,
                         html_templates_i18n_dirs = html_templates_i18n_dirs, multiprocess = multiprocess, is_build = is_build, layout_usage_queue = layout_usage_queue,
-                        rebuild_docs = rebuild_docs)
+                        rebuild_docs = rebuild_docs, only_urls = only_urls, manifest = manifest, page_weights = page_weights, mem_report = mem_report, timings = timings)
             if not ok:
                 return False
+            mem_stage("parse blog", htmls_blog)
         # parse all translate docs
         if "translate" in site_config:
             if "docs" in site_config["translate"]:
@@ -1630,6 +1964,8 @@ def build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir,
                     routes = {}
                     for dst in docs_translates[src]:
                         routes[dst["url"]] = dst["src"]
+                    if only_urls is not None and not only_urls.intersection(routes):
+                        continue
                     src_dir = site_config["route"]["docs"][src][1]
                     sidebar_dict = get_sidebar(src_dir, config_template_dir) # must be success
                     sidebar_list, not_found_items = get_sidebar_list(sidebar_dict, src_dir, src, log)
@@ -1639,7 +1975,7 @@ def build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir,
                                 html_templates_i18n_dirs = html_templates_i18n_dirs, multiprocess = multiprocess,
                                 translate=True, ref_doc_url=src, ref_doc_dir=src_dir, translate_src_sidebar_list = sidebar_list, is_build = is_build,
                                 layout_usage_queue = layout_usage_queue,
-                                rebuild_docs = rebuild_docs
+                                rebuild_docs = rebuild_docs, only_urls = only_urls, manifest = manifest, page_weights = page_weights, mem_report = mem_report, timings = timings
                                 )
                     #    create
                     htmls_files.update(htmls_files2)
@@ -1657,29 +1993,50 @@ def build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir,
                                 sidebar=False, allow_no_navbar=True, update_files=update_files, max_threads_num=max_threads_num, preview_mode=preview_mode,
                                 html_templates_i18n_dirs = html_templates_i18n_dirs, multiprocess = multiprocess,
                                 translate=True, ref_doc_url=src, ref_doc_dir=src_dir, is_build = is_build, layout_usage_queue = layout_usage_queue,
-                                rebuild_docs = rebuild_docs
+                                rebuild_docs = rebuild_docs, only_urls = only_urls, manifest = manifest, page_weights = page_weights, mem_report = mem_report, timings = timings
                                 )
                     #    create
                     htmls_pages.update(htmls_pages2)
                     if not ok:
                         return False
+            mem_stage("parse translate")
         # generate sitemap.xml
         if is_build: # only generate when build mode, not generate when preview mode
             sitemap_out_path = os.path.join(out_dir, "sitemap.xml")
             generate_sitemap(htmls_files, sitemap_out_path, site_config["site_domain"], site_config["site_protocol"], log)
+            manifest.add(sitemap_out_path)
 
         # send all htmls to plugins
         for plugin in plugins_objs:
+            rss = get_rss() if mem_report is not None else 0
             ok = plugin.on_htmls(htmls_files = htmls_files, htmls_pages = htmls_pages, htmls_blog = htmls_blog)
             if not ok:
                 return False
+            if mem_report is not None:
+                mem_report.add_part(plugin.name, get_rss() - rss)
+        mem_stage("plugins on_htmls")
 
     # copy assets
     if copy_assets:
         if not update_files:
             log.i("copy assets files")
         assets = site_config["route"]["assets"]
+        if g_overlay is not None:
+            # overlay mode, server read assets from source dirs, remove assets copied by last build,
+            # or they will be served instead of source files
+            if not update_files:
+                assets_dirs = [path + "/" for rel_dir, path in assets.values()]
+                for rel, entry in list(manifest.files.items()):
+                    if entry.get("plugin") or not entry.get("source"):
+                        continue
+                    source = os.path.join(doc_src_path, entry["source"]).replace("\\", "/")
+                    path = os.path.join(out_dir, rel)
+                    if any(source.startswith(d) for d in assets_dirs) and os.path.exists(path):
+                        os.remove(path)
+            assets = {}
         for target_dir, from_dir in assets.items(): 
+            if only_urls is not None and target_dir not in only_urls:
+                continue
             in_path  = from_dir[1]
             if target_dir.startswith("/"):
                 target_dir = target_dir[1:]
@@ -1693,9 +2050,22 @@ def build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir,
                         log.i("copy", file, out_path)
                         if not copy_file(file, out_path):
                             log.w("copy {} to {} fail".format(file, out_path))
+                        else:
+                            manifest.add(out_path, file)
             else:
                 if not copy_dir(in_path, out_path):
                     return False
+                manifest.add_dir(out_path, in_path)
+        # copy third-party assets of site_config vendored by `teedoc vendor`
+        if not update_files:
+            for dst, src in get_site_vendor_files(doc_src_path, site_config).items():
+                dst = os.path.join(out_dir, dst)
+                try:
+                    utils.copy_file_if_changed(src, dst)
+                except Exception:
+                    log.e("copy vendored file {} to {} error".format(src, dst))
+                    return False
+                manifest.add(dst, src)
         # copy files from pulgins
         log.i("copy assets files of plugins")
         for plugin in plugins_objs:
@@ -1706,14 +2076,19 @@ def build(doc_src_path, config_template_dir, plugins_objs, site_config, out_dir,
                 dst = os.path.join(out_dir, dst)
                 if not os.path.isabs(src):
                     log.e("plugin <{}> on_copy_files error, file path {} must be abspath".format(plugin.name, src))
-                if not copy_file(src, dst):
+                try:
+                    utils.copy_file_if_changed(src, dst)
+                except Exception:
                     log.e("copy plugin <{}> file {} to {} error".format(plugin.name, src, dst))
                     return False
+                manifest.add(dst, src, plugin.name)
         # preview mode js
         if preview_mode:
             js_out_dir = os.path.join(out_dir, "static/js")
             curr_dir_path = os.path.dirname(os.path.abspath(__file__))
             copy_file(os.path.join(curr_dir_path, "static", "js", "live.js"), os.path.join(js_out_dir, "live.js"))
+            manifest.add(os.path.join(js_out_dir, "live.js"))
+        mem_stage("copy assets")
     return True
 
 def get_layout_used_by(layout_root, path, layout_usages):
@@ -1735,86 +2110,88 @@ def check_layout_usage(files, layout_root, layout_usages):
             final_files.append(path)
     return final_files
 
-def files_watch(doc_src_path, site_config, log, delay_time, queue, layout_usage_queue):
+def files_watch(doc_src_path, site_config, log, delay_time, queue, layout_usage_queue, config_template_dir = None):
+    '''
+        watch route dirs and layout dir, put changed files list to queue after changes stopped for delay_time,
+        bulk changes(e.g. git checkout) are collapsed to one list
+    '''
     from watchdog.observers import Observer
-    from watchdog.events import RegexMatchingEventHandler
+    from watchdog.events import FileSystemEventHandler
     import time
     import threading
-
-    class FileEventHandler(RegexMatchingEventHandler):
-        def __init__(self, doc_src_path):
-            RegexMatchingEventHandler.__init__(self, ignore_regexes=[r"[\\\/]+out[\\\/]+", r"[\\\/]+.git[\\\/]", r".*\.\~.*?\..*", r".*\.sw"])
-            self.update_files = []
+    try:
+        from .watch import get_ignore_rules, get_watch_dirs, is_batch_ready, BULK_EVENTS
+    except Exception:
+        from watch import get_ignore_rules, get_watch_dirs, is_batch_ready, BULK_EVENTS
+
+    class FileEventHandler(FileSystemEventHandler):
+        def __init__(self, doc_src_path, ignore_rules):
+            FileSystemEventHandler.__init__(self)
+            self.update_files = set()
+            self.events = 0
+            self.first_time = 0
+            self.last_time = 0
             self.doc_src_path = doc_src_path
+            self.ignore_rules = ignore_rules
             self.lock = threading.Lock()
-
-        def get_update_files(self):
-            self.lock.acquire()
-            self.update_files = list(set(self.update_files))  # remove dumplicated files
-            files = self.update_files
-            if files:
-                self.update_files = []
-            self.lock.release()
-            return files
-
-        def _append_files(self, files):
-            self.lock.acquire()
-            self.update_files.extend(files)
-            self.lock.release()
+            self.event = threading.Event()
+
+        def get_update_files(self, delay_time):
+            '''
+                @return changed files if batch ready, or None
+            '''
+            with self.lock:
+                if not is_batch_ready(delay_time, self.events, self.first_time, self.last_time, time.time()):
+                    return None
+                files = list(self.update_files)
+                events = self.events
+                self.update_files = set()
+                self.events = 0
+            return files, events
+
+        def _append_file(self, path):
+            path = os.path.abspath(os.path.join(self.doc_src_path, path)).replace("\\", "/")
+            if self.ignore_rules.match(path):
+                return
+            with self.lock:
+                now = time.time()
+                if not self.events:
+                    self.first_time = now
+                self.last_time = now
+                self.events += 1
+                self.update_files.add(path)
+            self.event.set()
 
         def on_moved(self, event):
-            if event.is_directory:
-                # print("directory created:{0}".format(event.src_path))
-                pass
-            else:
-                print("file moved:{0}".format(event.dest_path))
-                files = [os.path.abspath(os.path.join(self.doc_src_path, event.dest_path)).replace("\\", "/")]
-                self._append_files(files)
+            if not event.is_directory:
+                log.df("file moved:{}", event.dest_path)
+                self._append_file(event.dest_path)
 
         def on_created(self, event):
-            if event.is_directory:
-                log.d("directory created:{0}".format(event.src_path))
-                pass
-            else:
-                log.d("file created:{0}".format(event.src_path))
-                files = [os.path.abspath(os.path.join(self.doc_src_path, event.src_path)).replace("\\", "/")]
-                self._append_files(files)
-
-        def on_deleted(self, event):
-            pass
+            if not event.is_directory:
+                log.df("file created:{}", event.src_path)
+                self._append_file(event.src_path)
 
         def on_modified(self, event):
-            if event.is_directory:
-                # print("directory modified:{0}".format(event.src_path))
-                pass
-            else:
-                log.d("file modified:{0}".format(event.src_path))
-                files = [os.path.abspath(os.path.join(self.doc_src_path, event.src_path)).replace("\\", "/")]
-                self._append_files(files)
+            if not event.is_directory:
+                log.df("file modified:{}", event.src_path)
+                self._append_file(event.src_path)
 
     layout_root = get_layout_root(doc_src_path, site_config)
     observer = Observer()
-    handler = FileEventHandler(doc_src_path)
-    files = os.listdir(doc_src_path)
-    ignores = [".git", "out"]
+    handler = FileEventHandler(doc_src_path, get_ignore_rules(doc_src_path, site_config))
     layout_usages = {}
-    for name in files:
-        if name in ignores:
-            continue
-        observer.schedule(handler, os.path.join(doc_src_path, name), recursive = True)
+    for path, recursive in get_watch_dirs(doc_src_path, site_config, layout_root, config_template_dir):
+        log.df("watch {}{}", path, "" if recursive else " (not recursive)")
+        observer.schedule(handler, path, recursive = recursive)
     observer.start()
     try:
         while True:
-            time.sleep(delay_time)
-            update_files = handler.get_update_files()
-            # TODO: check translate po files change in layout_root/locales dir
-            update_files = check_layout_usage(update_files, layout_root, layout_usages)
-            if update_files:
-                log.i("file changes detected:", update_files)
-                queue.put(update_files)
+            handler.event.wait(0.1)
+            handler.event.clear()
             try:
                 while 1:
-                    layout, file = layout_usage_queue.get(timeout=0.1)
+                    layout, file = layout_usage_queue.get_nowait()
                     if not layout in layout_usages:
                         layout_usages[layout] = [file]
                     else:
@@ -1822,6 +2199,20 @@ def files_watch(doc_src_path, site_config, log, delay_time, queue, layout_usage_
                             layout_usages[layout].append(file)
             except Exception as e:
                 pass
+            res = handler.get_update_files(delay_time)
+            if not res:
+                continue
+            update_files, events = res
+            # TODO: check translate po files change in layout_root/locales dir
+            update_files = check_layout_usage(update_files, layout_root, layout_usages)
+            # temp files of editors removed already
+            update_files = [path for path in update_files if os.path.exists(path)]
+            if update_files:
+                if events >= BULK_EVENTS:
+                    log.i("file changes detected: {} events, {} files".format(events, len(update_files)))
+                else:
+                    log.i("file changes detected:", update_files)
+                queue.put(update_files)
     except KeyboardInterrupt:
         observer.stop()
         observer.join()
@@ -1831,16 +2222,34 @@ def files_watch(doc_src_path, site_config, log, delay_time, queue, layout_usage_
 def main():
     try:
         from .logger import Logger
-        from .http_server import HTTP_Server
         from .version import __version__
         from .utils import sidebar_summary2dict
+        from .shard import parse_shard_arg, get_shard_dir, get_shard_urls, get_shards_dirs, merge_shards
+        from .shard import get_scoped_urls, save_scoped_outputs, merge_scoped_outputs
+        from .page_weight import Page_Weight_Report, log_report, save_report
+        from .mem_report import Mem_Report, log_report as log_mem_report, save_report as save_mem_report
+        from .out_store import STORE_TYPES, get_store, save_store, get_default_store_path
+        from .versions import parse_versions_arg, prepare_worktrees, get_versions_info
+        from .parse_cache import Parse_Cache, get_backend, serve_cache
+        from .install import install_plugins
+        from .vendor import get_assets, vendor_assets
+        from .plugin import prune_assets_cache
     except Exception:
         from logger import Logger
-        from http_server import HTTP_Server
         from version import __version__
         from utils import sidebar_summary2dict
+        from shard import parse_shard_arg, get_shard_dir, get_shard_urls, get_shards_dirs, merge_shards
+        from shard import get_scoped_urls, save_scoped_outputs, merge_scoped_outputs
+        from page_weight import Page_Weight_Report, log_report, save_report
+        from mem_report import Mem_Report, log_report as log_mem_report, save_report as save_mem_report
+        from out_store import STORE_TYPES, get_store, save_store, get_default_store_path
+        from versions import parse_versions_arg, prepare_worktrees, get_versions_info
+        from parse_cache import Parse_Cache, get_backend, serve_cache
+        from install import install_plugins
+        from vendor import get_assets, vendor_assets
+        from plugin import prune_assets_cache
     import argparse
-    import json, yaml
+    import json
     import threading
     from queue import Queue, Empty
     from multiprocessing import Queue as MultiQueue
@@ -1873,20 +2282,47 @@ def main():
     parser.add_argument("--port", type=int, default=2333, help="port for serve command")
     parser.add_argument("-m", "--multiprocess", action="store_true", default=not platform.system().lower().strip() in ['windows'], help="use multiple process instead of threads, default mutiple process in unix like systems" )
     parser.add_argument("--fast", action="store_true", default=False, help="fast build mode for serve command")
+    parser.add_argument("--overlay", action="store_true", default=False, help="for serve command, not copy assets dirs and files not parsed to out dir, server read them from source dirs directly, changes are visible immediately")
     parser.add_argument("--template", type=str, default=None, help="for init command, based on which template to create project", choices=list(templates.keys()))
     parser.add_argument("--search-dir", type=str, default=None, help="local plugins search dir for install command, install plugins from local dir and ignore site_config plugin from keyword")
-    parser.add_argument("command", choices=["install", "init", "build", "serve", "json2yaml", "yaml2json", "summary2yaml", "summary2json", "translate"])
+    parser.add_argument("--find-links", type=str, action="append", default=None, help="for install command, local dir of plugins' wheels, pass to pip --find-links, can be used multiple times")
+    parser.add_argument("--offline", action="store_true", default=False, help="for install command, not access package index, only install from --find-links or --wheel-dir")
+    parser.add_argument("--wheel-dir", type=str, default=None, help="for install command, wheels cache dir, wheels of plugins and dependencies are downloaded or built to it once, then always install from it")
+    parser.add_argument("--shard", type=str, default=None, help='for build command, only build one shard of all routes and translations, format "index/total", e.g. "3/8", output to shards dir, use merge command to merge all shards to out dir')
+    parser.add_argument("--only", type=str, action="append", default=None, help='for build and serve command, only build these routes and their translations to out dir of last build, e.g. "/develop/zh/", split by comma or use multiple times, sitemap, search index and blog index are merged with last build')
+    parser.add_argument("--locale", type=str, default=None, help='for build and serve command, only build routes and translations of these locales, split by comma, e.g. "zh" or "zh_CN,en", can be used with --only')
+    parser.add_argument("--shards-dir", type=str, default=None, help="for build --shard and merge command, dir to save shards, default out_shards in doc root dir")
+    parser.add_argument("--page-weight", type=str, nargs="?", const="", default=None, help='for build command, generate page weight report, optional arg is report json file path, budgets config see "page_weight" in site_config')
+    parser.add_argument("--mem-report", type=str, nargs="?", const="", default=None, help="for build command, report peak memory(RSS) of main process at every build stage, of every worker and plugin, optional arg is report json file path")
+    parser.add_argument("--mem-trace", type=int, default=0, help="for build command with --mem-report, use tracemalloc to record top N allocators of every stage, slow, only for debug")
+    parser.add_argument("--store", type=str, default="dir", choices=STORE_TYPES, help="for build command, save output to store after build, dir: out dir only, zip/tar/tar.gz/tar.zst: one archive file, cas: deduplicate files with the same content by hardlinks of content addressed blobs")
+    parser.add_argument("--store-path", type=str, default=None, help="for build command, path of store, default out.<type> for archive, .teedoc_cache/objects for cas in doc root dir; for serve command, serve this out dir or archive directly without build")
+    parser.add_argument("--io-threads", type=int, default=2, help="for build command, I/O threads of every worker, read source files ahead and write pages in background, 0 means not use I/O threads")
+    parser.add_argument("--stream-render-size", type=int, default=1024 * 1024, help="for build command, pages with body larger than this size(bytes) are rendered as stream and written to file chunk by chunk, 0 means never")
+    parser.add_argument("--check-fragments", action="store_true", default=False, help="for build command, render every page again without template fragment cache and compare, for debug templates' {%% cache %%} blocks")
+    parser.add_argument("--versions", type=str, default=None, help='for build command, build multiple versions from git refs to out/<version>/, format "name:ref" or "ref" split by comma, e.g. "v1:release-1.x,v2,main", a version selection is added to navbar')
+    parser.add_argument("--sites", type=str, nargs="+", default=None, help="for build command, build multiple sites in one process, args are doc root dirs, or one file list doc root dirs(json list or one dir per line)")
+    parser.add_argument("--log-json", type=str, default=None, help="also write log to this file, one json object per line with pid, route and elapsed time fields, for CI analysis")
+    parser.add_argument("--cache", type=str, default=os.environ.get("TEEDOC_CACHE", None), help="for build and serve command, shared cache of plugins' parse result, local dir, NFS path or http(s) url, default env TEEDOC_CACHE; for cache-server command, dir to save cache")
+    parser.add_argument("--service-worker", action="store_true", default=False, help='for build and merge command, generate service worker sw.js to precache theme assets, css and search index and cache visited pages for offline reading, config see "service_worker" in site_config')
+    parser.add_argument("--reproducible", action="store_true", default=False, help="for build command, output byte-identical files for the same source, dates of files not in git use env SOURCE_DATE_EPOCH(default time of last git commit), indexes and sitemap are sorted, modify time of out files are set to it. Set env SOURCE_DATE_EPOCH have the same effect")
+    parser.add_argument("--vendor-from", type=str, default=None, help="for vendor command, import third-party assets from this local dir instead of download, file name is the last part of url, for offline environment")
+    parser.add_argument("command", choices=["install", "init", "build", "serve", "json2yaml", "yaml2json", "summary2yaml", "summary2json", "translate", "merge", "cache-server", "vendor"])
     args = parser.parse_args()
 
     if args.log_level == "d":
         log_format = '%(asctime)s - [%(levelname)s] - [%(processName)s - %(threadName)s] %(message)s'
     else:
         log_format = '%(asctime)s - [%(levelname)s] -%(message)s'
-    log = Logger(level=args.log_level, fmt=log_format)
+    log = Logger(level=args.log_level, fmt=log_format, json_path=args.log_json)
+    Renderer.check_fragments = args.check_fragments
+    Renderer.stream_size = args.stream_render_size
+    IO_Pool.threads = args.io_threads
     if not utils.check_git():
         log.w("git not found, please install git first")
     # convert json or yaml file
     if args.command == "json2yaml":
+        import yaml
         if not os.path.exists(args.file):
             log.e("file {} not found".format(args.file))
             return 1
@@ -1899,6 +2335,7 @@ def main():
             log.i("convert yaml from json complete, file at: {}".format(yaml_path))
         return 0
     elif args.command == "yaml2json":
+        import yaml
         if not os.path.exists(args.file):
             log.e("file {} not found".format(args.file))
             return 1
@@ -1921,6 +2358,7 @@ def main():
             log.i("convert json from gitbook summary complete, file at: {}".format(json_path))
         return 0
     elif args.command == "summary2yaml":
+        import yaml
         if not os.path.exists(args.file):
             log.e("file {} not found".format(args.file))
             return 1
@@ -1939,6 +2377,10 @@ def main():
             return 1
         layout_root = get_layout_root(args.dir, site_config)
         return trans_main("all", layout_root, rm_meta=True)
+    elif args.command == "cache-server":
+        if serve_cache(os.path.abspath(args.cache or os.path.join(args.dir, ".teedoc_cache", "shared")), args.host, args.port, log) is False:
+            return 1
+        return 0
     elif args.command == "init":
         log.i("init doc now")
         if not os.path.exists(args.dir):
@@ -1984,11 +2426,66 @@ def main():
     t2 = None
     t_build = None
     log.i(f"teedoc version: {__version__}")
+    sites_dirs = [args.dir]
+    if args.sites:
+        if args.command != "build":
+            log.e("--sites only support build command")
+            return 1
+        if args.shard:
+            log.e("--sites can not be used with --shard")
+            return 1
+        try:
+            sites_dirs = get_sites_dirs(args.sites)
+        except Exception as e:
+            log.e(str(e))
+            return 1
+    versions = None
+    if args.versions:
+        if args.command != "build" or args.sites or args.shard:
+            log.e("--versions only support build command, and can not be used with --sites or --shard")
+            return 1
+        versions_root = os.path.abspath(args.dir).replace("\\", "/")
+        try:
+            versions = parse_versions_arg(args.versions)
+            sites_dirs = prepare_worktrees(versions_root, versions, log)
+        except Exception as e:
+            log.e(str(e))
+            return 1
+    global g_parse_cache
+    if versions or args.cache:
+        # all versions share parse result of the same files
+        cache_root = os.path.abspath(args.dir).replace("\\", "/")
+        g_parse_cache = Parse_Cache(os.path.join(cache_root, ".teedoc_cache", "parse"), get_backend(args.cache) if args.cache else None, log)
+        if args.cache:
+            log.i("use remote cache: {}".format(args.cache))
+    # reproducible build, dates use SOURCE_DATE_EPOCH instead of files' modify time, all indexes sorted,
+    # env is inherited by sub processes and plugins
+    try:
+        epoch = utils.get_source_date_epoch()
+    except Exception as e:
+        log.e(str(e))
+        return 1
+    if args.reproducible and epoch is None:
+        epoch = utils.get_git_commit_time(os.path.abspath(args.dir))
+        if epoch is None:
+            log.e("--reproducible need env SOURCE_DATE_EPOCH, or doc root dir in git repository to use time of last commit")
+            return 1
+        os.environ["SOURCE_DATE_EPOCH"] = str(epoch)
+    if epoch is not None:
+        log.i("reproducible build, SOURCE_DATE_EPOCH: {}".format(epoch))
+        # dates converted by plugins and templates should not depend on timezone of build machine
+        os.environ["TZ"] = "UTC"
+        if hasattr(time, "tzset"):
+            time.tzset()
+    site_idx = 0
+    t_start = time.time()
     while 1: # for rebuild all files
         plugins_objs = []
         try:
             # doc source code root path
-            doc_src_path = os.path.abspath(args.dir).replace("\\", "/")
+            doc_src_path = os.path.abspath(sites_dirs[site_idx]).replace("\\", "/")
+            if len(sites_dirs) > 1:
+                log.i("build site {}/{}: {}".format(site_idx + 1, len(sites_dirs), doc_src_path))
             # parse site config
             ok, site_config = parse_site_config(doc_src_path)
             if not ok:
@@ -2005,13 +2502,58 @@ def main():
             else:
                 serve_dir = os.path.join(doc_src_path, "out").replace("\\", "/")
                 out_dir = serve_dir
+            # version built to out/<version>/ of doc root dir, site_root_url of version is <site_root_url><version>/
+            if versions:
+                version = versions[site_idx][0]
+                site_config["versions"] = get_versions_info(versions, version, site_config["site_root_url"])
+                site_config["site_root_url"] = "{}{}/".format(site_config["site_root_url"], version)
+                serve_dir = os.path.join(versions_root, "out").replace("\\", "/")
+                out_dir = os.path.join(serve_dir, site_config["site_root_url"][1:]).replace("\\", "/")
+                log.i("build version {} to {}".format(version, out_dir))
+            # shard
+            shards_dir = os.path.abspath(args.shards_dir if args.shards_dir else os.path.join(doc_src_path, "out_shards")).replace("\\", "/")
+            only_urls = None
+            if args.shard and args.command == "build":
+                try:
+                    shard_index, shard_total = parse_shard_arg(args.shard)
+                except Exception as e:
+                    log.e(str(e))
+                    return 1
+                # plugins use raw routes config when init, so check routes on a copy
+                _site_config = copy.deepcopy(site_config)
+                if not check_udpate_routes(_site_config, doc_src_path, log):
+                    return 1
+                only_urls = get_shard_urls(_site_config, shard_index, shard_total)
+                serve_dir = get_shard_dir(shards_dir, shard_index, shard_total)
+                out_dir = os.path.join(serve_dir, site_config["site_root_url"][1:]).replace("\\", "/")
+                log.i("build shard {}/{} to {}, urls: {}".format(shard_index, shard_total, serve_dir, sorted(only_urls)))
+            # scoped build, only build some routes to out dir of last build
+            scoped_config = None
+            if (args.only or args.locale) and args.command in ["build", "serve"]:
+                if args.shard or args.sites or versions:
+                    log.e("--only and --locale can not be used with --shard, --sites or --versions")
+                    return 1
+                scoped_config = copy.deepcopy(site_config)
+                if not check_udpate_routes(scoped_config, doc_src_path, log):
+                    return 1
+                only = [url.strip() for arg in (args.only or []) for url in arg.split(",") if url.strip()]
+                locales = [locale.strip() for locale in (args.locale or "").split(",") if locale.strip()]
+                try:
+                    only_urls = get_scoped_urls(scoped_config, only, locales, get_url_locales(scoped_config, config_template_dir))
+                except Exception as e:
+                    log.e(str(e))
+                    return 1
+                if not only_urls:
+                    log.e("no route or translation matches --only {} --locale {}".format(only, locales))
+                    return 1
+                log.i("scoped build, urls: {}".format(sorted(only_urls)))
             # thread num
             if args.thread > 0:
                 max_threads_num = args.thread
             else:
                 max_threads_num = multiprocessing.cpu_count()
             log.i("max thread number: {}".format(max_threads_num))
-            if args.command in ["build", "serve"]:
+            if args.command in ["build", "serve", "vendor"]:
                 # init plugins
                 plugins = list(site_config['plugins'].keys())
                 log.i("plugins: {}".format(plugins))
@@ -2031,6 +2573,8 @@ def main():
                         sys.path.insert(0, os.path.abspath(os.path.join(args.search_dir, plugin)))
                     plugin_import_name = plugin.replace("-", "_")
                     module = __import__(plugin_import_name)
+                    if len(sites_dirs) > 1 and os.path.exists(path) and not os.path.abspath(module.__file__).startswith(path + os.sep):
+                        log.w("plugin {} already imported from {}, not from {}, sites built together should use the same plugin version".format(plugin, os.path.dirname(module.__file__), path))
                     log.i(f"== plugin {plugin} v{module.__version__} ==")
                     plugin_obj = module.Plugin(doc_src_path=doc_src_path, config=plugin_config, site_config=site_config, logger=log, multiprocess = args.multiprocess)
                     plugin_obj.module_path = os.path.abspath(os.path.dirname(module.__file__))
@@ -2044,84 +2588,193 @@ def main():
                 if plugins_dir and not os.path.exists(plugins_dir):
                     log.e("plugins dir not exist: {}".format(plugins_dir))
                     sys.exit(1)
-                for plugin, info in site_config['plugins'].items():
-                    path = info["from"]
-                    local_path = None
-                    if plugins_dir:
-                        local_path = utils.find_plugin_in_dir(plugins_dir, plugin)
-                    # force install from local source code
-                    if local_path:
-                        log.i("install plugin <{}> from {}".format(plugin, local_path))
-                        cmd = [f'"{sys.executable}"', "-m", "pip", "install", "--upgrade", local_path]
-                        p = subprocess.Popen(" ".join(cmd), shell=True)
-                        out, err_out, = p.communicate()
-                        if p.returncode != 0:
-                            log.e("install <{}> fail".format(plugin))
-                            return 1
-                        log.i("install <{}> complete".format(plugin))
-                    # install from pypi.org
-                    elif (not path) or path.lower() == "pypi":
-                        if "version" in info:
-                            plugin = f"{plugin}=={info['version']}"
-                        log.i("install plugin <{}> from pypi.org".format(plugin))
-                        if args.index_url:
-                            cmd = [f'"{sys.executable}"', "-m", "pip", "install", "--upgrade", plugin, "-i", args.index_url]
-                        else:
-                            cmd = [f'"{sys.executable}"', "-m", "pip", "install", "--upgrade", plugin]
-                        p = subprocess.Popen(" ".join(cmd), shell=True)
-                        out, err_out, = p.communicate()
-                        if p.returncode != 0:
-                            log.e("install <{}> fail".format(plugin))
-                            return 1
-                        log.i("install <{}> complete".format(plugin))
-                    # install from git like: git+https://github.com/Neutree/COMTool.git#egg=comtool
-                    elif path.startswith("svn") or path.startswith("git"):
-                        log.i("install plugin <{}> from {}".format(plugin, path))
-                        cmd = [f'"{sys.executable}"', "-m", "pip", "install", "-e", path]
-                        log.i("install <{}> by pip: {}".format(plugin, " ".join(cmd)))
-                        p = subprocess.Popen(" ".join(cmd), shell=True)
-                        out, err_out, = p.communicate()
-                        if p.returncode != 0:
-                            log.e("install <{}> fail".format(plugin))
-                            return 1
-                        log.i("install <{}> complete".format(plugin))
-                    # install from local file system
-                    else:
-                        log.i("Use local plugin <{}> from {}".format(plugin, path))
+                find_links = args.find_links or []
+                if args.offline and not find_links and not args.wheel_dir:
+                    log.e("--offline need --find-links or --wheel-dir to install plugins from")
+                    return 1
+                if not install_plugins(site_config['plugins'], log, plugins_dir=plugins_dir, index_url=args.index_url,
+                                       find_links=find_links, offline=args.offline, wheel_dir=args.wheel_dir,
+                                       cache_dir=os.path.join(doc_src_path, ".teedoc_cache")):
+                    return 1
                 os.chdir(curr_path)
                 log.i("all plugins install complete")
+            elif args.command == "vendor":
+                # fetch third-party assets of plugins and site_config to local cache, build use them instead of CDN
+                try:
+                    assets = get_assets(plugins_objs, site_config)
+                except Exception as e:
+                    log.e(str(e))
+                    return 1
+                if not assets:
+                    log.i("no third-party assets to vendor")
+                elif not vendor_assets(doc_src_path, assets, log, args.vendor_from):
+                    return 1
+                log.i("vendor ok")
             elif args.command == "build":
-                # parse files
-                if not build(doc_src_path, config_template_dir, plugins_objs, site_config=site_config, out_dir=out_dir, log=log,
-                            preview_mode=args.preview, max_threads_num=max_threads_num, multiprocess=args.multiprocess, is_build=True):
+                if args.service_worker and not site_config.get("service_worker"):
+                    site_config["service_worker"] = {}
+                try:
+                    service_worker_config = get_service_worker_config(site_config)
+                except Exception as e:
+                    log.e(str(e))
                     return 1
-                add_robots_txt(site_config, out_dir, log)
+                # parse files
+                manifest = Manifest(out_dir, doc_src_path)
+                page_weight_config = site_config.get("page_weight", None)
+                if args.page_weight is not None and page_weight_config is None:
+                    page_weight_config = {}
+                page_weights = {} if page_weight_config is not None else None
+                mem_report = Mem_Report(args.mem_trace) if args.mem_report is not None else None
+                scoped_save_dir = None
+                if scoped_config is not None:
+                    # outputs generated from all pages are overwritten by build, save them to merge after build
+                    scoped_save_dir = tempfile.mkdtemp(prefix="teedoc_scoped_")
+                    if not save_scoped_outputs(out_dir, scoped_save_dir) and not manifest.files:
+                        log.w("no output of last build in {}, only scoped routes will be built, run a full build first".format(out_dir))
+                try:
+                    if not build(doc_src_path, config_template_dir, plugins_objs, site_config=site_config, out_dir=out_dir, log=log,
+                                preview_mode=args.preview, max_threads_num=max_threads_num, multiprocess=args.multiprocess, is_build=True,
+                                only_urls=only_urls, manifest=manifest, page_weights=page_weights, mem_report=mem_report):
+                        return 1
+                    if scoped_save_dir:
+                        merge_scoped_outputs(scoped_save_dir, out_dir, scoped_config, only_urls, log)
+                finally:
+                    if scoped_save_dir:
+                        shutil.rmtree(scoped_save_dir, ignore_errors=True)
+                add_robots_txt(site_config, out_dir, log, manifest)
+                if service_worker_config is not None and not args.preview:
+                    # precache revisions are hashes of manifest, only changed files need hash
+                    manifest.sync()
+                    generate_service_worker(service_worker_config, site_config["site_root_url"], out_dir, manifest, log)
+                log.i("generate manifest")
+                manifest.save()
+                if mem_report is not None:
+                    mem_report.stage("manifest", files = len(manifest.files))
+                    report = mem_report.report()
+                    log_mem_report(report, log)
+                    if args.mem_report:
+                        report_path = args.mem_report if os.path.isabs(args.mem_report) else os.path.join(doc_src_path, args.mem_report)
+                        save_mem_report(report, report_path)
+                        log.i("memory report saved to {}".format(report_path))
+                if page_weights is not None:
+                    # page weight report, resources size get from manifest
+                    try:
+                        reporter = Page_Weight_Report(out_dir, site_config["site_root_url"], manifest.files, page_weight_config)
+                    except Exception as e:
+                        log.e("page_weight config error: {}".format(e))
+                        return 1
+                    report = reporter.generate({os.path.relpath(path, out_dir).replace("\\", "/"): weight for path, weight in page_weights.items()})
+                    log_report(report, log, page_weight_config.get("top", 10))
+                    report_path = args.page_weight or page_weight_config.get("report", None)
+                    if report_path:
+                        report_path = report_path if os.path.isabs(report_path) else os.path.join(doc_src_path, report_path)
+                        save_report(report, report_path)
+                        log.i("page weight report saved to {}".format(report_path))
+                    if report["exceeded"]:
+                        if page_weight_config.get("fail", False):
+                            log.e("{} pages exceed page weight budgets".format(len(report["exceeded"])))
+                            return 1
+                        log.w("{} pages exceed page weight budgets".format(len(report["exceeded"])))
+                if args.store != "dir":
+                    store_path = args.store_path or get_default_store_path(doc_src_path, args.store)
+                    store_path = store_path if os.path.isabs(store_path) else os.path.join(doc_src_path, store_path)
+                    log.i("save out files to {} store".format(args.store))
+                    try:
+                        info = save_store(get_store(args.store, store_path), serve_dir, out_dir, manifest.files)
+                    except Exception as e:
+                        log.e("save out store fail: {}".format(e))
+                        return 1
+                    log.i("out store: {}".format(info))
+                # rendered assets of all builds of current user, remove entries not used for a long time
+                removed = prune_assets_cache()
+                log.df("removed {} unused entries of assets cache", removed)
                 log.i("build ok")
+            elif args.command == "merge":
+                try:
+                    shards_dirs = get_shards_dirs(shards_dir)
+                except Exception as e:
+                    log.e(str(e))
+                    return 1
+                log.i("merge {} shards to {}".format(len(shards_dirs), serve_dir))
+                if not merge_shards(shards_dirs, serve_dir, site_config["site_root_url"], log, doc_src_path):
+                    return 1
+                if args.service_worker and not site_config.get("service_worker"):
+                    site_config["service_worker"] = {}
+                try:
+                    service_worker_config = get_service_worker_config(site_config)
+                except Exception as e:
+                    log.e(str(e))
+                    return 1
+                if service_worker_config is not None:
+                    # shards have only part of precache files, generate again with merged manifest
+                    manifest = Manifest(out_dir, doc_src_path)
+                    manifest.sync()
+                    generate_service_worker(service_worker_config, site_config["site_root_url"], out_dir, manifest, log)
+                    manifest.save()
+                log.i("merge ok")
+            elif args.command == "serve" and args.store_path:
+                # serve out dir or archive already built, no build and files watch
+                try:
+                    from .http_server import HTTP_Server
+                except Exception:
+                    from http_server import HTTP_Server
+                store_path = os.path.abspath(args.store_path).replace("\\", "/")
+                if not os.path.exists(store_path):
+                    log.e("store {} not exists".format(store_path))
+                    return 1
+                server = HTTP_Server(args.host, args.port, store_path)
+                log.i("serve store: {}".format(store_path))
+                log.i("Starting server at {}:{} ....".format(args.host, args.port))
+                server.run()
+                return 0
             elif args.command == "serve":
                 if args.fast:
                     log.w("using fast mode, will build when visit page, blog and search is not supported in this mode")
                 layout_usage_queue = MultiQueue() if args.multiprocess else Queue()
                 build_lock = threading.Lock()
+                if args.overlay:
+                    global g_overlay
+                    if g_overlay is None:
+                        g_overlay = Overlay(serve_dir)
+                    log.i("overlay mode, assets and files not parsed are served from source dirs, not copied to out dir")
+                scoped_save_dir = None
+                if scoped_config is not None:
+                    # assets are always needed to preview pages
+                    only_urls = only_urls.union(scoped_config["route"].get("assets", {}).keys())
+                    scoped_save_dir = tempfile.mkdtemp(prefix="teedoc_scoped_")
+                    save_scoped_outputs(out_dir, scoped_save_dir)
                 # if fast mode, only copy assets
-                if not build(doc_src_path, config_template_dir, plugins_objs, site_config=site_config, out_dir=out_dir, log=log,
-                            preview_mode = True, max_threads_num = max_threads_num,
-                            multiprocess = args.multiprocess,
-                            parse_pages = not args.fast,
-                            copy_assets = True, is_build = False,
-                            layout_usage_queue = layout_usage_queue):
-                    return 1
+                try:
+                    if not build(doc_src_path, config_template_dir, plugins_objs, site_config=site_config, out_dir=out_dir, log=log,
+                                preview_mode = True, max_threads_num = max_threads_num,
+                                multiprocess = args.multiprocess,
+                                parse_pages = not args.fast,
+                                copy_assets = True, is_build = False,
+                                layout_usage_queue = layout_usage_queue, only_urls = only_urls):
+                        return 1
+                    if scoped_save_dir:
+                        merge_scoped_outputs(scoped_save_dir, out_dir, scoped_config, only_urls, log)
+                finally:
+                    if scoped_save_dir:
+                        shutil.rmtree(scoped_save_dir, ignore_errors=True)
+                if g_overlay is not None:
+                    # routes updated to [rel_dir, abs_dir] by build
+                    g_overlay.set_dirs({os.path.join(out_dir, url.lstrip("/")): path for url, (rel_dir, path) in site_config["route"]["assets"].items()})
                 def build_all():
                     build(doc_src_path, config_template_dir, plugins_objs, site_config=site_config, out_dir=out_dir, log=log,
                             preview_mode = True, max_threads_num = max_threads_num,
                             multiprocess = args.multiprocess,
                             parse_pages = True,
-                            copy_assets = False, is_build = False, layout_usage_queue = layout_usage_queue)
+                            copy_assets = False, is_build = False, layout_usage_queue = layout_usage_queue, only_urls = only_urls)
                 # continue to build all pages
                 if args.fast and not t_build:
                     t_build = threading.Thread(target=build_all)
                     t_build.setDaemon(True)
                     t_build.start()
                 add_robots_txt(site_config, out_dir, log)
+                # rendered assets of all builds of current user, remove entries not used for a long time
+                removed = prune_assets_cache()
+                log.df("removed {} unused entries of assets cache", removed)
                 log.i("build ok")
 
                 host = (args.host, args.port)
@@ -2137,13 +2790,17 @@ def main():
                             build_lock.release()
 
                 if not t:
-                    queue = Queue(maxsize=50)
+                    queue = Queue()
                     delay_time = (int(site_config["rebuild_changes_delay"]) if "rebuild_changes_delay" in site_config else 3) if int(args.delay) < 0 else int(args.delay)
-                    t = threading.Thread(target=files_watch, args=(doc_src_path, site_config, log, delay_time, queue, layout_usage_queue))
+                    t = threading.Thread(target=files_watch, args=(doc_src_path, site_config, log, delay_time, queue, layout_usage_queue, config_template_dir))
                     t.daemon = True
                     t.start()
                     def server_loop(host, log):
-                        server = HTTP_Server(host[0], host[1], serve_dir, visit_callback=on_visit)
+                        try:
+                            from .http_server import HTTP_Server
+                        except Exception:
+                            from http_server import HTTP_Server
+                        server = HTTP_Server(host[0], host[1], serve_dir, visit_callback=on_visit, overlay=g_overlay)
                         log.i("root dir: {}".format(serve_dir))
                         log.i("Starting server at {}:{} ....".format(host[0], host[1]))
                         if host[0] == "0.0.0.0":
@@ -2162,6 +2819,13 @@ def main():
                         files_changed = queue.get(timeout=1)
                     except Empty:
                         continue
+                    # changes detected while building, rebuild together
+                    try:
+                        while 1:
+                            files_changed += queue.get_nowait()
+                    except Empty:
+                        pass
+                    files_changed = list(OrderedDict.fromkeys(files_changed))
                     # detect config.json or site_config.json change, if changed, update all docs file along with the json file
                     files = []
                     docs = []
@@ -2182,12 +2846,12 @@ def main():
                         else:                                 # normal file, nonly rebuild this file
                             files.append(path)
                     if files:
-                        if not build(doc_src_path, config_template_dir, plugins_objs, site_config=site_config, out_dir=out_dir, log=log, update_files = files, preview_mode=True, max_threads_num=max_threads_num, is_build=False, layout_usage_queue = layout_usage_queue):
+                        if not build(doc_src_path, config_template_dir, plugins_objs, site_config=site_config, out_dir=out_dir, log=log, update_files = files, preview_mode=True, max_threads_num=max_threads_num, is_build=False, layout_usage_queue = layout_usage_queue, only_urls = only_urls):
                             return 1
                         log.i("rebuild ok\n")
                     if docs:
                         if not build(doc_src_path, config_template_dir, plugins_objs, site_config=site_config, out_dir=out_dir, log=log, update_files = [], preview_mode=True, max_threads_num=max_threads_num, is_build=False, layout_usage_queue = layout_usage_queue,
-                                    rebuild_docs = docs):
+                                    rebuild_docs = docs, only_urls = only_urls):
                             return 1
                         log.i("rebuild ok\n")
                     if build_lock.locked():
@@ -2199,7 +2863,23 @@ def main():
                 return 1
         except RebuildException:
             continue
+        # multiple sites, plugins and temp dirs of this site released when plugins_objs reset,
+        # imported modules, worker processes' template cache and plugins' assets cache are shared
+        site_idx += 1
+        if site_idx < len(sites_dirs):
+            g_sitemap_content.clear()
+            continue
         break
+    if g_parse_cache is not None:
+        log.i(g_parse_cache.summary())
+    fragment_stats = get_fragment_cache_stats()
+    fragment_stats = {k: v + g_fragment_cache_stats[k] for k, v in fragment_stats.items()}
+    if fragment_stats["hits"] or fragment_stats["misses"]:
+        log.i("template fragment cache: {} hits, {} misses".format(fragment_stats["hits"], fragment_stats["misses"]))
+    if versions:
+        log.i("build {} versions ok, time: {:.1f}s".format(len(versions), time.time() - t_start))
+    elif len(sites_dirs) > 1:
+        log.i("build {} sites ok, time: {:.1f}s".format(len(sites_dirs), time.time() - t_start))
     return 0
 
 
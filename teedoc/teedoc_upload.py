@@ -1,42 +1,62 @@
 import os, sys
 import argparse
 import time
+import json
+import random
+import shutil
+import tempfile
+import threading
 from glob import glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from progress import bar, spinner
 try:
     from .teedoc_compare import get_changed_files
+    from .manifest import Manifest, MANIFEST_NAME, MANIFEST_VERSION
 except:
     from teedoc_compare import get_changed_files
+    from manifest import Manifest, MANIFEST_NAME, MANIFEST_VERSION
 
 
 class Qiniu():
-    def __init__(self, bucket, access_key, secret_key):
+    def __init__(self, bucket, access_key, secret_key, domain = None):
+        '''
+            @domain bucket domain, e.g. https://cdn.example.com, only needed by get()
+        '''
         import qiniu
         self.qiniu = qiniu
         self.bucket = bucket
-        self.access_key = access_key
-        self.secret_key = secret_key
+        self.domain = domain
+        # shared by all upload threads, only create once
+        self.auth = qiniu.Auth(access_key, secret_key)
+
+    def get(self, key):
+        '''
+            @return bytes, None if not exists
+        '''
+        import requests
+        if not self.domain:
+            raise Exception("qiniu need domain to download file")
+        url = self.auth.private_download_url("{}/{}".format(self.domain.rstrip("/"), key))
+        r = requests.get(url, timeout=60)
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return r.content
+
+    def delete(self, keys):
+        bucket = self.qiniu.BucketManager(self.auth)
+        for i in range(0, len(keys), 1000):
+            ret, info = bucket.batch(self.qiniu.build_batch_delete(self.bucket, keys[i : i + 1000]))
+            if info.status_code not in [200, 298]:
+                raise Exception("qiniu delete fail: {}".format(info))
 
     def upload(self, file_path, key):
-        fail_count = 3
-        while 1:
-            try:
-                q = self.qiniu.Auth(self.access_key, self.secret_key)
-                token = q.upload_token(self.bucket, key, 3600)
-                ret, info = self.qiniu.put_file(token, key, file_path, version='v2')
-                assert ret['key'] == key
-                assert ret['hash'] == self.qiniu.etag(file_path)
-            except Exception as e:
-                fail_count -= 1
-                if fail_count == 0:
-                    raise e
-                print("upload failed, retrying after 5s...")
-                time.sleep(5)
-                print("retrying...")
-                continue
-            if fail_count != 3:
-                print("upload success")
-            break
+        token = self.auth.upload_token(self.bucket, key, 3600)
+        ret, info = self.qiniu.put_file(token, key, file_path, version='v2')
+        if not ret:
+            raise Exception("qiniu upload fail: {}".format(info))
+        assert ret['key'] == key
+        assert ret['hash'] == self.qiniu.etag(file_path)
 
 class Tencentcloud_Uploader():
     def __init__(self, region, bucket, secret_id, secret_key, token, timeout = 256):
@@ -60,8 +80,8 @@ class Tencentcloud_Uploader():
         try:
             self.client = self._get_client(self.region, self.secret_id, self.secret_key, self.token, timeout)
         except Exception as e:
-            log.d("Init tencentcloud client fail, error: {}".format(e))
-            raise Internal_Error("upload init fail")
+            print("Init tencentcloud client fail, error: {}".format(e))
+            raise Exception("upload init fail")
 
     def _get_client(self, region, secret_id, secret_key, token, timeout):
         config = self.qloud_cos.CosConfig(
@@ -81,6 +101,25 @@ class Tencentcloud_Uploader():
         except Exception:
             pass
 
+    def get(self, key):
+        '''
+            @return bytes, None if not exists
+        '''
+        try:
+            rsp = self.client.get_object(Bucket=self.bucket, Key=key)
+        except self.qloud_cos.CosServiceError as e:
+            if e.get_status_code() == 404:
+                return None
+            raise e
+        return rsp["Body"].get_raw_stream().read()
+
+    def delete(self, keys):
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                "Quiet": "true",
+                "Object": [{"Key": key} for key in keys[i : i + 1000]]
+            })
+
     def upload(self, file_path, key, progress_callback = None):
         if not os.path.exists(file_path):
             raise Exception("upload file not exist")
@@ -97,6 +136,213 @@ class Tencentcloud_Uploader():
             print("tencentcloud upload fail, error: {}".format(e))
             raise Exception("upload execute fail")
 
+class Local_Dir_Uploader():
+    '''
+        upload(copy) files to local directory, can be used as fake bucket to test, or deploy to local web server's directory
+    '''
+    def __init__(self, dir):
+        self.dir = dir
+        os.makedirs(self.dir, exist_ok=True)
+
+    def upload(self, file_path, key):
+        dst = os.path.join(self.dir, key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        # copy to temp file then rename, never leave half written file
+        tmp_path = "{}.{}.uploading".format(dst, threading.get_ident())
+        shutil.copyfile(file_path, tmp_path)
+        os.replace(tmp_path, dst)
+
+    def get(self, key):
+        path = os.path.join(self.dir, key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def delete(self, keys):
+        for key in keys:
+            path = os.path.join(self.dir, key)
+            if os.path.exists(path):
+                os.remove(path)
+
+class Checkpoint():
+    '''
+        record uploaded files, one json per line, so an interrupted upload can resume,
+        file not changed(same size and modify time) after upload will be skipped next time
+        first line is target info, checkpoint of other target is ignored
+    '''
+    def __init__(self, path, target):
+        self.path = path
+        self.target = target
+        self.uploaded = {}
+        self.lock = threading.Lock()
+        self._load()
+        new = not os.path.exists(self.path) or not self.uploaded
+        self.f = open(self.path, "w" if new else "a", encoding="utf-8")
+        if new:
+            self.f.write(json.dumps({"target": self.target}) + "\n")
+            self.f.flush()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        try:
+            if json.loads(lines[0]).get("target") != self.target:
+                return
+        except Exception:
+            return
+        for line in lines[1:]:
+            try:
+                item = json.loads(line)
+            except Exception: # last line may be half written
+                continue
+            self.uploaded[item["key"]] = (item["size"], item["mtime"])
+
+    def _file_info(self, file_path):
+        st = os.stat(file_path)
+        return st.st_size, st.st_mtime_ns
+
+    def is_uploaded(self, file_path, key):
+        info = self.uploaded.get(key)
+        return info is not None and tuple(info) == self._file_info(file_path)
+
+    def add(self, file_path, key):
+        size, mtime = self._file_info(file_path)
+        with self.lock:
+            self.f.write(json.dumps({"key": key, "size": size, "mtime": mtime}) + "\n")
+            self.f.flush()
+
+    def close(self, remove = False):
+        self.f.close()
+        if remove:
+            os.remove(self.path)
+
+def upload_with_retry(uploader, file_path, key, retries = 5, delay = 1, max_delay = 60):
+    '''
+        retry with exponential backoff and full jitter, so many threads won't retry at the same time
+    '''
+    for i in range(retries + 1):
+        try:
+            uploader.upload(file_path, key)
+            return
+        except Exception as e:
+            if i == retries:
+                raise e
+            t = random.uniform(0, min(max_delay, delay * (2 ** i)))
+            print("upload {} failed: {}, retry after {:.1f}s".format(key, e, t), flush=True)
+            time.sleep(t)
+
+def upload_files(uploader, files, workers = 8, retries = 5, checkpoint = None, on_progress = None):
+    '''
+        upload files concurrently, uploader object is shared by all threads
+        @files list, [(abs_path, key), ...]
+        @checkpoint Checkpoint object, skip files already uploaded and record uploaded files
+        @on_progress function(), called after every file finished(or skipped)
+        @return list, failed files [(abs_path, key, error), ...]
+    '''
+    failed = []
+    todo = []
+    for abs, rel in files:
+        if checkpoint and checkpoint.is_uploaded(abs, rel):
+            if on_progress:
+                on_progress()
+            continue
+        todo.append((abs, rel))
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        futures = {}
+        for abs, rel in todo:
+            futures[executor.submit(upload_with_retry, uploader, abs, rel, retries)] = (abs, rel)
+        try:
+            for future in as_completed(futures):
+                abs, rel = futures[future]
+                try:
+                    future.result()
+                    if checkpoint:
+                        checkpoint.add(abs, rel)
+                except Exception as e:
+                    failed.append((abs, rel, e))
+                if on_progress:
+                    on_progress()
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            raise
+    return failed
+
+def get_sync_plan(local_files, remote_files):
+    '''
+        compare local manifest with remote manifest by hash
+        @local_files remote_files dict, files of manifest, {key: {"size": 12, "sha256": "..."}}
+        @return new, changed, deleted keys list
+    '''
+    new = []
+    changed = []
+    for key, entry in local_files.items():
+        remote = remote_files.get(key)
+        if not remote:
+            new.append(key)
+        elif remote.get("sha256") != entry["sha256"] or remote.get("size") != entry["size"]:
+            changed.append(key)
+    deleted = [key for key in remote_files if key not in local_files]
+    return new, changed, deleted
+
+def load_remote_manifest(uploader, remote_manifest_path = None):
+    '''
+        @remote_manifest_path local stand-in file of remote manifest, if None, download from bucket
+        @return dict, files of remote manifest, {} if not exists
+    '''
+    if remote_manifest_path:
+        if not os.path.exists(remote_manifest_path):
+            return {}
+        with open(remote_manifest_path, "rb") as f:
+            content = f.read()
+    else:
+        content = uploader.get(MANIFEST_NAME)
+        if content is None:
+            return {}
+    return json.loads(content.decode("utf-8"))["files"]
+
+def save_remote_manifest(uploader, files, remote_manifest_path = None):
+    '''
+        save manifest to bucket or local stand-in file atomically
+    '''
+    if remote_manifest_path:
+        os.makedirs(os.path.dirname(os.path.abspath(remote_manifest_path)), exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(remote_manifest_path, os.getpid())
+    else:
+        fd, tmp_path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    if remote_manifest_path:
+        os.replace(tmp_path, remote_manifest_path)
+        return
+    try:
+        uploader.upload(tmp_path, MANIFEST_NAME)
+    finally:
+        os.remove(tmp_path)
+
+def format_size(size):
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if size < 1024:
+            break
+        size /= 1024
+    return "{:.1f}{}".format(size, unit) if unit != "B" else "{}B".format(size)
+
+def print_sync_plan(new, changed, deleted, local_files, remote_files, prune, max_items = 20):
+    def print_items(title, keys, files):
+        print("{}: {} files, {}".format(title, len(keys), format_size(sum(files[key].get("size", 0) for key in keys))))
+        for key in keys[:max_items]:
+            print("    {}".format(key))
+        if len(keys) > max_items:
+            print("    ... and {} more".format(len(keys) - max_items))
+    print_items("new", new, local_files)
+    print_items("changed", changed, local_files)
+    print_items("deleted" if prune else "deleted(not prune, keep in remote)", deleted, remote_files)
+    print("unchanged: {} files".format(len(local_files) - len(new) - len(changed)), flush=True)
+
 def remove_tail(path):
     if path == "/":
         return path
@@ -166,11 +412,15 @@ tencent:
         --secret_id: user secret id
         --secret_key: user secret key
         --token: token, optional
+local:
+    copy files to local directory, e.g. for test or local web server
+    args:
+        --bucket: directory path
 '''
 
 def main():
-    parser = argparse.ArgumentParser(description="Upload files to cloud, only upload new file and modified file, won't delete file")
-    parser.add_argument("--cloud", type=str, default="tencent", help=cloud_help, choices=["qiniu", "tencent"])
+    parser = argparse.ArgumentParser(description="Upload files to cloud, only upload new file and modified file, won't delete file unless use `--sync --prune`")
+    parser.add_argument("--cloud", type=str, default="tencent", help=cloud_help, choices=["qiniu", "tencent", "local"])
     parser.add_argument("--bucket", type=str, default="", help="bucket name")
     parser.add_argument("--access_key", type=str, default="", help="access key")
     parser.add_argument("--secret_key", type=str, default="", help="secret key")
@@ -181,6 +431,15 @@ def main():
     parser.add_argument("--progress", type=str, default="bar", help="progress bar style, bar or spinner", choices=["bar", "chargingbar", "incrementalbar", "spinner", "raw"])
     parser.add_argument("--progress-interval", type=float, default=5, help="progress print interval, only for raw progress")
     parser.add_argument("--old", type=str, default="", help="compare two directories' different files to upload")
+    parser.add_argument("--workers", type=int, default=8, help="upload threads number")
+    parser.add_argument("--retries", type=int, default=5, help="retry times of one file if upload fail")
+    parser.add_argument("--checkpoint", type=str, default=None, help="checkpoint file path to record uploaded files, interrupted upload will resume from it, default `file_or_dir` + `.upload-checkpoint`, removed after all files uploaded")
+    parser.add_argument("--no-checkpoint", action="store_true", default=False, help="not use checkpoint")
+    parser.add_argument("--sync", action="store_true", default=False, help=f"sync mode, compare manifest({MANIFEST_NAME}) of directory with manifest stored in bucket by hash, only upload new and changed files, and update manifest in bucket")
+    parser.add_argument("--prune", action="store_true", default=False, help="sync mode, delete remote files not exists in local")
+    parser.add_argument("--dry-run", action="store_true", default=False, help="sync mode, only print what will be uploaded and deleted")
+    parser.add_argument("--remote-manifest", type=str, default=None, help="sync mode, local file used as remote manifest instead of the one in bucket")
+    parser.add_argument("--domain", type=str, default=None, help="qiniu bucket domain, e.g. https://cdn.example.com, needed by sync mode to download manifest")
     parser.add_argument("file_or_dir", type=str, help="file path or directory to upload, if directory, upload all files in it and won't upload the directory")
     args = parser.parse_args()
 
@@ -192,11 +451,20 @@ def main():
         "raw": Progress_Bar_Raw
     }
 
-    files = get_files(args.file_or_dir, args.old)
-    print("---------------------------")
-    print("{} files need to upload".format(len(files)))
-    print("---------------------------", flush=True)
-    progress_bar = progress_classes[args.progress]("uploading", max=len(files), interval=args.progress_interval)
+    if args.sync:
+        if not os.path.isdir(args.file_or_dir):
+            print("sync mode only support directory: {}".format(args.file_or_dir))
+            sys.exit(1)
+        if args.old:
+            print("sync mode compare with remote manifest, can't use with --old")
+            sys.exit(1)
+        # update local manifest, only hash files changed after last build
+        local_manifest = Manifest(args.file_or_dir)
+        local_manifest.save()
+        local_files = local_manifest.files
+        files = []
+    else:
+        files = get_files(args.file_or_dir, args.old)
     if args.cloud == "qiniu":
         try:
             import qiniu
@@ -206,12 +474,7 @@ def main():
         if (not args.bucket) or (not args.access_key) or (not args.secret_key):
             print("Please specify bucket, access_key and secret_key")
             sys.exit(1)
-        uploader = Qiniu(args.bucket, args.access_key, args.secret_key)
-
-        for abs, rel in files:
-            uploader.upload(abs, rel)
-            progress_bar.next()
-        print("")
+        uploader = Qiniu(args.bucket, args.access_key, args.secret_key, args.domain)
     elif args.cloud == "tencent":
         try:
             import qcloud_cos
@@ -222,10 +485,65 @@ def main():
             print("Please specify region bucket, secret_id and secret_key")
             sys.exit(1)
         uploader = Tencentcloud_Uploader(args.region, args.bucket, args.secret_id, args.secret_key, args.token, args.timeout)
+    elif args.cloud == "local":
+        if not args.bucket:
+            print("Please specify bucket as directory path")
+            sys.exit(1)
+        uploader = Local_Dir_Uploader(args.bucket)
 
-        for abs, rel in files:
-            uploader.upload(abs, rel)
-            progress_bar.next()
+    if args.sync:
+        try:
+            remote_files = load_remote_manifest(uploader, args.remote_manifest)
+        except Exception as e:
+            print("load remote manifest fail: {}".format(e))
+            sys.exit(1)
+        new, changed, deleted = get_sync_plan(local_files, remote_files)
+        print_sync_plan(new, changed, deleted, local_files, remote_files, args.prune)
+        if args.dry_run:
+            return
+        dir = remove_tail(args.file_or_dir)
+        files = [(os.path.join(dir, key), key) for key in new + changed]
+    print("---------------------------")
+    print("{} files need to upload".format(len(files)))
+    print("---------------------------", flush=True)
+    progress_bar = progress_classes[args.progress]("uploading", max=len(files), interval=args.progress_interval)
+    checkpoint = None
+    if not args.no_checkpoint:
+        checkpoint_path = args.checkpoint or "{}.upload-checkpoint".format(remove_tail(args.file_or_dir))
+        checkpoint = Checkpoint(checkpoint_path, "{}:{}:{}".format(args.cloud, args.region, args.bucket))
+        if checkpoint.uploaded:
+            print("resume from checkpoint {}, {} files already uploaded".format(checkpoint_path, len(checkpoint.uploaded)), flush=True)
+    try:
+        failed = upload_files(uploader, files, args.workers, args.retries, checkpoint, progress_bar.next)
+        print("")
+        if failed:
+            if checkpoint:
+                checkpoint.close()
+            for abs, rel, e in failed:
+                print("upload {} fail: {}".format(rel, e))
+            print("{} files upload fail, run again to resume".format(len(failed)))
+            sys.exit(1)
+        if args.sync:
+            # remote manifest record remote state, keep files not pruned so they can be pruned next time
+            remote_files_new = local_files.copy()
+            if deleted:
+                if args.prune:
+                    print("delete {} files".format(len(deleted)), flush=True)
+                    uploader.delete(deleted)
+                else:
+                    for key in deleted:
+                        remote_files_new[key] = remote_files[key]
+            # update manifest at last, so remote manifest never record files not uploaded
+            save_remote_manifest(uploader, remote_files_new, args.remote_manifest)
+    except KeyboardInterrupt:
+        print("")
+        print("upload interrupted, run again to resume")
+        sys.exit(1)
+    finally:
+        if hasattr(uploader, "close"):
+            uploader.close()
+    if checkpoint:
+        checkpoint.close(remove = True)
     print("upload complete")
 
 if __name__ == "__main__":
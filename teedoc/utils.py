@@ -1,9 +1,10 @@
 import re, os
 from collections import OrderedDict
 import shutil
-import requests
 import subprocess
-from datetime import datetime
+import time
+import calendar
+from datetime import datetime, timezone
 
 has_git = False
 
@@ -291,13 +292,34 @@ def get_file_path_by_url(url, doc_root, route, translate):
     return path
 
 
-def convert_file_tag_items(items, out_dir, plugin_name):
+def copy_file_if_changed(src, dst):
+    '''
+        copy file only when dst not exists or size or modify time is different,
+        modify time is kept by copy2, so copy the same file next time will be skipped
+        @return True if copied, False if dst is already up to date
+    '''
+    try:
+        st_src = os.stat(src)
+        st_dst = os.stat(dst)
+        if st_src.st_size == st_dst.st_size and st_src.st_mtime_ns == st_dst.st_mtime_ns:
+            return False
+        # dst is hardlink of cas store blob, copy to it will change all files linked
+        if st_dst.st_nlink > 1:
+            os.unlink(dst)
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copy2(src, dst)
+    return True
+
+def convert_file_tag_items(items, out_dir, plugin_name, manifest = None):
     '''
         @items list, abs path or str, or dict:{
                     "path": "/home/abc/test.js",
                     "options": ["async"]
                 }
         @out_dir copy items to `save_dir/plugin_name/`
+        @manifest Manifest object, record copied files to it
     '''
     new = []
     save_dir = os.path.join(out_dir, plugin_name)
@@ -312,7 +334,9 @@ def convert_file_tag_items(items, out_dir, plugin_name):
         if os.path.exists(path):
             name = os.path.basename(path)
             url = f'/{plugin_name}/{name}'
-            shutil.copyfile(path, os.path.join(save_dir, name))
+            copy_file_if_changed(path, os.path.join(save_dir, name))
+            if manifest:
+                manifest.add(os.path.join(save_dir, name), path, plugin_name)
             file_type = os.path.splitext(name)[1][1:]
             if file_type == "js":
                 item = f'<script src="{url}"'
@@ -332,6 +356,7 @@ def download_file(url, save_path):
         @url download url
         @save_path save file to `save_path`
     '''
+    import requests
     if not os.path.exists(save_path):
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
     with open(save_path, "wb") as f:
@@ -340,6 +365,58 @@ def download_file(url, save_path):
             raise Exception("Download file: {} failed".format(url))
         f.write(res.content)
 
+def get_source_date_epoch():
+    '''
+        timestamp of reproducible build, from env SOURCE_DATE_EPOCH, set by `teedoc build --reproducible`,
+        used instead of file modify time, see https://reproducible-builds.org/specs/source-date-epoch/
+        @return int, or None if not set
+    '''
+    epoch = os.environ.get("SOURCE_DATE_EPOCH", "").strip()
+    if not epoch:
+        return None
+    try:
+        return int(epoch)
+    except ValueError:
+        raise Exception("env SOURCE_DATE_EPOCH {} error, should be integer(seconds since 1970-01-01 UTC)".format(epoch))
+
+def date_to_timestamp(date):
+    '''
+        @date datetime.date or datetime.datetime, naive date is in local timezone,
+              or UTC in reproducible build, so result not depend on timezone of build machine
+        @return int
+    '''
+    utc = get_source_date_epoch() is not None
+    if isinstance(date, datetime):
+        if utc and date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        return int(date.timestamp())
+    return calendar.timegm(date.timetuple()) if utc else int(time.mktime(date.timetuple()))
+
+def timestamp_to_datetime(ts):
+    '''
+        @return datetime, local time, or UTC in reproducible build
+    '''
+    if get_source_date_epoch() is not None:
+        return datetime.fromtimestamp(ts, timezone.utc)
+    return datetime.fromtimestamp(ts)
+
+def get_git_commit_time(path):
+    '''
+        @return int, commit time of HEAD of git repository path in, None if not a git repository
+    '''
+    if not has_git:
+        return None
+    cmd = ["git", "log", "-1", "--format=%ct"]
+    try:
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False, cwd=path)
+        output, err = p.communicate()
+    except Exception:
+        return None
+    output = output.decode("utf-8").strip()
+    if p.returncode != 0 or not output:
+        return None
+    return int(output)
+
 def get_file_last_modify_time(file_path, git=True):
     last_edit_time = None
     if has_git and git:
@@ -353,7 +430,8 @@ def get_file_last_modify_time(file_path, git=True):
                     date_str = date_str[:-1] + "+00:00"
                 last_edit_time = datetime.fromisoformat(date_str)
     if not last_edit_time: # this time is not accurate, just for outside of git repository's file
-        last_edit_time = datetime.fromtimestamp(os.stat(file_path).st_mtime)
+        epoch = get_source_date_epoch()
+        last_edit_time = timestamp_to_datetime(os.stat(file_path).st_mtime if epoch is None else epoch)
     return last_edit_time
 
 def check_git():
@@ -0,0 +1,229 @@
+'''
+    vendor third-party assets(e.g. MathJax, mermaid on CDN), so built pages load self-hosted copies, never block on CDN.
+    `teedoc vendor` fetch assets declared by plugins(`Plugin_Base.on_vendor_assets`) and "vendor" of site_config once,
+    save them to content addressed cache `.teedoc_cache/vendor` in doc root dir:
+        blobs/<sha256>          downloaded files
+        files/<key>/            files of asset, extracted if asset is archive, key is hash of blob and extract options
+        index.json              {name: {"url": url, "sha256": sha256, "dir": "files/<key>", "files": [rel_path]}}
+    `teedoc vendor --vendor-from <dir>` import files from local dir(file name is the last part of url) instead of download.
+    build use vendored files if `teedoc vendor` executed, or still use CDN.
+    asset format:
+    {
+        "name": "mathjax",
+        "url": "https://registry.npmjs.org/mathjax/-/mathjax-3.2.2.tgz",
+        "sha256": "...",                        # optional, check downloaded or imported file
+        "extract": "package/es5",               # optional, url is archive(.tgz .tar.gz .tar .zip), use files in this dir
+        "files": ["tex-mml-chtml.js", "output/*"] # optional, globs of files to use, relative to extract dir, default all
+    }
+    assets of site_config "vendor" will override plugins' assets with the same name,
+    and copied to `/static/vendor/<name>/` of site when build, so can be used in layout or pages.
+'''
+
+import os
+import json
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import threading
+from fnmatch import fnmatchcase
+from collections import OrderedDict
+
+try:
+    from .manifest import hash_file
+except Exception:
+    from manifest import hash_file
+
+VENDOR_URL_DIR = "static/vendor"
+
+
+def get_vendor_dir(doc_src_path):
+    return os.path.join(doc_src_path, ".teedoc_cache", "vendor")
+
+def load_vendor_index(doc_src_path):
+    '''
+        @return dict, {} if not vendored
+    '''
+    path = os.path.join(get_vendor_dir(doc_src_path), "index.json")
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def get_vendor_files(doc_src_path, name):
+    '''
+        @return dict, {rel_path: abs_path} of vendored asset, None if not vendored
+    '''
+    item = load_vendor_index(doc_src_path).get(name)
+    if not item:
+        return None
+    files_dir = os.path.join(get_vendor_dir(doc_src_path), item["dir"])
+    files = OrderedDict()
+    for rel in item["files"]:
+        path = os.path.join(files_dir, rel)
+        if not os.path.exists(path):
+            return None
+        files[rel] = path
+    return files
+
+def get_assets(plugins_objs, site_config):
+    '''
+        @return OrderedDict, {name: asset}
+    '''
+    assets = OrderedDict()
+    for plugin in plugins_objs:
+        for asset in plugin.on_vendor_assets():
+            assets[asset["name"]] = asset
+    for asset in site_config.get("vendor", []):
+        if not "name" in asset or not "url" in asset:
+            raise Exception("vendor asset should have name and url: {}".format(asset))
+        assets[asset["name"]] = asset
+    return assets
+
+def _file_name(url):
+    return url.split("?")[0].split("#")[0].rstrip("/").split("/")[-1]
+
+def _get_blob(asset, vendor_dir, from_dir, log):
+    '''
+        download or import asset file to blobs dir
+        @return sha256 of file
+    '''
+    try:
+        from .utils import download_file
+    except Exception:
+        from utils import download_file
+    blobs_dir = os.path.join(vendor_dir, "blobs")
+    os.makedirs(blobs_dir, exist_ok=True)
+    tmp_path = os.path.join(blobs_dir, "tmp.{}.{}".format(os.getpid(), threading.get_ident()))
+    try:
+        if from_dir:
+            src = os.path.join(from_dir, _file_name(asset["url"]))
+            if not os.path.exists(src):
+                raise Exception("{} not found in {}".format(_file_name(asset["url"]), from_dir))
+            log.i("import {} from {}".format(asset["name"], src))
+            shutil.copyfile(src, tmp_path)
+        else:
+            log.i("download {} from {}".format(asset["name"], asset["url"]))
+            download_file(asset["url"], tmp_path)
+        sha256 = hash_file(tmp_path)
+        if asset.get("sha256") and asset["sha256"] != sha256:
+            raise Exception("sha256 of {} not match, expect {}, got {}".format(asset["url"], asset["sha256"], sha256))
+        os.replace(tmp_path, os.path.join(blobs_dir, sha256))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return sha256
+
+def _match(rel, patterns):
+    return not patterns or any(fnmatchcase(rel, p) for p in patterns)
+
+def _extract(blob_path, asset, out_dir):
+    '''
+        extract files of asset from archive blob, or copy single file blob
+        @return list, rel paths of files
+    '''
+    patterns = asset.get("files", [])
+    if not "extract" in asset:
+        name = _file_name(asset["url"])
+        shutil.copyfile(blob_path, os.path.join(out_dir, name))
+        return [name]
+    prefix = asset["extract"].strip("/")
+    prefix = prefix + "/" if prefix else ""
+    files = []
+    def add(name, read):
+        name = name.replace("\\", "/")
+        if not name.startswith(prefix) or name.endswith("/"):
+            return
+        rel = name[len(prefix):]
+        if not rel or rel.startswith("/") or ".." in rel.split("/") or not _match(rel, patterns):
+            return
+        path = os.path.join(out_dir, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(read())
+        files.append(rel)
+    if zipfile.is_zipfile(blob_path):
+        with zipfile.ZipFile(blob_path) as archive:
+            for info in archive.infolist():
+                add(info.filename, lambda: archive.read(info))
+    else:
+        with tarfile.open(blob_path) as archive:
+            for info in archive:
+                if info.isfile():
+                    add(info.name, lambda: archive.extractfile(info).read())
+    if not files:
+        raise Exception("no files of {} in {}, check extract and files config".format(asset["name"], asset["url"]))
+    # file names without wildcard must exist
+    missing = [p for p in patterns if not any(c in p for c in "*?[") and not p in files]
+    if missing:
+        raise Exception("files {} not found in {} of {}".format(missing, prefix or "/", asset["url"]))
+    return sorted(files)
+
+def vendor_assets(doc_src_path, assets, log, from_dir = None):
+    '''
+        fetch assets not vendored yet, and save index
+        @assets {name: asset}, from get_assets
+        @from_dir import files from this dir instead of download
+        @return bool
+    '''
+    vendor_dir = get_vendor_dir(doc_src_path)
+    index = load_vendor_index(doc_src_path)
+    new_index = OrderedDict()
+    for name, asset in assets.items():
+        item = index.get(name)
+        if item and item["url"] == asset["url"] and (not asset.get("sha256") or asset["sha256"] == item["sha256"]) \
+                and item.get("extract") == asset.get("extract") and item.get("patterns") == asset.get("files", []) \
+                and get_vendor_files(doc_src_path, name) is not None:
+            log.i("{} already vendored, {} files".format(name, len(item["files"])))
+            new_index[name] = item
+            continue
+        try:
+            # file of the same url or sha256 already fetched, only extract again
+            sha256 = asset.get("sha256") or (item["sha256"] if item and item["url"] == asset["url"] else None)
+            if not sha256 or not os.path.exists(os.path.join(vendor_dir, "blobs", sha256)):
+                sha256 = _get_blob(asset, vendor_dir, from_dir, log)
+            blob_path = os.path.join(vendor_dir, "blobs", sha256)
+            key = hashlib.sha256(json.dumps([sha256, asset["url"], asset.get("extract"), asset.get("files", [])]).encode("utf-8")).hexdigest()[:32]
+            files_dir = os.path.join(vendor_dir, "files", key)
+            tmp_dir = "{}.{}".format(files_dir, os.getpid())
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            files = _extract(blob_path, asset, tmp_dir)
+            shutil.rmtree(files_dir, ignore_errors=True)
+            os.replace(tmp_dir, files_dir)
+        except Exception as e:
+            log.e("vendor {} fail: {}".format(name, e))
+            return False
+        new_index[name] = {
+            "url": asset["url"],
+            "sha256": sha256,
+            "extract": asset.get("extract"),
+            "patterns": asset.get("files", []),
+            "dir": "files/{}".format(key),
+            "files": files
+        }
+        log.i("vendored {}, sha256: {}, {} files".format(name, sha256, len(files)))
+    os.makedirs(vendor_dir, exist_ok=True)
+    path = os.path.join(vendor_dir, "index.json")
+    tmp_path = "{}.{}".format(path, os.getpid())
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(new_index, f, indent=1)
+    os.replace(tmp_path, path)
+    return True
+
+def get_site_vendor_files(doc_src_path, site_config):
+    '''
+        files of site_config's vendor assets to copy to out dir
+        @return dict, {url_path: abs_path}, assets not vendored are ignored
+    '''
+    files = {}
+    for asset in site_config.get("vendor", []):
+        vendored = get_vendor_files(doc_src_path, asset.get("name"))
+        if not vendored:
+            continue
+        for rel, path in vendored.items():
+            files["{}/{}/{}".format(VENDOR_URL_DIR, asset["name"], rel)] = path
+    return files
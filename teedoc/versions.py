@@ -0,0 +1,97 @@
+'''
+    build docs of multiple versions from git refs, e.g. `teedoc build --versions v1:release-1.x,v2,main`,
+    every ref is checked out to a git worktree in `.teedoc_cache/worktrees` of doc root dir,
+    then built to `out/<version>/` one by one in one process, share parse cache, templates and plugins' assets.
+    a version selection item is added to navbar, or fill the navbar item which `"type": "version"` in config.json
+'''
+
+import os
+import re
+import subprocess
+
+
+def parse_versions_arg(versions):
+    '''
+        @versions str, e.g. "v1:release-1.x,v2,main", `name:ref` or `ref`, name is used as out dir and label
+        @return list, [(name, ref)]
+    '''
+    items = []
+    for item in versions.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, ref = item.split(":", 1) if ":" in item else (item, item)
+        name = re.sub(r"[^\w.\-]", "_", name.strip())
+        if not name or not ref.strip():
+            raise Exception('versions arg format error: "{}", should be like "v1:release-1.x,v2,main"'.format(versions))
+        items.append((name, ref.strip()))
+    if not items:
+        raise Exception("versions arg is empty")
+    names = [name for name, ref in items]
+    if len(set(names)) != len(names):
+        raise Exception("versions name duplicated: {}".format(names))
+    return items
+
+def _git(args, cwd):
+    p = subprocess.run(["git"] + args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if p.returncode != 0:
+        raise Exception("git {} fail: {}".format(" ".join(args), p.stderr.strip()))
+    return p.stdout.strip()
+
+def prepare_worktrees(doc_src_path, versions, log):
+    '''
+        checkout every ref to worktree, worktree is reused next time
+        @return list, doc root dir of every version in worktree
+    '''
+    top = _git(["rev-parse", "--show-toplevel"], doc_src_path)
+    doc_rel = os.path.relpath(os.path.abspath(doc_src_path), top)
+    worktrees_dir = os.path.join(doc_src_path, ".teedoc_cache", "worktrees")
+    dirs = []
+    for name, ref in versions:
+        path = os.path.join(worktrees_dir, name)
+        commit = _git(["rev-parse", "--verify", "{}^{{commit}}".format(ref)], top)
+        if os.path.exists(os.path.join(path, ".git")):
+            _git(["checkout", "--detach", "--force", commit], path)
+        else:
+            _git(["worktree", "prune"], top)
+            _git(["worktree", "add", "--detach", "--force", path, commit], top)
+        log.i("version {}: {} ({}) checkout to {}".format(name, ref, commit[:8], path))
+        dirs.append(os.path.normpath(os.path.join(path, doc_rel)).replace("\\", "/"))
+    return dirs
+
+def get_versions_info(versions, current, site_root_url):
+    '''
+        @site_root_url site_root_url of site_config, versions are built to `site_root_url + name + "/"`
+        @return dict, set to site_config["versions"]
+    '''
+    return {
+        "current": current,
+        "items": [{"url": "{}{}/".format(site_root_url, name), "label": name, "comment": "version"} for name, ref in versions]
+    }
+
+def update_navbar_versions(navbar, versions_info):
+    '''
+        fill navbar items which type == "version" with versions and change type to "selection",
+        if no such item, add one to right
+        @versions_info site_config["versions"], None means not versions build
+    '''
+    if not versions_info:
+        return navbar
+    found = False
+    for item in navbar["items"]:
+        if item.get("type") == "version":
+            item["type"] = "selection"
+            item["items"] = versions_info["items"]
+            if not item.get("label"):
+                item["label"] = versions_info["current"]
+            found = True
+        elif item.get("items") and item["items"][0].get("comment") == "version": # already updated
+            found = True
+    if not found:
+        navbar["items"].append({
+            "label": versions_info["current"],
+            "position": "right",
+            "type": "selection",
+            "items": versions_info["items"]
+        })
+    return navbar
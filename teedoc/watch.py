@@ -0,0 +1,218 @@
+'''
+    helpers of serve command's files watcher:
+        ignore rules:  default ignores, `.gitignore` of doc root and `watch_ignore` globs of site_config,
+                       gitignore syntax: `*`, `?`, `**`, `[]`, leading `/` anchor, trailing `/` dir only, `!` negate
+        watch dirs:    only route dirs(docs, pages, blog, assets, translate), layout dir recursively,
+                       and doc root, config template dir not recursively(site_config.json, config templates)
+        debounce:      rebuild after no new events for a quiet time, bulk changes(e.g. `git checkout`)
+                       wait longer and are rebuilt once
+'''
+
+import os
+import re
+
+DEFAULT_IGNORES = ["out/", ".teedoc_cache/", ".git/", "node_modules/", "__pycache__/", ".venv/", "venv/",
+                   "*.sw?", "*~", "*.~*", "4913"]
+# more events than this in one batch are bulk changes
+BULK_EVENTS = 100
+# quiet time of bulk changes, seconds
+BULK_QUIET = 1.0
+# rebuild anyway if events keep coming for this time, seconds
+MAX_WAIT = 10
+
+
+def _glob_to_regex(pattern):
+    i = 0
+    out = ""
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            # `a/**` match everything inside a, but not a itself
+            out += "/.+"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out += ".*"
+            i += 2
+            continue
+        if c == "*":
+            out += "[^/]*"
+        elif c == "?":
+            out += "[^/]"
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end < 0:
+                out += re.escape(c)
+            else:
+                chars = pattern[i + 1:end]
+                out += "[" + ("^" + chars[1:] if chars.startswith("!") else chars) + "]"
+                i = end
+        else:
+            out += re.escape(c)
+        i += 1
+    return out
+
+
+class Ignore_Rules:
+    def __init__(self, root, patterns = []):
+        '''
+            @root dir patterns relative to, doc root
+            @patterns gitignore style patterns, later ones have higher priority
+        '''
+        self.root = os.path.abspath(root).replace("\\", "/")
+        self.rules = []
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern):
+        pattern = pattern.rstrip("\n").rstrip()
+        if not pattern or pattern.startswith("#"):
+            return
+        negate = pattern.startswith("!")
+        if negate:
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # pattern with slash in start or middle is relative to root, or match in any dir
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        regex = _glob_to_regex(pattern)
+        if not anchored:
+            regex = "(?:.*/)?" + regex
+        self.rules.append((re.compile(regex + "$"), negate, dir_only))
+
+    def load_gitignore(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                self.add(line)
+
+    def _match(self, rel, is_dir):
+        ignored = False
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel):
+                ignored = not negate
+        return ignored
+
+    def match(self, path, is_dir = False):
+        '''
+            @path abs path
+            @return True if path or one of its parent dirs is ignored
+        '''
+        rel = os.path.relpath(os.path.abspath(path), self.root).replace("\\", "/")
+        if rel == "." or rel.startswith("../"):
+            return False
+        parts = rel.split("/")
+        for i in range(1, len(parts) + 1):
+            if self._match("/".join(parts[:i]), is_dir or i < len(parts)):
+                return True
+        return False
+
+def get_ignore_rules(doc_src_path, site_config):
+    rules = Ignore_Rules(doc_src_path, DEFAULT_IGNORES)
+    rules.load_gitignore(os.path.join(doc_src_path, ".gitignore"))
+    for pattern in site_config.get("watch_ignore", []):
+        rules.add(pattern)
+    return rules
+
+def get_watch_dirs(doc_src_path, site_config, layout_root, config_template_dir = None):
+    '''
+        @return list, [(dir, recursive)], nested dirs removed
+    '''
+    def abs_dir(value):
+        # route value is updated to [rel_dir, abs_dir] after build
+        path = value[1] if isinstance(value, (list, tuple)) else os.path.join(doc_src_path, value)
+        return os.path.abspath(path).replace("\\", "/")
+
+    dirs = []
+    for type_name in ["docs", "pages", "blog", "assets"]:
+        for url, value in site_config["route"].get(type_name, {}).items():
+            dirs.append(abs_dir(value))
+    for type_name in ["docs", "pages"]:
+        for url, items in site_config.get("translate", {}).get(type_name, {}).items():
+            for item in items:
+                dirs.append(abs_dir(item["src"]))
+    if os.path.exists(layout_root):
+        dirs.append(os.path.abspath(layout_root).replace("\\", "/"))
+    dirs = sorted(set(d for d in dirs if os.path.isdir(d)))
+    result = []
+    for d in dirs:
+        if any((d + "/").startswith(r + "/") for r, recursive in result):
+            continue
+        result.append((d, True))
+    # site_config.json and config templates
+    for d in [doc_src_path, config_template_dir]:
+        if not d:
+            continue
+        d = os.path.abspath(d).replace("\\", "/")
+        if not any((d + "/").startswith(r + "/") for r, recursive in result) and not (d, False) in result:
+            result.append((d, False))
+    return result
+
+def get_quiet_time(delay, events):
+    '''
+        rebuild after no new events for this time,
+        bulk changes wait at least BULK_QUIET, so files changed in one operation are rebuilt together
+        @delay rebuild delay of config, seconds
+        @events events count of this batch
+    '''
+    if events >= BULK_EVENTS:
+        return max(delay, BULK_QUIET)
+    return delay
+
+def is_batch_ready(delay, events, first_time, last_time, now):
+    if not events:
+        return False
+    if now - first_time >= max(delay, MAX_WAIT):
+        return True
+    return now - last_time >= get_quiet_time(delay, events)
+
+if __name__ == "__main__":
+    # (patterns, path relative to root, is_dir, ignored)
+    tests = [
+        (["*.md"],              "a.md",             False, True),
+        (["*.md"],              "docs/a.md",        False, True),
+        (["/*.md"],             "docs/a.md",        False, False),
+        (["/*.md"],             "a.md",             False, True),
+        (["docs/*.md"],         "docs/a.md",        False, True),
+        (["docs/*.md"],         "x/docs/a.md",      False, False),
+        (["build/"],            "build",            False, False),
+        (["build/"],            "build",            True,  True),
+        (["build/"],            "src/build/a.js",   False, True),
+        (["a/**"],              "a",                True,  False),
+        (["a/**"],              "a/b",              False, True),
+        (["a/**"],              "a/b/c",            False, True),
+        (["a/**", "!a/keep"],   "a/keep",           False, False),
+        (["a/**", "!a/keep"],   "a/other",          False, True),
+        (["**/tmp"],            "tmp",              True,  True),
+        (["**/tmp"],            "x/y/tmp",          True,  True),
+        (["a/**/b"],            "a/b",              False, True),
+        (["a/**/b"],            "a/x/y/b",          False, True),
+        (["*.log", "!keep.log"], "keep.log",        False, False),
+        (["*.log", "!keep.log"], "x/keep.log",      False, False),
+        (["*.log", "!keep.log"], "x/other.log",     False, True),
+        (["!keep.log", "*.log"], "keep.log",        False, True),
+        (["file?.txt"],         "file1.txt",        False, True),
+        (["file?.txt"],         "file10.txt",       False, False),
+        (["file[0-9].txt"],     "file1.txt",        False, True),
+        (["file[!0-9].txt"],    "file1.txt",        False, False),
+        (["*.sw?"],             "docs/.a.md.swp",   False, True),
+        (["# comment", ""],     "# comment",        False, False),
+    ]
+    root = os.path.abspath("doc_root")
+    failed = 0
+    for patterns, path, is_dir, ignored in tests:
+        result = Ignore_Rules(root, patterns).match(os.path.join(root, path), is_dir)
+        if result != ignored:
+            failed += 1
+            print("fail: {} {}{} expect {}, got {}".format(patterns, path, "/" if is_dir else "", ignored, result))
+    print("{} tests, {} failed".format(len(tests), failed))
+    if failed:
+        exit(1)